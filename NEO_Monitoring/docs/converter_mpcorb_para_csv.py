@@ -1,13 +1,29 @@
 from pathlib import Path
 from datetime import datetime
 import csv
+import hashlib
+import os
+import sys
 
 # ======= CONFIGURAÇÃO =======
 BASE_DIR = Path(__file__).parent
 INPUT_FILE = BASE_DIR / "MPCORB.DAT"
 OUTPUT_FILE = BASE_DIR / "mpcorb.csv"
+SNAPSHOT_DIR = BASE_DIR / "mpcorb.snapshot"   # saída binária (--snapshot)
 # =============================
 
+# O parse do MPCORB.DAT é feito pelo mesmo motor da importação para a BD
+sys.path.insert(0, str(BASE_DIR.parent / "src"))
+from services.mpcorb import processar_blocos  # noqa: E402
+from services.snapshot import EscritorSnapshot  # noqa: E402
+
+# Campos do MPCORB pela ordem das colunas do CSV (ver parse_mpc_line)
+CAMPOS_CSV = [
+    "desig", "H", "G", "epoca", "M", "peri", "node", "incl", "e", "n", "a",
+    "U", "ref", "n_obs", "n_opps", "arc", "rms", "pert_coarse", "pert_prec",
+    "computer", "hexflags", "nome", "ultima_obs",
+]
+
 
 def unpack_packed_epoch(packed: str) -> str:
     """
@@ -154,12 +170,104 @@ def parse_mpc_line(line: str):
     ]
 
 
-def main():
+def _pdes(designation: str, packed_desig: str) -> str:
+    """pdes compatível com o neo.csv (ver parse_mpc_line)."""
+    if designation.startswith("(") and ")" in designation:
+        num_str = designation[1:designation.find(")")]
+        if num_str.isdigit():
+            return num_str
+    return designation if designation else packed_desig
+
+
+def linhas_csv_bloco(bloco) -> list:
+    """
+    Igual a parse_mpc_line, mas para um bloco inteiro de services.mpcorb:
+    cada campo é extraído da coluna do bloco e as épocas (poucas distintas)
+    só são convertidas uma vez.
+    """
+    campos = {c: bloco.texto(c) for c in CAMPOS_CSV}
+
+    epocas = {}
+    for packed in set(campos["epoca"]):
+        data = unpack_packed_epoch(packed)
+        epocas[packed] = (data, date_to_jd(data))
+
+    linhas = []
+    for valores in zip(*[campos[c] for c in CAMPOS_CSV]):
+        (packed_desig, H, G, epoch_packed, M, peri, node, incl, e, n, a, U, ref,
+         n_obs, n_opps, arc, rms, pert_coarse, pert_prec, computer, hexflags,
+         designation, last_obs) = valores
+        epoch_date, epoch_jd = epocas[epoch_packed]
+        linhas.append([
+            packed_desig, H, G, epoch_packed, epoch_date, epoch_jd,
+            M, peri, node, incl, e, n, a, U, ref, n_obs, n_opps, arc, rms,
+            pert_coarse, pert_prec, computer, hexflags, designation, last_obs,
+            _pdes(designation, packed_desig),
+        ])
+    return linhas
+
+
+# Colunas do snapshot binário: numéricas (float64) e de texto (tabela de designações)
+CAMPOS_SNAPSHOT_NUMERICOS = [
+    "H", "G", "M", "peri", "node", "incl", "e", "n", "a", "rms", "n_obs", "n_opps",
+    "ultima_obs",
+]
+CAMPOS_SNAPSHOT_TEXTO = ["desig", "epoca", "nome"]
+
+
+def colunas_snapshot_bloco(bloco):
+    """
+    Colunas de um bloco para o snapshot binário: as numéricas como arrays
+    float64 (mais epoca_jd) e as de texto (mais pdes) como listas de str.
+    """
+    numericas = {c: bloco.numeros(c) for c in CAMPOS_SNAPSHOT_NUMERICOS}
+    texto = {c: bloco.texto(c) for c in CAMPOS_SNAPSHOT_TEXTO}
+
+    jds = {}
+    for packed in set(texto["epoca"]):
+        jd = date_to_jd(unpack_packed_epoch(packed))
+        jds[packed] = float(jd) if jd else float("nan")
+    numericas["epoca_jd"] = [jds[p] for p in texto["epoca"]]
+    texto["pdes"] = [_pdes(nome, desig) for nome, desig in zip(texto["nome"], texto["desig"])]
+    return numericas, texto
+
+
+def _sha256(path: Path) -> str:
+    sha = hashlib.sha256()
+    with path.open("rb") as f:
+        for parte in iter(lambda: f.read(4 * 1024 * 1024), b""):
+            sha.update(parte)
+    return sha.hexdigest()
+
+
+def gerar_snapshot(processos: int = 1):
+    """
+    Converte o MPCORB.DAT num snapshot colunar binário (services/snapshot.py)
+    em SNAPSHOT_DIR, que a importação e as análises abrem com mmap sem voltar
+    a fazer o parse do texto.
+    """
+    if not INPUT_FILE.exists():
+        raise FileNotFoundError(f"Ficheiro {INPUT_FILE} não encontrado.")
+
+    escritor = EscritorSnapshot(SNAPSHOT_DIR, INPUT_FILE.name, _sha256(INPUT_FILE))
+    for bloco in processar_blocos(INPUT_FILE, colunas_snapshot_bloco, processos=processos):
+        escritor.acrescentar(*bloco.resultado)
+    escritor.fechar()
+
+    print(f"Concluído. Linhas de dados: {escritor.linhas}")
+    print(f"Snapshot criado em: {SNAPSHOT_DIR.absolute()}")
+
+
+def main(processos: int = 1):
+    """
+    Converte o MPCORB.DAT em CSV. Com processos > 1 os blocos são convertidos
+    em paralelo (intervalos de bytes do ficheiro, ver services.mpcorb) e
+    escritos por ordem no CSV por este processo.
+    """
     if not INPUT_FILE.exists():
         raise FileNotFoundError(f"Ficheiro {INPUT_FILE} não encontrado.")
 
-    with INPUT_FILE.open("r", encoding="utf-8", errors="ignore") as fin, \
-         OUTPUT_FILE.open("w", newline="", encoding="utf-8") as fout:
+    with OUTPUT_FILE.open("w", newline="", encoding="utf-8") as fout:
 
         writer = csv.writer(fout, delimiter=';')
         # Cabeçalho do CSV
@@ -174,26 +282,24 @@ def main():
         linhas_total = 0
         linhas_dados = 0
 
-        for i, line in enumerate(fin, start=1):
-            linhas_total += 1
-
-            # Saltar cabeçalho do MPCORB (primeiras 43 linhas, pela estrutura do ficheiro)
-            if i <= 43:
-                continue
-
-            if not line.strip():
-                continue
-
-            row = parse_mpc_line(line)
-            if row is None:
-                continue
-
-            writer.writerow(row)
-            linhas_dados += 1
+        # O cabeçalho do MPCORB (até à linha de traços) é saltado pelo processar_blocos
+        for bloco in processar_blocos(INPUT_FILE, linhas_csv_bloco, processos=processos):
+            linhas = bloco.resultado
+            writer.writerows(linhas)
+            linhas_dados += len(linhas)
+            if bloco.num_linhas:
+                linhas_total = bloco.num_linhas[-1]
 
     print(f"Concluído. Linhas lidas: {linhas_total}, linhas de dados: {linhas_dados}")
     print(f"CSV criado em: {OUTPUT_FILE.absolute()}")
 
 
 if __name__ == "__main__":
-    main()
+    # Opcional: nº de processos para o parse (ex.: python converter_mpcorb_para_csv.py 16)
+    # e --snapshot para gerar o snapshot binário em vez do CSV
+    args = [a for a in sys.argv[1:] if a != "--snapshot"]
+    n_processos = int(args[0]) if args else os.cpu_count() or 1
+    if "--snapshot" in sys.argv[1:]:
+        gerar_snapshot(n_processos)
+    else:
+        main(n_processos)
@@ -35,6 +35,8 @@ GO
 PRINT 'Removendo tabelas...'
 
 -- Tabelas ESA (dependem de Asteroide)
+IF OBJECT_ID('dbo.ESA_RISCO_ESTADO', 'U') IS NOT NULL DROP TABLE dbo.ESA_RISCO_ESTADO;
+IF OBJECT_ID('dbo.ESA_RISCO_HISTORICO', 'U') IS NOT NULL DROP TABLE dbo.ESA_RISCO_HISTORICO;
 IF OBJECT_ID('dbo.ESA_RESULTADOS_PESQUISA', 'U') IS NOT NULL DROP TABLE dbo.ESA_RESULTADOS_PESQUISA;
 IF OBJECT_ID('dbo.ESA_APROXIMACOES_PROXIMAS', 'U') IS NOT NULL DROP TABLE dbo.ESA_APROXIMACOES_PROXIMAS;
 IF OBJECT_ID('dbo.ESA_OBJETOS_REMOVIDOS_RISCO', 'U') IS NOT NULL DROP TABLE dbo.ESA_OBJETOS_REMOVIDOS_RISCO;
@@ -42,6 +44,14 @@ IF OBJECT_ID('dbo.ESA_IMPACTORES_PASSADOS', 'U') IS NOT NULL DROP TABLE dbo.ESA_
 IF OBJECT_ID('dbo.ESA_LISTA_RISCO_ESPECIAL', 'U') IS NOT NULL DROP TABLE dbo.ESA_LISTA_RISCO_ESPECIAL;
 IF OBJECT_ID('dbo.ESA_LISTA_RISCO_ATUAL', 'U') IS NOT NULL DROP TABLE dbo.ESA_LISTA_RISCO_ATUAL;
 
+-- Tabelas auxiliares da importação em modo snapshot (_CARGA_<id> / _ANTIGA_<id>), se
+-- uma importação tiver sido interrompida (também dependem de Asteroide)
+DECLARE @sql NVARCHAR(MAX) = N'';
+SELECT @sql += N'DROP TABLE dbo.' + QUOTENAME(name) + N';'
+FROM sys.tables
+WHERE name LIKE 'ESA[_]%[_]CARGA[_]%' OR name LIKE 'ESA[_]%[_]ANTIGA[_]%';
+EXEC sys.sp_executesql @sql;
+
 -- Tabelas de Imagens e Observações
 IF OBJECT_ID('dbo.Imagem', 'U') IS NOT NULL DROP TABLE dbo.Imagem;
 IF OBJECT_ID('dbo.Observacao', 'U') IS NOT NULL DROP TABLE dbo.Observacao;
@@ -65,6 +75,12 @@ IF OBJECT_ID('dbo.Prioridade_Alerta', 'U') IS NOT NULL DROP TABLE dbo.Prioridade
 IF OBJECT_ID('dbo.Nivel_Alerta', 'U') IS NOT NULL DROP TABLE dbo.Nivel_Alerta;
 IF OBJECT_ID('dbo.Classe_Orbital', 'U') IS NOT NULL DROP TABLE dbo.Classe_Orbital;
 
+-- Tabelas de controlo de importações
+IF OBJECT_ID('dbo.Import_Journal', 'U') IS NOT NULL DROP TABLE dbo.Import_Journal;
+IF OBJECT_ID('dbo.Import_Rejects', 'U') IS NOT NULL DROP TABLE dbo.Import_Rejects;
+IF OBJECT_ID('dbo.Sync_Estado', 'U') IS NOT NULL DROP TABLE dbo.Sync_Estado;
+IF OBJECT_ID('dbo.Sync_Pendente', 'U') IS NOT NULL DROP TABLE dbo.Sync_Pendente;
+
 -- Tabelas Temporarias.
 IF OBJECT_ID('dbo.neo_wizard', 'U') IS NOT NULL DROP TABLE dbo.neo_wizard;
 IF OBJECT_ID('dbo.mpcorb_wizard', 'U') IS NOT NULL DROP TABLE dbo.mpcorb_wizard;  
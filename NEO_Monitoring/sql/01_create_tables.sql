@@ -11,7 +11,8 @@ GO
 
 CREATE TABLE dbo.Classe_Orbital (
     id_classe_orbital   INT IDENTITY(1,1) PRIMARY KEY,
-    codigo              VARCHAR(20)  NOT NULL,
+    codigo              VARCHAR(20)  NOT NULL
+        CONSTRAINT UQ_ClasseOrbital_Codigo UNIQUE,
     nome                VARCHAR(100) NOT NULL,
     descricao           VARCHAR(255) NULL
 );
@@ -42,6 +43,7 @@ CREATE TABLE dbo.Asteroide (
     id_csv_original   VARCHAR(50)  NULL,       -- Adicionado para rastreabilidade
     spkid             BIGINT       NULL,       -- Adicionado do CSV
     pdes              VARCHAR(20)  NOT NULL,   -- designação abreviada
+    designacao_canonica VARCHAR(40) NULL,      -- pdes normalizado (services/designacoes.py)
     nome_completo     VARCHAR(255) NOT NULL,
     flag_neo          BIT          NOT NULL,
     flag_pha          BIT          NOT NULL,
@@ -52,10 +54,19 @@ CREATE TABLE dbo.Asteroide (
     moid_ld           FLOAT        NULL,
     id_classe_orbital INT          NULL
         CONSTRAINT FK_Asteroide_ClasseOrbital
-            REFERENCES dbo.Classe_Orbital(id_classe_orbital)
+            REFERENCES dbo.Classe_Orbital(id_classe_orbital),
+    hash_conteudo     BIGINT       NULL        -- hash da última linha importada (importação incremental)
 );
 GO
 
+-- Índice para resolver designações (pdes) -> id_asteroide nas importações
+CREATE INDEX IX_Asteroide_pdes ON dbo.Asteroide(pdes) INCLUDE (id_asteroide, hash_conteudo);
+GO
+
+-- Índice para ligar as linhas ESA ao asteroide pela designação canónica
+CREATE INDEX IX_Asteroide_DesignacaoCanonica ON dbo.Asteroide(designacao_canonica) INCLUDE (id_asteroide);
+GO
+
 CREATE TABLE dbo.Solucao_Orbital (
     id_solucao_orbital   INT IDENTITY(1,1) PRIMARY KEY,
     id_asteroide         INT          NOT NULL,
@@ -78,6 +89,13 @@ CREATE TABLE dbo.Solucao_Orbital (
 );
 GO
 
+-- Solução orbital atual de cada asteroide (usado pelo upsert e pelo trigger
+-- TRG_SolucaoOrbital_UnicaAtual)
+CREATE INDEX IX_SolucaoOrbital_Atual
+    ON dbo.Solucao_Orbital(id_asteroide)
+    WHERE solucao_atual = 1;
+GO
+
 CREATE TABLE dbo.Aproximacao_Proxima (
     id_aproximacao_proxima INT IDENTITY(1,1) PRIMARY KEY,
     id_asteroide           INT          NOT NULL,
@@ -97,6 +115,13 @@ CREATE TABLE dbo.Aproximacao_Proxima (
 );
 GO
 
+-- Uma aproximação por objeto e data/hora: as sincronizações repetidas não
+-- duplicam linhas (os duplicados são ignorados em vez de darem erro)
+CREATE UNIQUE INDEX UX_AproxProx_Asteroide_Data
+    ON dbo.Aproximacao_Proxima(id_asteroide, datahora_aproximacao)
+    WITH (IGNORE_DUP_KEY = ON);
+GO
+
 ------------------------------------------------------------
 -- ALERTAS
 ------------------------------------------------------------
@@ -228,6 +253,7 @@ CREATE TABLE dbo.ESA_LISTA_RISCO_ATUAL (
     id_asteroide          INT          NULL,
     num_lista             INT          NULL,
     designacao_objeto     VARCHAR(100) NOT NULL,
+    designacao_canonica   VARCHAR(40)  NULL,
     diametro_m_texto      VARCHAR(50)  NULL,
     datahora_impacto_utc  DATETIME2(0) NULL,
     ip_max_texto          VARCHAR(50)  NULL,
@@ -244,11 +270,15 @@ CREATE TABLE dbo.ESA_LISTA_RISCO_ATUAL (
 );
 GO
 
+CREATE INDEX IX_ESA_LISTA_RISCO_ATUAL_Canonica ON dbo.ESA_LISTA_RISCO_ATUAL(designacao_canonica) INCLUDE (id_asteroide);
+GO
+
 CREATE TABLE dbo.ESA_LISTA_RISCO_ESPECIAL (
     id_risco_especial      INT IDENTITY(1,1) PRIMARY KEY,
     id_asteroide           INT          NULL,
     num_lista              INT          NULL,
     designacao_objeto      VARCHAR(100) NOT NULL,
+    designacao_canonica    VARCHAR(40)  NULL,
     diametro_m_texto       VARCHAR(50)  NULL,
     datahora_impacto_utc   DATETIME2(0) NULL,
     ip_max_texto           VARCHAR(50)  NULL,
@@ -262,11 +292,15 @@ CREATE TABLE dbo.ESA_LISTA_RISCO_ESPECIAL (
 );
 GO
 
+CREATE INDEX IX_ESA_LISTA_RISCO_ESPECIAL_Canonica ON dbo.ESA_LISTA_RISCO_ESPECIAL(designacao_canonica) INCLUDE (id_asteroide);
+GO
+
 CREATE TABLE dbo.ESA_IMPACTORES_PASSADOS (
     id_impactor            INT IDENTITY(1,1) PRIMARY KEY,
     id_asteroide           INT          NULL,
     num_lista              INT          NULL,
     designacao_objeto      VARCHAR(100) NOT NULL,
+    designacao_canonica    VARCHAR(40)  NULL,
     diametro_m_texto       VARCHAR(50)  NULL,
     datahora_impacto_utc   DATETIME2(0) NULL,
     velocidade_impacto_kms FLOAT        NULL,
@@ -280,10 +314,14 @@ CREATE TABLE dbo.ESA_IMPACTORES_PASSADOS (
 );
 GO
 
+CREATE INDEX IX_ESA_IMPACTORES_PASSADOS_Canonica ON dbo.ESA_IMPACTORES_PASSADOS(designacao_canonica) INCLUDE (id_asteroide);
+GO
+
 CREATE TABLE dbo.ESA_OBJETOS_REMOVIDOS_RISCO (
     id_remocao        INT IDENTITY(1,1) PRIMARY KEY,
     id_asteroide      INT          NULL,
     designacao_objeto VARCHAR(100) NOT NULL,
+    designacao_canonica VARCHAR(40)  NULL,
     data_remocao_utc  DATETIME2(0) NULL,
     data_vi_utc       DATETIME2(0) NULL,
     ultimo_ip         VARCHAR(50)  NULL,
@@ -294,10 +332,14 @@ CREATE TABLE dbo.ESA_OBJETOS_REMOVIDOS_RISCO (
 );
 GO
 
+CREATE INDEX IX_ESA_OBJETOS_REMOVIDOS_RISCO_Canonica ON dbo.ESA_OBJETOS_REMOVIDOS_RISCO(designacao_canonica) INCLUDE (id_asteroide);
+GO
+
 CREATE TABLE dbo.ESA_APROXIMACOES_PROXIMAS (
     id_aproximacao_esa       INT IDENTITY(1,1) PRIMARY KEY,
     id_asteroide             INT          NULL,
     designacao_objeto        VARCHAR(100) NOT NULL,
+    designacao_canonica      VARCHAR(40)  NULL,
     datahora_aproximacao_utc DATETIME2(0) NULL,
     miss_dist_km             FLOAT        NULL,
     miss_dist_au             FLOAT        NULL,
@@ -313,12 +355,126 @@ CREATE TABLE dbo.ESA_APROXIMACOES_PROXIMAS (
 );
 GO
 
+CREATE INDEX IX_ESA_APROXIMACOES_PROXIMAS_Canonica ON dbo.ESA_APROXIMACOES_PROXIMAS(designacao_canonica) INCLUDE (id_asteroide);
+GO
+
 CREATE TABLE dbo.ESA_RESULTADOS_PESQUISA (
     id_pesquisa      INT IDENTITY(1,1) PRIMARY KEY,
     id_asteroide     INT          NULL,
     designacao_objeto VARCHAR(100) NOT NULL,
+    designacao_canonica VARCHAR(40)  NULL,
     CONSTRAINT FK_ESA_Pesquisa_Asteroide
         FOREIGN KEY (id_asteroide)
         REFERENCES dbo.Asteroide(id_asteroide)
 );
 GO
+
+CREATE INDEX IX_ESA_RESULTADOS_PESQUISA_Canonica ON dbo.ESA_RESULTADOS_PESQUISA(designacao_canonica) INCLUDE (id_asteroide);
+GO
+
+-- Histórico da lista de risco (riskList.csv): só as diferenças entre versões
+-- consecutivas (services/historico_risco.py). Todas as linhas de uma
+-- importação têm a mesma datahora_release.
+CREATE TABLE dbo.ESA_RISCO_HISTORICO (
+    id_historico          INT IDENTITY(1,1) PRIMARY KEY,
+    datahora_release      DATETIME2(0) NOT NULL,
+    tipo_mudanca          VARCHAR(10)  NOT NULL,   -- 'ENTROU', 'SAIU', 'ALTEROU'
+    designacao_objeto     VARCHAR(100) NOT NULL,
+    designacao_canonica   VARCHAR(40)  NOT NULL,
+    id_asteroide          INT          NULL,
+    -- Valores na versão nova (NULL em 'SAIU')
+    datahora_impacto_utc  DATETIME2(0) NULL,
+    ip_max_texto          VARCHAR(50)  NULL,
+    ps_max                FLOAT        NULL,
+    ts                    FLOAT        NULL,
+    ip_cum_texto          VARCHAR(50)  NULL,
+    ps_cum                FLOAT        NULL,
+    -- Valores na versão anterior (NULL em 'ENTROU')
+    ip_max_anterior       VARCHAR(50)  NULL,
+    ps_max_anterior       FLOAT        NULL,
+    ip_cum_anterior       VARCHAR(50)  NULL,
+    ps_cum_anterior       FLOAT        NULL,
+    CONSTRAINT CK_ESA_RiscoHistorico_Tipo
+        CHECK (tipo_mudanca IN ('ENTROU', 'SAIU', 'ALTEROU')),
+    CONSTRAINT FK_ESA_RiscoHistorico_Asteroide
+        FOREIGN KEY (id_asteroide)
+        REFERENCES dbo.Asteroide(id_asteroide)
+);
+GO
+
+-- "O que mudou" numa release: seek pela data, sem percorrer o histórico
+CREATE INDEX IX_ESA_RISCO_HISTORICO_Release
+    ON dbo.ESA_RISCO_HISTORICO(datahora_release)
+    INCLUDE (tipo_mudanca, designacao_objeto, id_asteroide, ip_max_texto, ps_max,
+             ps_cum, ip_max_anterior, ps_max_anterior, ps_cum_anterior);
+GO
+
+-- Histórico de um objeto
+CREATE INDEX IX_ESA_RISCO_HISTORICO_Canonica
+    ON dbo.ESA_RISCO_HISTORICO(designacao_canonica, datahora_release);
+GO
+
+-- Última versão da lista de risco, uma linha por objeto (base da comparação)
+CREATE TABLE dbo.ESA_RISCO_ESTADO (
+    designacao_canonica   VARCHAR(40)  NOT NULL PRIMARY KEY,
+    designacao_objeto     VARCHAR(100) NOT NULL,
+    hash_linha            BIGINT       NOT NULL,   -- hash dos campos comparados
+    ip_max_texto          VARCHAR(50)  NULL,
+    ps_max                FLOAT        NULL,
+    ip_cum_texto          VARCHAR(50)  NULL,
+    ps_cum                FLOAT        NULL
+);
+GO
+
+------------------------------------------------------------
+-- CONTROLO DE IMPORTAÇÕES
+------------------------------------------------------------
+
+-- Um registo por lote gravado: permite retomar uma importação interrompida
+-- a partir do último byte offset gravado do mesmo ficheiro (mesmo hash).
+CREATE TABLE dbo.Import_Journal (
+    id_journal        INT IDENTITY(1,1) PRIMARY KEY,
+    tipo_ficheiro     VARCHAR(20)  NOT NULL,   -- 'neo.csv', 'MPCORB.DAT'
+    nome_ficheiro     VARCHAR(255) NOT NULL,
+    hash_ficheiro     CHAR(64)     NOT NULL,   -- impressão digital SHA-256 (tamanho, mtime, 1.º e último MB)
+    byte_offset       BIGINT       NOT NULL,   -- fim da última linha gravada
+    linhas_committed  INT          NOT NULL,   -- total acumulado de linhas gravadas
+    concluido         BIT          NOT NULL DEFAULT 0,
+    datahora          DATETIME2(0) NOT NULL DEFAULT SYSDATETIME()
+);
+GO
+
+CREATE INDEX IX_ImportJournal_Hash
+    ON dbo.Import_Journal(hash_ficheiro, tipo_ficheiro, id_journal DESC);
+GO
+
+-- Linhas rejeitadas numa importação (isoladas por bisseção do lote):
+-- o resto do lote é gravado e a linha fica aqui para ser corrigida.
+CREATE TABLE dbo.Import_Rejects (
+    id_rejeicao       INT IDENTITY(1,1) PRIMARY KEY,
+    tipo_ficheiro     VARCHAR(20)    NOT NULL,
+    nome_ficheiro     VARCHAR(255)   NOT NULL,
+    num_linha         INT            NULL,     -- NULL na importação paralela
+    erro              NVARCHAR(1000) NOT NULL,
+    conteudo          NVARCHAR(MAX)  NULL,     -- linha original (ou registo em JSON)
+    datahora          DATETIME2(0)   NOT NULL DEFAULT SYSDATETIME()
+);
+GO
+
+-- Marca de água das sincronizações incrementais (ex.: ESA -> Aproximacao_Proxima):
+-- último id da tabela de origem já processado
+CREATE TABLE dbo.Sync_Estado (
+    processo          VARCHAR(50)    NOT NULL PRIMARY KEY,
+    ultimo_id         INT            NOT NULL,
+    datahora          DATETIME2(0)   NOT NULL DEFAULT SYSDATETIME()
+);
+GO
+
+-- Linhas de origem já passadas pela marca de água mas ainda por sincronizar
+-- (ex.: aproximação ESA de um objeto que ainda não existe em Asteroide)
+CREATE TABLE dbo.Sync_Pendente (
+    processo          VARCHAR(50)    NOT NULL,
+    id_origem         INT            NOT NULL,
+    CONSTRAINT PK_Sync_Pendente PRIMARY KEY (processo, id_origem)
+);
+GO
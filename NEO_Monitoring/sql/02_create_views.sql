@@ -221,7 +221,13 @@ SELECT
     so.inclinacao_graus,
     so.moid_ua,
     so.moid_ld,
-    so.rms
+    so.rms,
+
+    -- Restantes elementos (para propagar a órbita, ver services/propagacao.py)
+    so.nodo_asc_graus,
+    so.arg_perihelio_graus,
+    so.anomalia_media_graus,
+    a.H_mag
 FROM dbo.Asteroide AS a
 LEFT JOIN dbo.Solucao_Orbital AS so
        ON so.id_asteroide  = a.id_asteroide
@@ -26,16 +26,20 @@ BEGIN
         FROM inserted
         WHERE solucao_atual = 1
     )
+    -- Só toca nas soluções ainda marcadas como atuais (índice filtrado
+    -- IX_SolucaoOrbital_Atual), em vez de percorrer todo o histórico.
     UPDATE so
     SET solucao_atual = 0
     FROM dbo.Solucao_Orbital AS so
     JOIN AstComAtual AS x
         ON x.id_asteroide = so.id_asteroide
-    WHERE so.id_solucao_orbital NOT IN (
-        SELECT id_solucao_orbital
-        FROM inserted
-        WHERE solucao_atual = 1
-    );
+    WHERE so.solucao_atual = 1
+      AND NOT EXISTS (
+            SELECT 1
+            FROM inserted AS i
+            WHERE i.id_solucao_orbital = so.id_solucao_orbital
+              AND i.solucao_atual = 1
+      );
 END;
 GO
 
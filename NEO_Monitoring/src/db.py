@@ -1,8 +1,18 @@
 # src/db.py
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
 import pyodbc
 
 DEFAULT_DRIVER = "SQL Server"
 
+# config.json da aplicação (NEO_Monitoring/config.json), secção "db"
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")
+
 class LigacaoBDFalhada(Exception):
     """Exceção levantada quando falha a ligação à BD."""
     pass
@@ -52,6 +62,174 @@ def ligar_base_dados(conn_str: str) -> pyodbc.Connection:
     except Exception as e:
         raise LigacaoBDFalhada(f"Não foi possível ligar à base de dados: {e}")
 
+class PoolLigacoes:
+    """
+    Pool de ligações à BD, partilhado pela GUI e pelas threads de fundo
+    (importações, sincronizações). Uma ligação pyodbc não pode ser usada por
+    duas threads ao mesmo tempo ("connection busy with results for another
+    hstmt"): cada thread requisita a sua com
+
+        with pool.ligacao() as conn:
+            ...
+
+    e devolve-a no fim do bloco (com rollback do que ficou por confirmar).
+    Dentro do mesmo bloco, chamadas encaixadas na mesma thread recebem a
+    mesma ligação.
+
+    - minimo / maximo: ligações mantidas abertas / abertas no máximo. Com
+      todas em uso, ligacao() espera até 'timeout' segundos por uma livre;
+    - ao requisitar, a ligação é verificada (SELECT 1) e substituída se já
+      não responder (ex.: servidor reiniciado);
+    - as ligações livres há mais de 'max_inativo' segundos são fechadas
+      (nunca abaixo do mínimo).
+    """
+
+    def __init__(self, conn_str: str, minimo: int = 1, maximo: int = 8,
+                 max_inativo: float = 300.0, timeout: float = 30.0):
+        if maximo < 1 or minimo < 0 or minimo > maximo:
+            raise ValueError("É preciso 0 <= minimo <= maximo e maximo >= 1.")
+        self.conn_str = conn_str
+        self.minimo = minimo
+        self.maximo = maximo
+        self.max_inativo = max_inativo
+        self.timeout = timeout
+        self._livres = deque()          # (ligação, instante em que foi devolvida)
+        self._abertas = 0               # livres + em uso
+        self._fechado = False
+        self._cond = threading.Condition()
+        self._local = threading.local()  # ligação e nível de encaixe da thread
+        for _ in range(minimo):
+            self._livres.append((ligar_base_dados(conn_str), time.monotonic()))
+            self._abertas += 1
+
+    def _fechar_ligacao(self, conn):
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+
+    def _remover_inativas(self) -> list:
+        """Retira as ligações livres há demasiado tempo (com o lock). Devolve-as para fechar."""
+        limite = time.monotonic() - self.max_inativo
+        removidas = []
+        # As mais antigas estão à esquerda (as devolvidas entram à direita)
+        while self._livres and self._abertas > self.minimo and self._livres[0][1] < limite:
+            removidas.append(self._livres.popleft()[0])
+            self._abertas -= 1
+        return removidas
+
+    @staticmethod
+    def _saudavel(conn) -> bool:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.fetchone()
+            cur.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def obter(self) -> pyodbc.Connection:
+        """
+        Requisita uma ligação (de preferência a usada há menos tempo).
+        Tem de ser devolvida com devolver(); prefira ligacao().
+        """
+        prazo = time.monotonic() + self.timeout
+        para_fechar = []
+        conn = erro = None
+        with self._cond:
+            while True:
+                if self._fechado:
+                    erro = LigacaoBDFalhada("O pool de ligações já foi fechado.")
+                    break
+                para_fechar += self._remover_inativas()
+                if self._livres:
+                    conn = self._livres.pop()[0]
+                    break
+                if self._abertas < self.maximo:
+                    self._abertas += 1
+                    break
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    erro = LigacaoBDFalhada(
+                        f"Sem ligações livres ao fim de {self.timeout:g}s "
+                        f"({self.maximo} em uso)."
+                    )
+                    break
+                self._cond.wait(restante)
+
+        # Fora do lock: fechar, verificar e abrir ligações demora
+        for antiga in para_fechar:
+            self._fechar_ligacao(antiga)
+        if erro is not None:
+            raise erro
+        if conn is not None and self._saudavel(conn):
+            return conn
+        if conn is not None:
+            self._fechar_ligacao(conn)
+        try:
+            return ligar_base_dados(self.conn_str)
+        except LigacaoBDFalhada:
+            with self._cond:
+                self._abertas -= 1
+                self._cond.notify()
+            raise
+
+    def devolver(self, conn: pyodbc.Connection, descartar: bool = False):
+        """Devolve uma ligação ao pool (descartar=True fecha-a)."""
+        if not descartar:
+            try:
+                conn.rollback()
+            except pyodbc.Error:
+                descartar = True
+        with self._cond:
+            if self._fechado or descartar:
+                self._abertas -= 1
+                para_fechar = [conn]
+            else:
+                self._livres.append((conn, time.monotonic()))
+                para_fechar = self._remover_inativas()
+            self._cond.notify()
+        for antiga in para_fechar:
+            self._fechar_ligacao(antiga)
+
+    @contextlib.contextmanager
+    def ligacao(self):
+        """Ligação exclusiva desta thread durante o bloco 'with'."""
+        local = self._local
+        if getattr(local, "nivel", 0):
+            local.nivel += 1
+            try:
+                yield local.conn
+            finally:
+                local.nivel -= 1
+            return
+
+        conn = self.obter()
+        local.conn, local.nivel = conn, 1
+        try:
+            yield conn
+        finally:
+            local.conn, local.nivel = None, 0
+            self.devolver(conn)
+
+    def fechar(self):
+        """Fecha as ligações livres; as que estão em uso fecham ao ser devolvidas."""
+        with self._cond:
+            self._fechado = True
+            livres = [conn for conn, _ in self._livres]
+            self._livres.clear()
+            self._abertas -= len(livres)
+            self._cond.notify_all()
+        for conn in livres:
+            self._fechar_ligacao(conn)
+
+    def resumo(self) -> str:
+        with self._cond:
+            return (f"{self._abertas} ligações abertas ({len(self._livres)} livres), "
+                    f"mínimo {self.minimo}, máximo {self.maximo}")
+
+
 def pedir_e_ligar_bd() -> pyodbc.Connection:
     """
     Pede os dados de ligação ao utilizador e tenta ligar.
@@ -91,3 +269,28 @@ def pedir_e_ligar_bd() -> pyodbc.Connection:
 
     print(f"\nA tentar ligar a {server} -> {database}...")
     return ligar_base_dados(conn_str)
+
+
+def get_connection() -> pyodbc.Connection:
+    """
+    Liga à BD com os dados guardados pela GUI em config.json (secção "db").
+    Se não houver configuração ou a ligação falhar, pede os dados ao utilizador.
+    Usada pelas ferramentas de linha de comandos (tools/, verify_db_status.py).
+    """
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE, "r") as f:
+                cfg = json.load(f).get("db", {})
+            if cfg:
+                conn_str = construir_connection_string(
+                    servidor=cfg.get("server"),
+                    base_dados=cfg.get("database"),
+                    utilizador=cfg.get("user"),
+                    password=cfg.get("password"),
+                    trusted_connection=(cfg.get("auth_mode") == "windows"),
+                    driver=DEFAULT_DRIVER
+                )
+                return ligar_base_dados(conn_str)
+        except Exception as e:
+            print(f"[AVISO] Não foi possível ligar com {CONFIG_FILE}: {e}")
+    return pedir_e_ligar_bd()
@@ -31,6 +31,7 @@ from auth import (
 from db import (
     construir_connection_string,
     ligar_base_dados,
+    PoolLigacoes,
     LigacaoBDFalhada,
     DEFAULT_DRIVER,
 )
@@ -44,8 +45,20 @@ from services.import_esa import (
     importar_search_result,
 )
 
-from services.insercao import asteroides_existem, importar_neo_csv, importar_mpcorb_dat
+from services.insercao import (
+    asteroides_existem,
+    importar_neo_csv,
+    importar_neo_csv_paralelo,
+    importar_mpcorb_dat,
+    obter_checkpoint,
+)
 from services import consultas
+from services.importacao_lote import (
+    importar_pasta,
+    A_IMPORTAR,
+    CONCLUIDO,
+)
+from services.ficheiros import PADROES_COMPRIMIDOS
 
 CONFIG_FILE = "config.json"
 
@@ -162,7 +175,9 @@ class App(tk.Tk):
 
         # Estado partilhado
         self.admin_user: str | None = None
+        # Ligação da thread da GUI (consultas); as threads de fundo usam o pool
         self.db_conn: pyodbc.Connection | None = None
+        self.db_pool: PoolLigacoes | None = None
         self.dark_mode = True 
         self.config = self.load_config()
         self.current_frame_name = "LoginFrame"
@@ -191,7 +206,8 @@ class App(tk.Tk):
         self.frames: dict[str, tk.Frame] = {}
 
         # Criar frames
-        for FrameClass in (LoginFrame, DbConfigFrame, MainMenuFrame, InsercaoESAFrame, UserConfigFrame, LoadingFrame):
+        for FrameClass in (LoginFrame, DbConfigFrame, MainMenuFrame, InsercaoESAFrame,
+                           ImportacaoPastaFrame, UserConfigFrame, LoadingFrame):
             frame = FrameClass(parent=self, controller=self)
             self.frames[FrameClass.__name__] = frame
 
@@ -298,6 +314,16 @@ class App(tk.Tk):
                 pass
         return {}
 
+    def config_importacao(self) -> tuple:
+        """
+        (processos, ligacoes) da importação paralela do neo.csv, da secção
+        "importacao" do config.json (por defeito: todos os núcleos e 4 ligações).
+        """
+        cfg = self.config.get("importacao", {})
+        processos = int(cfg.get("processos") or os.cpu_count() or 1)
+        ligacoes = int(cfg.get("ligacoes") or 4)
+        return max(1, processos), max(1, ligacoes)
+
     def save_config(self):
         try:
             with open(CONFIG_FILE, "w") as f:
@@ -411,13 +437,20 @@ class App(tk.Tk):
                 except:
                     pass
                 self.db_conn = None
+            if self.db_pool:
+                self.db_pool.fechar()
+                self.db_pool = None
 
     def set_admin_user(self, username: str):
         self.admin_user = username
         self.lbl_welcome.configure(text=f"Bem-vindo, {username}")
 
-    def set_db_connection(self, conn: pyodbc.Connection):
+    def set_db_connection(self, conn: pyodbc.Connection, conn_str: str | None = None):
         self.db_conn = conn
+        if self.db_pool:
+            self.db_pool.fechar()
+        # Cada importação em fundo requisita a sua ligação ao pool
+        self.db_pool = PoolLigacoes(conn_str) if conn_str else None
 
     def depois_de_ligar_bd(self):
         """
@@ -448,7 +481,10 @@ class App(tk.Tk):
                 caminho = filedialog.askopenfilename(
                     title="Selecione o ficheiro neo.csv",
                     initialdir=initialdir,
-                    filetypes=[("Ficheiros CSV", "*.csv"), ("Todos os ficheiros", "*.*")],
+                    filetypes=[
+                        ("Ficheiros CSV", f"*.csv {PADROES_COMPRIMIDOS}"),
+                        ("Todos os ficheiros", "*.*"),
+                    ],
                 )
 
                 if caminho:
@@ -471,7 +507,40 @@ class App(tk.Tk):
             )
             self.show_frame("MainMenuFrame")
 
-    def start_import_thread(self, csv_path):
+    def perguntar_retomar(self, caminho: str, tipo: str) -> int:
+        """
+        Se existir uma importação interrompida deste ficheiro no Import_Journal,
+        pergunta ao utilizador se a quer retomar.
+        Devolve o número de registos já gravados a retomar (0 = começar do início).
+        """
+        try:
+            checkpoint = obter_checkpoint(self.db_conn, caminho, tipo)
+        except Exception:
+            # BD sem a tabela Import_Journal (scripts antigos): importar do início
+            return 0
+        if checkpoint is None:
+            return 0
+        _, linhas = checkpoint
+        if messagebox.askyesno(
+            "Retomar importação",
+            f"Existe uma importação interrompida deste ficheiro com {linhas} "
+            "registos já gravados.\nPretende retomar a partir desse ponto?",
+        ):
+            return linhas
+        return 0
+
+    def start_import_thread(self, csv_path, func_import=importar_neo_csv,
+                            frame_destino="MainMenuFrame", **kwargs):
+        tipo = "MPCORB.DAT" if func_import is importar_mpcorb_dat else "neo.csv"
+        # A importação paralela não usa o Import_Journal: não há o que retomar
+        paralela = func_import is importar_neo_csv_paralelo
+        linhas_retomadas = 0 if paralela else self.perguntar_retomar(csv_path, tipo)
+        if func_import is importar_mpcorb_dat:
+            # Parse do MPCORB.DAT repartido por todos os núcleos
+            kwargs.setdefault("processos", os.cpu_count() or 1)
+
+        self.import_frame_destino = frame_destino
+        self.frames["LoadingFrame"].reset(retomado=linhas_retomadas)
         self.show_frame("LoadingFrame")
         self.import_queue = queue.Queue()
         
@@ -480,7 +549,16 @@ class App(tk.Tk):
                 def cb(curr, tot, el):
                     self.import_queue.put(("progress", curr, tot, el))
                 
-                count = importar_neo_csv(self.db_conn, csv_path, progress_callback=cb)
+                if paralela:
+                    # Requisita ao pool as ligações de que precisa
+                    count = func_import(self.db_pool, csv_path, progress_callback=cb, **kwargs)
+                else:
+                    # Ligação própria: a GUI continua a usar self.db_conn
+                    with self.db_pool.ligacao() as conn:
+                        count = func_import(
+                            conn, csv_path, progress_callback=cb,
+                            retomar=linhas_retomadas > 0, **kwargs
+                        )
                 self.import_queue.put(("done", count))
             except Exception as e:
                 self.import_queue.put(("error", str(e)))
@@ -498,13 +576,13 @@ class App(tk.Tk):
                         self.frames["LoadingFrame"].update_progress(curr, tot, el)
                 elif msg[0] == "done":
                     count = msg[1]
-                    messagebox.showinfo("Importação concluída", f"Foram inseridos {count} registos.")
-                    self.show_frame("MainMenuFrame")
+                    messagebox.showinfo("Importação concluída", f"Foram gravados {count} registos.")
+                    self.show_frame(self.import_frame_destino)
                     return
                 elif msg[0] == "error":
                     err = msg[1]
                     messagebox.showerror("Erro", f"Erro na importação: {err}")
-                    self.show_frame("MainMenuFrame")
+                    self.show_frame(self.import_frame_destino)
                     return
         except queue.Empty:
             pass
@@ -524,6 +602,8 @@ class App(tk.Tk):
                 self.db_conn.close()
             except Exception:
                 pass
+        if self.db_pool:
+            self.db_pool.fechar()
         self.destroy()
 
     def _fill_tree(self, tree: ttk.Treeview, cols, rows):
@@ -564,6 +644,24 @@ class LoadingFrame(ttk.Frame):
         self.lbl_time = ttk.Label(self, text="Decorrido: 00:00 | Estimado: --:--", font=("Segoe UI", 9))
         self.lbl_time.pack(pady=5)
 
+        self.lbl_resume = ttk.Label(self, text="", font=("Segoe UI", 9, "italic"))
+        self.lbl_resume.pack(pady=5)
+
+        # Registos já gravados numa sessão anterior (importação retomada)
+        self.retomado = 0
+
+    def reset(self, retomado: int = 0):
+        self.retomado = retomado
+        self.progress['value'] = 0
+        self.lbl_status.configure(text="A iniciar...")
+        self.lbl_time.configure(text="Decorrido: 00:00 | Estimado: --:--")
+        if retomado:
+            self.lbl_resume.configure(
+                text=f"Importação retomada: {retomado} registos já gravados anteriormente."
+            )
+        else:
+            self.lbl_resume.configure(text="")
+
     def update_progress(self, current, total, elapsed):
         percent = (current / total) * 100
         self.progress['value'] = percent
@@ -572,9 +670,10 @@ class LoadingFrame(ttk.Frame):
         el_min = int(elapsed // 60)
         el_sec = int(elapsed % 60)
         
-        # Estimar ETA
-        if current > 0:
-            rate = current / elapsed
+        # Estimar ETA (só com o ritmo desta sessão, sem as linhas retomadas)
+        feitos_sessao = current - self.retomado
+        if feitos_sessao > 0 and elapsed > 0:
+            rate = feitos_sessao / elapsed
             remaining = total - current
             eta_seconds = remaining / rate
             eta_min = int(eta_seconds // 60)
@@ -842,7 +941,7 @@ class DbConfigFrame(ttk.Frame):
 
         # Sucesso
         # Sucesso
-        self.controller.set_db_connection(conn)
+        self.controller.set_db_connection(conn, conn_str)
         
         # Guardar config
         db_config = {
@@ -1202,6 +1301,7 @@ class MainMenuFrame(ttk.Frame):
             "NEOs": consultas.fetch_asteroides_neo,
             "PHAs": consultas.fetch_asteroides_pha,
             "NEOs e PHAs": consultas.fetch_asteroides_neo_e_pha,
+            "Lista de risco: o que mudou": consultas.fetch_mudancas_lista_risco,
         }
 
         topo = ttk.Frame(frame)
@@ -1302,7 +1402,9 @@ class InsercaoESAFrame(ttk.Frame):
             "  • searchResult.csv\n\n"
             "Também pode importar o ficheiro principal:\n"
             "  • neo.csv\n\n"
-            "Cada botão abaixo deixa escolher o ficheiro e importa os dados para a BD."
+            "Cada botão abaixo deixa escolher o ficheiro e importa os dados para a BD.\n"
+            "'Importar pasta completa' reconhece todos os ficheiros de uma pasta\n"
+            "(ex.: docs/) e importa-os em simultâneo."
         )
 
         ttk.Label(self, text=texto, justify="left", wraplength=600)\
@@ -1367,6 +1469,13 @@ class InsercaoESAFrame(ttk.Frame):
             command=self.importar_mpcorb,
         ).grid(row=7, column=0, padx=5, pady=3)
 
+        ttk.Button(
+            btn_frame,
+            text="Importar pasta completa...",
+            width=30,
+            command=self.importar_pasta,
+        ).grid(row=8, column=0, padx=5, pady=(10, 3))
+
         ttk.Button(
             self,
             text="Voltar",
@@ -1382,7 +1491,11 @@ class InsercaoESAFrame(ttk.Frame):
             initialdir = os.getcwd()
 
         if filetypes is None:
-            filetypes = [("Ficheiros CSV", "*.csv"), ("Todos os ficheiros", "*.*")]
+            filetypes = [
+                ("Ficheiros CSV", f"*.csv {PADROES_COMPRIMIDOS}"),
+                ("Ficheiros comprimidos", PADROES_COMPRIMIDOS),
+                ("Todos os ficheiros", "*.*"),
+            ]
 
         caminho = filedialog.askopenfilename(
             title=titulo_janela,
@@ -1411,8 +1524,15 @@ class InsercaoESAFrame(ttk.Frame):
         if not caminho:
             return
 
+        # As listas da ESA são o estado atual: por defeito substituem o conteúdo
+        substituir = messagebox.askyesno(
+            "Modo de importação",
+            "Substituir o conteúdo atual da tabela pelo do ficheiro?\n"
+            "(Não = acrescentar às linhas que já existem)",
+        )
+
         try:
-            inseridos = func_import(conn, caminho)
+            inseridos = func_import(conn, caminho, substituir=substituir)
         except Exception as exc:
             messagebox.showerror(
                 "Erro na importação",
@@ -1436,18 +1556,36 @@ class InsercaoESAFrame(ttk.Frame):
         if not caminho:
             return
 
-        try:
-            inseridos = importar_neo_csv(conn, caminho)
-        except Exception as exc:
-            messagebox.showerror(
-                "Erro na importação",
-                f"Ocorreu um erro ao importar o ficheiro neo.csv:\n{exc}",
+        # Se já houver asteroides, reimportar por defeito atualiza em vez de duplicar
+        upsert = asteroides_existem(conn) and messagebox.askyesno(
+            "Reimportar neo.csv",
+            "Já existem asteroides na base de dados.\n"
+            "Pretende atualizar os existentes (upsert) em vez de os duplicar?",
+        )
+        # Numa atualização, só as linhas novas ou alteradas vão à BD
+        incremental = upsert and messagebox.askyesno(
+            "Importação incremental",
+            "Enviar apenas as linhas novas ou alteradas desde a última importação?\n"
+            "(muito mais rápido quando o ficheiro mudou pouco)",
+        )
+
+        # Sem incremental, o ficheiro pode ser lido e gravado em paralelo
+        # (processos e ligações na secção "importacao" do config.json)
+        processos, ligacoes = self.controller.config_importacao()
+        if not incremental and messagebox.askyesno(
+            "Importação paralela",
+            f"Importar em paralelo ({processos} processos, {ligacoes} ligações à BD)?\n"
+            "(mais rápido em ficheiros grandes, mas não pode ser retomada se for interrompida)",
+        ):
+            self.controller.start_import_thread(
+                caminho, importar_neo_csv_paralelo, frame_destino="InsercaoESAFrame",
+                upsert=upsert, processos=processos, ligacoes=ligacoes
             )
             return
 
-        messagebox.showinfo(
-            "Importação concluída",
-            f"Foram inseridos {inseridos} registos a partir de:\n{caminho}",
+        self.controller.start_import_thread(
+            caminho, importar_neo_csv, frame_destino="InsercaoESAFrame",
+            upsert=upsert, incremental=incremental
         )
 
     def importar_risk(self):
@@ -1476,24 +1614,163 @@ class InsercaoESAFrame(ttk.Frame):
         caminho = self._escolher_ficheiro(
             "Selecionar MPCORB.DAT", 
             "MPCORB.DAT",
-            filetypes=[("Ficheiros MPCORB", "*.DAT"), ("Todos os ficheiros", "*.*")]
+            filetypes=[
+                ("Ficheiros MPCORB", f"*.DAT {PADROES_COMPRIMIDOS}"),
+                ("Ficheiros comprimidos", PADROES_COMPRIMIDOS),
+                ("Todos os ficheiros", "*.*"),
+            ]
         )
         if not caminho:
             return
 
-        try:
-            inseridos = importar_mpcorb_dat(conn, caminho)
-        except Exception as exc:
+        self.controller.start_import_thread(
+            caminho, importar_mpcorb_dat, frame_destino="InsercaoESAFrame"
+        )
+
+    def importar_pasta(self):
+        if self._obter_conn() is None:
+            return
+        if self.controller.db_pool is None:
             messagebox.showerror(
-                "Erro na importação",
-                f"Ocorreu um erro ao importar o ficheiro MPCORB.DAT:\n{exc}",
+                "Base de dados",
+                "A importação da pasta abre várias ligações: volte a ligar à base "
+                "de dados em 'Configuração da BD'.",
             )
             return
 
-        messagebox.showinfo(
-            "Importação concluída",
-            f"Foram processados {inseridos} registos a partir de:\n{caminho}",
+        initialdir = os.path.join(os.getcwd(), "docs")
+        if not os.path.isdir(initialdir):
+            initialdir = os.getcwd()
+        pasta = filedialog.askdirectory(
+            title="Selecionar a pasta com os ficheiros a importar",
+            initialdir=initialdir,
         )
+        if not pasta:
+            return
+
+        substituir = messagebox.askyesno(
+            "Modo de importação",
+            "Substituir o conteúdo atual das tabelas da ESA pelo dos ficheiros?\n"
+            "(Não = acrescentar às linhas que já existem)",
+        )
+        frame = self.controller.frames["ImportacaoPastaFrame"]
+        self.controller.show_frame("ImportacaoPastaFrame")
+        frame.iniciar(pasta, substituir)
+
+
+class ImportacaoPastaFrame(ttk.Frame):
+    """
+    Progresso da importação de uma pasta inteira (services/importacao_lote.py):
+    uma linha por ficheiro e por passo final, atualizada pela thread da importação.
+    """
+
+    COLUNAS = ("Ficheiro", "Tipo", "Estado", "Registos", "Tempo")
+
+    def __init__(self, parent, controller: "App"):
+        super().__init__(parent)
+        self.controller = controller
+        self.configure(padding=20)
+
+        ttk.Label(
+            self,
+            text="Importar pasta completa",
+            font=("Segoe UI", 16, "bold"),
+        ).pack(pady=(0, 10))
+
+        self.lbl_pasta = ttk.Label(self, text="", font=("Segoe UI", 9, "italic"))
+        self.lbl_pasta.pack(pady=(0, 10))
+
+        self.tree = ttk.Treeview(self, columns=self.COLUNAS, show="headings", height=10)
+        for c, largura in zip(self.COLUNAS, (220, 160, 120, 100, 80)):
+            self.tree.heading(c, text=c)
+            self.tree.column(c, anchor="center", width=largura)
+        self.tree.pack(fill="both", expand=True)
+
+        self.lbl_total = ttk.Label(self, text="", font=("Segoe UI", 10))
+        self.lbl_total.pack(pady=10)
+
+        self.btn_voltar = ttk.Button(
+            self,
+            text="Voltar",
+            command=lambda: self.controller.show_frame("InsercaoESAFrame"),
+        )
+        self.btn_voltar.pack(pady=5)
+
+        self.fila = queue.Queue()
+        self.linhas = {}
+
+    def iniciar(self, pasta: str, substituir: bool):
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        self.linhas = {}
+        self.lbl_pasta.configure(text=pasta)
+        self.lbl_total.configure(text="A reconhecer os ficheiros...")
+        self.btn_voltar.state(["disabled"])
+        self.inicio = time.time()
+
+        def cb(nome, tipo, estado, atual, total, decorrido):
+            self.fila.put(("progress", nome, tipo, estado, atual, total, decorrido))
+
+        def run_import():
+            try:
+                resultado = importar_pasta(
+                    self.controller.db_pool, pasta, progress_callback=cb,
+                    substituir=substituir,
+                )
+                self.fila.put(("done", resultado))
+            except Exception as e:
+                self.fila.put(("error", str(e)))
+
+        threading.Thread(target=run_import, daemon=True).start()
+        self.verificar_fila()
+
+    def verificar_fila(self):
+        try:
+            while True:
+                msg = self.fila.get_nowait()
+                if msg[0] == "progress":
+                    self.atualizar_linha(*msg[1:])
+                elif msg[0] == "done":
+                    resultado = msg[1]
+                    erros = [n for n, info in resultado.items() if info["estado"] != CONCLUIDO]
+                    self.lbl_total.configure(
+                        text=f"Concluído em {time.time() - self.inicio:.1f}s"
+                             + (f" ({len(erros)} com erro ou cancelados)" if erros else "")
+                    )
+                    self.btn_voltar.state(["!disabled"])
+                    if erros:
+                        detalhes = "\n".join(
+                            f"{n}: {resultado[n]['erro'] or resultado[n]['estado']}" for n in erros
+                        )
+                        messagebox.showwarning("Importação da pasta", detalhes)
+                    return
+                elif msg[0] == "error":
+                    self.lbl_total.configure(text="Erro na importação")
+                    self.btn_voltar.state(["!disabled"])
+                    messagebox.showerror("Erro", f"Erro na importação: {msg[1]}")
+                    return
+        except queue.Empty:
+            pass
+
+        self.lbl_total.configure(text=f"Decorrido: {time.time() - self.inicio:.0f}s")
+        self.after(100, self.verificar_fila)
+
+    def atualizar_linha(self, nome, tipo, estado, atual, total, decorrido):
+        if estado == A_IMPORTAR and total:
+            texto_estado = f"{estado} ({atual / total * 100:.0f}%)"
+        else:
+            texto_estado = estado
+        valores = (
+            nome,
+            tipo,
+            texto_estado,
+            atual if estado in (A_IMPORTAR, CONCLUIDO) and atual else "",
+            f"{decorrido:.1f}s" if decorrido else "",
+        )
+        if nome in self.linhas:
+            self.tree.item(self.linhas[nome], values=valores)
+        else:
+            self.linhas[nome] = self.tree.insert("", "end", values=valores)
 
 
 class UserConfigFrame(ttk.Frame):
@@ -0,0 +1,337 @@
+"""
+Rastreio local de aproximações à Terra (Aproximacao_Proxima).
+
+Em vez de depender só da lista da ESA (upcomingClApp.csv), o rastreio
+propaga as órbitas atuais de todos os NEO (services/propagacao.py) contra
+uma efeméride analítica da Terra, numa janela configurável:
+
+  1. poda pela MOID: um objeto cuja órbita nunca passa a menos de
+     'limiar_ua' da órbita da Terra não pode ter uma aproximação abaixo
+     do limiar (services/moid.py);
+  2. passos grosseiros ('passo_dias'): em cada passo a distância d e a
+     velocidade relativa v dão um limite inferior barato para a distância
+     mínima no intervalo à volta (d - v * passo); só os pares (objeto,
+     passo) com esse limite abaixo do limiar seguem;
+  3. refinamento: Newton sobre d(r.v)/dt = 0 dá a hora e a distância
+     mínimas de cada candidato.
+
+As aproximações abaixo do limiar são gravadas em lote em
+Aproximacao_Proxima (origem 'NEO_SCREENING'), com flag_critica para as
+que ficam a 10 LD ou menos, tal como na sincronização da ESA. Cada corrida
+substitui as previsões anteriores na mesma janela: as passagens que se
+mantêm são atualizadas e as que deixaram de existir são removidas.
+"""
+
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from services import colunar
+from services.moid import calcular_moid
+from services.orbitas import JD_J2000, K_GAUSS, LD_UA, UA_KM
+from services.propagacao import ElementosOrbitais, Propagador, estado_terra
+
+ORIGEM = "NEO_SCREENING"
+LIMITE_CRITICO_LD = 10.0
+
+# Aproximações do mesmo objeto a menos disto (dias) são a mesma passagem
+_SEPARACAO_DIAS = 2.0
+
+
+def jd_para_datetime(jd: float) -> datetime:
+    """JD -> datetime (UTC aproximado, ao segundo)."""
+    return datetime(2000, 1, 1, 12) + timedelta(seconds=round((jd - JD_J2000) * 86400))
+
+
+def datetime_para_jd(dt: datetime) -> float:
+    return JD_J2000 + (dt - datetime(2000, 1, 1, 12)).total_seconds() / 86400
+
+
+def _refinar(prop: Propagador, indices, t0, passo: float, iteracoes: int = 8):
+    """
+    Newton sobre g(t) = dr . dv (derivada de |dr|²/2) para cada par
+    (objeto, época inicial), dentro de [t0 - passo, t0 + passo].
+    Devolve (jd, distância UA, velocidade UA/dia, convergiu); convergiu é
+    False quando o mínimo não está dentro do intervalo (ficou no limite).
+    """
+    np = colunar._np()
+    t = np.asarray(t0, dtype=np.float64).copy()
+    k2 = K_GAUSS * K_GAUSS
+    for _ in range(iteracoes):
+        r, v = prop.estados(indices, t)
+        rt, vt = estado_terra(t)
+        dr, dv = r - rt, v - vt
+        # Aceleração relativa (dois corpos, Sol) para g'(t)
+        da = (-k2 * r / (np.linalg.norm(r, axis=1) ** 3)[:, None]
+              + k2 * rt / (np.linalg.norm(rt, axis=1) ** 3)[:, None])
+        g = (dr * dv).sum(axis=1)
+        g1 = (dv * dv).sum(axis=1) + (dr * da).sum(axis=1)
+        passo_t = np.where(g1 > 0, -g / np.where(g1 > 0, g1, 1.0), 0.0)
+        t = np.clip(t + np.clip(passo_t, -passo, passo), t0 - passo, t0 + passo)
+    r, v = prop.estados(indices, t)
+    rt, vt = estado_terra(t)
+    convergiu = np.abs(t - t0) < passo * (1 - 1e-9)
+    return t, np.linalg.norm(r - rt, axis=1), np.linalg.norm(v - vt, axis=1), convergiu
+
+
+def rastrear(elementos: ElementosOrbitais, jd_inicio: float, jd_fim: float,
+             limiar_ua: float = 0.05, passo_dias: float = 1.0,
+             epocas_por_grupo: int = 64) -> list:
+    """
+    Aproximações à Terra a menos de 'limiar_ua' entre jd_inicio e jd_fim.
+    Devolve uma lista de dicts (índice do objeto, jd, distância, velocidade),
+    uma por passagem, ordenada por data.
+    """
+    np = colunar._np()
+
+    # 1) Poda pela MOID (com uma margem para o erro da efeméride da Terra)
+    moid = calcular_moid(elementos.a, elementos.e, elementos.incl, elementos.node, elementos.peri)
+    candidatos = np.flatnonzero(moid <= limiar_ua + 0.001)
+    print(f"Rastreio: {len(candidatos)} de {len(elementos)} órbitas com MOID <= {limiar_ua} UA.")
+    if len(candidatos) == 0:
+        return []
+    sub = elementos.subconjunto(candidatos)
+    prop = Propagador(sub, cache_epocas=0)
+
+    # 2) Passos grosseiros, por grupos de épocas
+    epocas = np.arange(jd_inicio, jd_fim + passo_dias, passo_dias)
+    pares_i, pares_t = [], []
+    for ini in range(0, len(epocas), epocas_por_grupo):
+        jds = epocas[ini:ini + epocas_por_grupo]
+        r, v = prop.posicoes_varias(jds)
+        rt, vt = estado_terra(jds)
+        d = np.linalg.norm(r - rt[:, None, :], axis=2)
+        vrel = np.linalg.norm(v - vt[:, None, :], axis=2)
+        # Limite inferior da distância no intervalo [t - passo, t + passo]
+        e_t, e_i = np.nonzero(d - vrel * passo_dias <= limiar_ua)
+        pares_i.append(e_i)
+        pares_t.append(jds[e_t])
+    pares_i = np.concatenate(pares_i)
+    pares_t = np.concatenate(pares_t)
+    print(f"Rastreio: {len(epocas)} épocas, {len(pares_i)} pares (objeto, época) a refinar.")
+    if len(pares_i) == 0:
+        return []
+
+    # 3) Refinamento e uma aproximação por passagem (a mais próxima)
+    t_min, d_min, v_min, convergiu = _refinar(prop, pares_i, pares_t, passo_dias)
+    # Só contam mínimos verdadeiros (não os pontos presos no limite do intervalo)
+    dentro = convergiu & (d_min <= limiar_ua) & (t_min >= jd_inicio) & (t_min <= jd_fim)
+    ordem = np.lexsort((d_min, t_min, pares_i))
+    resultado = []
+    ultimo = {}
+    for k in ordem[dentro[ordem]].tolist():
+        i = int(pares_i[k])
+        anterior = ultimo.get(i)
+        if anterior is not None and t_min[k] - anterior["jd"] < _SEPARACAO_DIAS:
+            if d_min[k] < anterior["distancia_ua"]:
+                anterior.update(jd=float(t_min[k]), distancia_ua=float(d_min[k]),
+                                velocidade=float(v_min[k]))
+            continue
+        ultimo[i] = {
+            "indice": int(candidatos[i]),
+            "jd": float(t_min[k]),
+            "distancia_ua": float(d_min[k]),
+            "velocidade": float(v_min[k]),
+        }
+        resultado.append(ultimo[i])
+    resultado.sort(key=lambda x: x["jd"])
+    return resultado
+
+
+# Grava as previsões de um grupo de asteroides rastreados, numa transação:
+#  - uma previsão nova a menos de 1 dia de uma já gravada (mesmo objeto) é a
+#    mesma passagem: a linha existente é atualizada (mantém o id, por isso o
+#    trigger de alertas não cria um segundo alerta para ela);
+#  - as restantes previsões novas são inseridas;
+#  - as previsões NEO_SCREENING destes asteroides dentro da janela que esta
+#    corrida já não encontra (a órbita mudou) são apagadas, e os alertas que
+#    apontavam para elas ficam inativos.
+# Os asteroides do grupo vão em @ids (também os que já não têm aproximações).
+_SQL_GRAVAR_APROXIMACOES = """
+    SET NOCOUNT ON;
+    DECLARE @ids NVARCHAR(MAX) = ?;
+    DECLARE @lote NVARCHAR(MAX) = ?;
+    DECLARE @origem VARCHAR(50) = ?;
+    DECLARE @inicio DATETIME2(0) = ?;
+    DECLARE @fim DATETIME2(0) = ?;
+
+    SELECT CAST(value AS INT) AS id_asteroide
+    INTO #ids
+    FROM OPENJSON(@ids);
+
+    SELECT *
+    INTO #novas
+    FROM OPENJSON(@lote) WITH (
+        idx                  INT          '$[0]',
+        id_asteroide         INT          '$[1]',
+        id_solucao_orbital   INT          '$[2]',
+        datahora_aproximacao DATETIME2(0) '$[3]',
+        distancia_ua         FLOAT        '$[4]',
+        distancia_ld         FLOAT        '$[5]',
+        velocidade_rel_kms   FLOAT        '$[6]',
+        flag_critica         BIT          '$[7]'
+    );
+
+    -- Previsões já gravadas destes asteroides dentro da janela
+    SELECT ap.id_aproximacao_proxima, ap.id_asteroide, ap.datahora_aproximacao
+    INTO #atuais
+    FROM dbo.Aproximacao_Proxima AS ap
+    JOIN #ids AS i ON i.id_asteroide = ap.id_asteroide
+    WHERE ap.origem = @origem
+      AND ap.datahora_aproximacao BETWEEN @inicio AND @fim;
+
+    -- Cada previsão nova fica com a gravada mais próxima a menos de 1 dia
+    -- (as passagens novas estão a 2 dias ou mais umas das outras)
+    SELECT idx, id_aproximacao_proxima
+    INTO #pares
+    FROM (
+        SELECT n.idx, a.id_aproximacao_proxima,
+               ROW_NUMBER() OVER (
+                   PARTITION BY n.idx
+                   ORDER BY ABS(DATEDIFF(SECOND, a.datahora_aproximacao, n.datahora_aproximacao))
+               ) AS ordem
+        FROM #novas AS n
+        JOIN #atuais AS a
+             ON a.id_asteroide = n.id_asteroide
+            AND ABS(DATEDIFF(SECOND, a.datahora_aproximacao, n.datahora_aproximacao)) < 86400
+    ) AS c
+    WHERE c.ordem = 1;
+
+    UPDATE ap
+    SET id_solucao_orbital   = n.id_solucao_orbital,
+        datahora_aproximacao = n.datahora_aproximacao,
+        distancia_ua         = n.distancia_ua,
+        distancia_ld         = n.distancia_ld,
+        velocidade_rel_kms   = n.velocidade_rel_kms,
+        flag_critica         = n.flag_critica
+    FROM dbo.Aproximacao_Proxima AS ap
+    JOIN #pares AS p ON p.id_aproximacao_proxima = ap.id_aproximacao_proxima
+    JOIN #novas AS n ON n.idx = p.idx
+    WHERE EXISTS (
+        SELECT ap.id_solucao_orbital, ap.datahora_aproximacao, ap.distancia_ua,
+               ap.distancia_ld, ap.velocidade_rel_kms, ap.flag_critica
+        EXCEPT
+        SELECT n.id_solucao_orbital, n.datahora_aproximacao, n.distancia_ua,
+               n.distancia_ld, n.velocidade_rel_kms, n.flag_critica
+    );
+    DECLARE @atualizadas INT = @@ROWCOUNT;
+
+    -- Previsões que deixaram de existir
+    SELECT a.id_aproximacao_proxima
+    INTO #obsoletas
+    FROM #atuais AS a
+    WHERE NOT EXISTS (SELECT 1 FROM #pares AS p WHERE p.id_aproximacao_proxima = a.id_aproximacao_proxima);
+
+    UPDATE al
+    SET ativo = 0,
+        id_aproximacao_proxima = NULL
+    FROM dbo.Alerta AS al
+    JOIN #obsoletas AS o ON o.id_aproximacao_proxima = al.id_aproximacao_proxima;
+
+    DELETE ap
+    FROM dbo.Aproximacao_Proxima AS ap
+    JOIN #obsoletas AS o ON o.id_aproximacao_proxima = ap.id_aproximacao_proxima;
+    DECLARE @removidas INT = @@ROWCOUNT;
+
+    INSERT INTO dbo.Aproximacao_Proxima (
+        id_asteroide,
+        id_solucao_orbital,
+        datahora_aproximacao,
+        distancia_ua,
+        distancia_ld,
+        velocidade_rel_kms,
+        flag_critica,
+        origem
+    )
+    SELECT
+        n.id_asteroide,
+        n.id_solucao_orbital,
+        n.datahora_aproximacao,
+        n.distancia_ua,
+        n.distancia_ld,
+        n.velocidade_rel_kms,
+        n.flag_critica,
+        @origem
+    FROM #novas AS n
+    WHERE NOT EXISTS (SELECT 1 FROM #pares AS p WHERE p.idx = n.idx);
+    DECLARE @inseridas INT = @@ROWCOUNT;
+
+    SELECT @inseridas, @atualizadas, @removidas;
+
+    DROP TABLE #obsoletas;
+    DROP TABLE #pares;
+    DROP TABLE #atuais;
+    DROP TABLE #novas;
+    DROP TABLE #ids;
+"""
+
+
+def rastrear_aproximacoes(conn, anos: float = 5.0, inicio: datetime | None = None,
+                          limiar_ua: float = 0.05, passo_dias: float = 1.0,
+                          tamanho_lote: int = 5000) -> int:
+    """
+    Corre o rastreio sobre todos os NEO, de 'inicio' (defeito: agora) até
+    'anos' depois, e grava as aproximações em Aproximacao_Proxima.
+
+    As previsões NEO_SCREENING na janela são substituídas pelas desta corrida
+    (ver _SQL_GRAVAR_APROXIMACOES), por grupos de 'tamanho_lote' asteroides,
+    cada grupo numa transação. Devolve o número de aproximações novas gravadas.
+    """
+    t0 = time.time()
+    inicio = inicio or datetime.now(timezone.utc).replace(tzinfo=None)
+    jd_inicio = datetime_para_jd(inicio)
+    jd_fim = jd_inicio + anos * 365.25
+
+    elementos = ElementosOrbitais.carregar(conn, apenas_neo=True)
+    print(f"Rastreio: {len(elementos)} NEO carregados "
+          f"({elementos.ignorados} sem órbita elíptica completa).")
+
+    aproximacoes = rastrear(elementos, jd_inicio, jd_fim, limiar_ua, passo_dias)
+
+    # Previsões agrupadas por asteroide; [idx, id_asteroide, ...] por linha
+    por_asteroide = {}
+    for idx, ap in enumerate(aproximacoes):
+        i = ap["indice"]
+        distancia_ld = ap["distancia_ua"] / LD_UA
+        por_asteroide.setdefault(int(elementos.id_asteroide[i]), []).append([
+            idx,
+            int(elementos.id_asteroide[i]),
+            int(elementos.id_solucao_orbital[i]),
+            jd_para_datetime(ap["jd"]).isoformat(),
+            ap["distancia_ua"],
+            distancia_ld,
+            ap["velocidade"] * UA_KM / 86400,
+            1 if distancia_ld <= LIMITE_CRITICO_LD else 0,
+        ])
+
+    # Todos os asteroides rastreados, também os que já não têm aproximações
+    ids = sorted(set(elementos.id_asteroide.tolist()))
+    janela = (jd_para_datetime(jd_inicio), jd_para_datetime(jd_fim))
+    cur = conn.cursor()
+    gravadas = atualizadas = removidas = 0
+    try:
+        for ini in range(0, len(ids), tamanho_lote):
+            grupo = ids[ini:ini + tamanho_lote]
+            lote = [linha for id_asteroide in grupo for linha in por_asteroide.get(id_asteroide, [])]
+            cur.execute(
+                _SQL_GRAVAR_APROXIMACOES,
+                json.dumps(grupo, separators=(",", ":")),
+                json.dumps(lote, separators=(",", ":"), allow_nan=False),
+                ORIGEM, *janela,
+            )
+            novas, alteradas, apagadas = cur.fetchone()
+            conn.commit()
+            gravadas += novas
+            atualizadas += alteradas
+            removidas += apagadas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    criticas = sum(l[7] for linhas in por_asteroide.values() for l in linhas)
+    print(f"Rastreio concluído em {time.time() - t0:.1f}s: {len(aproximacoes)} aproximações "
+          f"< {limiar_ua} UA ({criticas} críticas); {gravadas} novas, "
+          f"{atualizadas} atualizadas, {removidas} previsões antigas removidas.")
+    return gravadas
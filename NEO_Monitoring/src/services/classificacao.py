@@ -0,0 +1,191 @@
+"""
+Classificação orbital dos asteroides a partir dos elementos (a, e).
+
+O neo.csv traz a classe do JPL (coluna 'class'), mas o MPCORB.DAT não: sem
+classificação, todos os objetos só do MPCORB ficavam na classe 'UNK'. Aqui
+aplicam-se as mesmas regras do JPL (SBDB), em função de q = a(1-e),
+Q = a(1+e), a e e, para que os códigos sejam os mesmos do neo.csv
+(ATE, APO, AMO, IEO, MCA, IMB, MBA, OMB, TJN, CEN, TNO, PAA, HYA, AST).
+
+Com NumPy a classificação é feita em bloco (arrays); sem NumPy há uma
+versão objeto a objeto com as mesmas regras.
+
+atualizar_classes é o backfill: classifica os asteroides que já estão na
+BD com a classe 'UNK' (ou sem classe) pela sua solução orbital atual.
+"""
+
+import json
+import time
+from typing import List, Optional, Sequence
+
+from services import colunar
+
+# Código -> descrição (o nome da classe é a parte antes do parêntese,
+# como em _get_or_create_classe_orbital e no 04_seed_data.sql)
+CLASSES = {
+    "IEO": "Atira (Interior Earth Object, Q < 0.983 AU)",
+    "ATE": "Aten (a < 1.0 AU, Q > 0.983 AU)",
+    "APO": "Apollo (a > 1.0 AU, q < 1.017 AU)",
+    "AMO": "Amor (1.017 AU < q < 1.3 AU)",
+    "MCA": "Mars-Crossing Asteroid (1.3 AU < q < 1.666 AU, a < 3.2 AU)",
+    "IMB": "Inner Main-Belt Asteroid (a < 2.0 AU, q > 1.666 AU)",
+    "MBA": "Main-Belt Asteroid (2.0 AU < a < 3.2 AU, q > 1.666 AU)",
+    "OMB": "Outer Main-Belt Asteroid (3.2 AU < a < 4.6 AU)",
+    "TJN": "Jupiter Trojan (4.6 AU < a < 5.5 AU, e < 0.3)",
+    "CEN": "Centaur (5.5 AU < a < 30.1 AU)",
+    "TNO": "TransNeptunian Object (a > 30.1 AU)",
+    "PAA": "Parabolic Asteroid (e = 1)",
+    "HYA": "Hyperbolic Asteroid (e > 1)",
+    "AST": "Asteroid (other)",
+}
+
+# Limites do JPL (UA)
+Q_ATIRA = 0.983
+Q_APOLLO = 1.017
+Q_AMOR = 1.3
+Q_MARTE = 1.666
+
+
+def classe_orbital(a: Optional[float], e: Optional[float]) -> Optional[str]:
+    """Código da classe de um objeto (None se faltar a ou e)."""
+    if a is None or e is None or a != a or e != e:
+        return None
+    if e == 1:
+        return "PAA"
+    if e > 1:
+        return "HYA"
+    q, Q = a * (1 - e), a * (1 + e)
+    if a < 1.0:
+        return "IEO" if Q < Q_ATIRA else "ATE"
+    if q < Q_APOLLO:
+        return "APO"
+    if q < Q_AMOR:
+        return "AMO"
+    if q < Q_MARTE and a < 3.2:
+        return "MCA"
+    if a < 2.0:
+        return "IMB"
+    if a < 3.2:
+        return "MBA"
+    if a < 4.6:
+        return "OMB"
+    if a < 5.5 and e < 0.3:
+        return "TJN"
+    if 5.5 <= a < 30.1:
+        return "CEN"
+    if a >= 30.1:
+        return "TNO"
+    return "AST"
+
+
+def classificar(a: Sequence, e: Sequence) -> List[Optional[str]]:
+    """
+    Códigos das classes para colunas a e e (arrays ou listas com None).
+    Com NumPy as regras são aplicadas a todo o bloco de uma vez (np.select,
+    pela mesma ordem de classe_orbital).
+    """
+    if not colunar.numpy_disponivel():
+        return [classe_orbital(x, y) for x, y in zip(a, e)]
+
+    np = colunar._np()
+    a = np.asarray(a, dtype=np.float64)  # None -> NaN
+    e = np.asarray(e, dtype=np.float64)
+    q, Q = a * (1 - e), a * (1 + e)
+    elipse = e < 1
+    regras = [
+        (np.isnan(a) | np.isnan(e), None),
+        (e == 1, "PAA"),
+        (e > 1, "HYA"),
+        (elipse & (a < 1.0) & (Q < Q_ATIRA), "IEO"),
+        (elipse & (a < 1.0), "ATE"),
+        (elipse & (q < Q_APOLLO), "APO"),
+        (elipse & (q < Q_AMOR), "AMO"),
+        (elipse & (q < Q_MARTE) & (a < 3.2), "MCA"),
+        (elipse & (a < 2.0), "IMB"),
+        (elipse & (a < 3.2), "MBA"),
+        (elipse & (a < 4.6), "OMB"),
+        (elipse & (a < 5.5) & (e < 0.3), "TJN"),
+        (elipse & (a >= 5.5) & (a < 30.1), "CEN"),
+        (elipse & (a >= 30.1), "TNO"),
+    ]
+    codigos = np.array([c for _, c in regras] + ["AST"], dtype=object)
+    with np.errstate(invalid="ignore"):
+        indice = np.select([cond for cond, _ in regras], np.arange(len(regras)), len(regras))
+    return codigos[indice].tolist()
+
+
+_SQL_LER_SEM_CLASSE = """
+    SELECT TOP (?)
+        a.id_asteroide,
+        so.semi_eixo_maior_ua,
+        so.excentricidade
+    FROM dbo.Asteroide            AS a
+    JOIN dbo.Solucao_Orbital      AS so ON so.id_asteroide = a.id_asteroide
+                                       AND so.solucao_atual = 1
+    LEFT JOIN dbo.Classe_Orbital  AS co ON co.id_classe_orbital = a.id_classe_orbital
+    WHERE a.id_asteroide > ?
+      {filtro}
+    ORDER BY a.id_asteroide;
+"""
+
+_SQL_GRAVAR_CLASSES = """
+    SET NOCOUNT ON;
+    DECLARE @lote NVARCHAR(MAX) = ?;
+
+    UPDATE a
+    SET a.id_classe_orbital = c.id_classe_orbital
+    FROM dbo.Asteroide AS a
+    JOIN OPENJSON(@lote) WITH (
+        id_asteroide      INT '$[0]',
+        id_classe_orbital INT '$[1]'
+    ) AS c
+        ON c.id_asteroide = a.id_asteroide;
+"""
+
+
+def atualizar_classes(conn, todos: bool = False, tamanho_bloco: int = 50000) -> int:
+    """
+    Classifica os asteroides da BD pela solução orbital atual e grava o
+    id_classe_orbital. Com todos=False (defeito) só trata os que estão na
+    classe 'UNK' ou sem classe (ex.: importados do MPCORB antes desta
+    classificação); com todos=True reclassifica todos, incluindo os que
+    trazem a classe do neo.csv.
+
+    Lê por páginas de 'tamanho_bloco' (pela chave), com commit por página.
+    Devolve o número de asteroides classificados.
+    """
+    # Import tardio: insercao.py também importa este módulo
+    from services.insercao import garantir_classes
+
+    classes_map = garantir_classes(conn)
+    sql_ler = _SQL_LER_SEM_CLASSE.format(
+        filtro="" if todos else "AND (a.id_classe_orbital IS NULL OR co.codigo = 'UNK')"
+    )
+    cur = conn.cursor()
+    ultimo_id = 0
+    classificados = 0
+    por_classe = {}
+    t0 = time.time()
+
+    while True:
+        cur.execute(sql_ler, tamanho_bloco, ultimo_id)
+        rows = cur.fetchall()
+        if not rows:
+            break
+        ultimo_id = rows[-1][0]
+
+        codigos = classificar([r[1] for r in rows], [r[2] for r in rows])
+        lote = [[r[0], classes_map[c]] for r, c in zip(rows, codigos) if c is not None]
+        if lote:
+            cur.execute(_SQL_GRAVAR_CLASSES, json.dumps(lote, separators=(",", ":")))
+            conn.commit()
+        classificados += len(lote)
+        for c in codigos:
+            if c is not None:
+                por_classe[c] = por_classe.get(c, 0) + 1
+        print(f"  Classes: {classificados} asteroides classificados...")
+
+    cur.close()
+    resumo = ", ".join(f"{c}={n}" for c, n in sorted(por_classe.items(), key=lambda x: -x[1]))
+    print(f"Classes: {classificados} asteroides em {time.time() - t0:.1f}s ({resumo or '-'}).")
+    return classificados
@@ -0,0 +1,129 @@
+"""
+Conversão colunar (NumPy) de valores de texto lidos dos ficheiros.
+
+Em vez de converter campo a campo com _safe_float (str().strip() + float()
+dentro de try/except, linha a linha), juntam-se as colunas numéricas de um
+bloco de linhas e convertem-se todas de uma vez com numpy (o parse dos
+números é feito em C). Valores vazios ficam NaN e passam a None (NULL) no fim,
+tal como os valores não finitos escritos no ficheiro ('nan', 'inf'), para dar
+o mesmo resultado que o _safe_float do modo linha a linha.
+
+O NumPy só é importado quando o modo colunar é usado: o resto da aplicação
+continua a funcionar sem ele.
+"""
+
+import warnings
+from typing import List, Optional, Sequence
+
+
+def _np():
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise ImportError(
+            "O modo colunar precisa do NumPy (pip install numpy)."
+        ) from e
+    return np
+
+
+def numpy_disponivel() -> bool:
+    """True se o NumPy estiver instalado (para escolher o modo colunar)."""
+    try:
+        _np()
+        return True
+    except ImportError:
+        return False
+
+
+def _parse_texto(colunas: Sequence[Sequence[str]], total: int):
+    """
+    Junta os valores de uma ou mais colunas num só texto separado por ';' e
+    converte-o com np.fromstring (os vazios passam a 'nan' no próprio texto).
+    Devolve None se algum valor não for um número simples.
+    """
+    np = _np()
+    texto = ";".join([";".join(coluna) for coluna in colunas])
+    if any(c in texto for c in " \t\r\n"):
+        # Valores com espaços (raro): tirar os espaços de cada valor. Se ainda
+        # houver espaços, não é um número simples. Atenção: um campo só com
+        # espaços seria lido pelo fromstring como -1 sem dar erro.
+        texto = ";".join([v.strip() for coluna in colunas for v in coluna])
+        if any(c in texto for c in " \t\r\n"):
+            return None
+    # ';;' aparece quando há um vazio; duas passagens apanham vazios seguidos
+    texto = texto.replace(";;", ";nan;").replace(";;", ";nan;")
+    if texto.startswith(";") or not texto:
+        texto = "nan" + texto
+    if texto.endswith(";"):
+        texto += "nan"
+    try:
+        with warnings.catch_warnings():
+            # Um valor inválido faz o fromstring parar antes do fim: com aviso
+            # nas versões mais antigas do numpy, com ValueError nas recentes
+            warnings.simplefilter("ignore")
+            arr = np.fromstring(texto, dtype=np.float64, sep=";")
+    except ValueError:
+        return None
+    return arr if arr.size == total else None
+
+
+def para_float64(valores: Sequence[str]):
+    """
+    Converte uma coluna de texto num array float64.
+    Vazios e valores inválidos ficam NaN.
+    """
+    np = _np()
+    if len(valores) == 0:
+        return np.empty(0, dtype=np.float64)
+    arr = _parse_texto([valores], len(valores))
+    if arr is not None:
+        return arr
+    # Há pelo menos um valor inválido: só esta coluna é convertida um a um
+    arr = np.empty(len(valores), dtype=np.float64)
+    for k, v in enumerate(valores):
+        try:
+            arr[k] = float(v)
+        except (TypeError, ValueError):
+            arr[k] = np.nan
+    return arr
+
+
+def bloco_float64(colunas: Sequence[Sequence[str]]):
+    """
+    Converte várias colunas (do mesmo tamanho) numa matriz float64
+    (uma linha por coluna) com uma só chamada ao parser do numpy.
+    """
+    np = _np()
+    n = len(colunas[0]) if colunas else 0
+    arr = _parse_texto(colunas, n * len(colunas)) if n else None
+    if arr is not None:
+        return arr.reshape(len(colunas), n)
+    return np.vstack([para_float64(coluna) for coluna in colunas])
+
+
+def para_lista(coluna, inteiro: bool = False) -> List[Optional[float]]:
+    """
+    Converte um array float64 numa lista de valores Python prontos para
+    serem parâmetros da BD: NaN e ±inf passam a None; com inteiro=True os
+    valores passam a int.
+    """
+    np = _np()
+    if coluna.ndim > 1:
+        return [para_lista(c, inteiro=inteiro) for c in coluna]
+    nulos = ~np.isfinite(coluna)
+    if inteiro:
+        valores = np.where(nulos, 0, coluna).astype(np.int64).tolist()
+    else:
+        valores = coluna.tolist()
+    for k in np.flatnonzero(nulos).tolist():
+        valores[k] = None
+    return valores
+
+
+def colunas_float(colunas: Sequence[Sequence[str]]) -> List[List[Optional[float]]]:
+    """Texto -> listas de float/None, coluna a coluna, numa só passagem vetorizada."""
+    if not colunas:
+        return []
+    if not colunas[0]:
+        return [[] for _ in colunas]
+    return para_lista(bloco_float64(colunas))
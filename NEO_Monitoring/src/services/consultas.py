@@ -102,6 +102,32 @@ def fetch_proximas_aproximacoes_criticas(conn, limite: int = 30):
     return _run_query(conn, sql)
 
 
+def fetch_mudancas_lista_risco(conn):
+    """
+    O que mudou na lista de risco da ESA na última release importada
+    (entradas, saídas e alterações de IP/PS, ver services/historico_risco.py).
+    A release mais recente e as suas linhas vêm do índice
+    IX_ESA_RISCO_HISTORICO_Release, sem percorrer o histórico todo.
+    """
+    sql = """
+    SELECT
+        h.datahora_release,
+        h.tipo_mudanca,
+        h.designacao_objeto,
+        h.id_asteroide,
+        h.ip_max_anterior,
+        h.ip_max_texto,
+        h.ps_max_anterior,
+        h.ps_max,
+        h.ps_cum_anterior,
+        h.ps_cum
+    FROM dbo.ESA_RISCO_HISTORICO AS h
+    WHERE h.datahora_release = (SELECT MAX(datahora_release) FROM dbo.ESA_RISCO_HISTORICO)
+    ORDER BY h.tipo_mudanca, COALESCE(h.ps_cum, h.ps_cum_anterior) DESC;
+    """
+    return _run_query(conn, sql)
+
+
 # -----------------------
 #  CONSULTAS GERAIS
 #  (aqui vou garantir que pelo menos uma delas mostra SEMPRE dados)
@@ -0,0 +1,225 @@
+"""
+Designações de asteroides (pdes) e a sua resolução para id_asteroide.
+
+IndiceDesignacoes carrega uma única vez todos os pares (pdes, id_asteroide)
+da BD para um dicionário em memória, usado durante uma importação para saber
+se um asteroide já existe e qual o seu id sem idas à BD. As chaves são
+"interned" (sys.intern): o mesmo pdes lido do ficheiro e da BD partilha a
+mesma string em memória.
+
+Cada fonte escreve as designações à sua maneira: a ESA usa "2023VD3" e
+"101955 Bennu", a tabela Asteroide guarda "2023 VD3" e "101955".
+normalizar_designacao reduz todas à mesma forma canónica, guardada na
+coluna designacao_canonica (indexada) da Asteroide e das tabelas ESA.
+"""
+
+import json
+import re
+import sys
+import time
+from typing import Optional
+
+# Tamanho da coluna designacao_canonica
+TAMANHO_CANONICA = 40
+
+# Designação provisória: ano + 2 letras + número opcional ("2023 VD3", "2023VD3")
+_RE_PROVISORIA = re.compile(r"(\d{4}) ?([A-Z]{2})(\d*)")
+# Levantamentos Palomar-Leiden / Trojan ("2040 P-L", "3138 T-1")
+_RE_LEVANTAMENTO = re.compile(r"(\d{4}) ?(P-L|T-[123])")
+# Cometas ("P/2019 LD2", "C/2020 F3", "1P/Halley"): a provisória tem 1 ou 2 letras
+_RE_COMETA = re.compile(r"(\d*[PCDXAI])/ ?(.+)")
+_RE_PROVISORIA_COMETA = re.compile(r"(\d{4}) ?([A-Z]{1,2})(\d*)")
+# Asteroide numerado, com ou sem nome ("101955", "101955 Bennu", "(101955) Bennu")
+_RE_NUMERADO = re.compile(r"(\d+)(?: .*)?")
+
+
+def normalizar_designacao(texto: Optional[str]) -> Optional[str]:
+    """
+    Forma canónica de uma designação, para comparar designações de fontes
+    diferentes:
+      - numerados: só o número, sem zeros à esquerda ("101955 Bennu" -> "101955");
+      - provisórias: "AAAA LLnnn" em maiúsculas ("2023vd3" -> "2023 VD3");
+      - cometas: prefixo + designação normalizada ("P/2019LD2" -> "P/2019 LD2");
+      - outros (nomes): maiúsculas e espaços simples.
+    Devolve None para texto vazio.
+    """
+    if not texto:
+        return None
+    s = " ".join(texto.replace("(", " ").replace(")", " ").split()).upper()
+    if not s:
+        return None
+
+    m = _RE_PROVISORIA.fullmatch(s)
+    if m:
+        return f"{m.group(1)} {m.group(2)}{m.group(3)}"
+    m = _RE_LEVANTAMENTO.fullmatch(s)
+    if m:
+        return f"{m.group(1)} {m.group(2)}"
+    m = _RE_COMETA.fullmatch(s)
+    if m:
+        prefixo, resto = m.groups()
+        p = _RE_PROVISORIA_COMETA.fullmatch(resto)
+        if p:
+            resto = f"{p.group(1)} {p.group(2)}{p.group(3)}"
+        return f"{prefixo}/{resto}"[:TAMANHO_CANONICA]
+    m = _RE_NUMERADO.fullmatch(s)
+    if m:
+        return str(int(m.group(1)))
+    return s[:TAMANHO_CANONICA]
+
+
+_SQL_INDICE_PDES = """
+    SELECT pdes, MIN(id_asteroide)
+    FROM dbo.Asteroide
+    GROUP BY pdes
+    ORDER BY MIN(id_asteroide);
+"""
+
+_SQL_INDICE_CANONICO = """
+    SELECT designacao_canonica, MIN(id_asteroide)
+    FROM dbo.Asteroide
+    WHERE designacao_canonica IS NOT NULL
+    GROUP BY designacao_canonica;
+"""
+
+
+class IndiceDesignacoes:
+    """Índice em memória pdes -> id_asteroide, válido durante uma importação."""
+
+    def __init__(self):
+        self._ids = {}
+
+    @classmethod
+    def carregar(cls, conn, tamanho_bloco: int = 50000,
+                 canonico: bool = False) -> "IndiceDesignacoes":
+        """
+        Lê todos os (pdes, id_asteroide) da BD, em blocos de 'tamanho_bloco'.
+        Com canonico=True as chaves são as designações canónicas, lidas já
+        feitas da coluna designacao_canonica (pelo índice
+        IX_Asteroide_DesignacaoCanonica, sem normalizar nada no cliente), e
+        as consultas devem usar a mesma forma. Os asteroides ainda sem
+        designacao_canonica (preenchida por atualizar_designacoes_canonicas
+        no fim de cada importação de asteroides) ficam de fora.
+        """
+        indice = cls()
+        cur = conn.cursor()
+        # Se houver chaves repetidas na BD fica o id mais antigo (como nos JOINs por pdes)
+        cur.execute(_SQL_INDICE_CANONICO if canonico else _SQL_INDICE_PDES)
+        while True:
+            rows = cur.fetchmany(tamanho_bloco)
+            if not rows:
+                break
+            for pdes, id_asteroide in rows:
+                indice._ids.setdefault(sys.intern(pdes), id_asteroide)
+        cur.close()
+        return indice
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, pdes: str) -> bool:
+        return pdes in self._ids
+
+    def get(self, pdes: str):
+        """id_asteroide do pdes, ou None se ainda não existir."""
+        return self._ids.get(pdes)
+
+    def adicionar(self, pdes: str, id_asteroide: int):
+        """Regista um asteroide acabado de inserir (atualiza o índice no momento)."""
+        self._ids.setdefault(sys.intern(pdes), id_asteroide)
+
+    def memoria_bytes(self) -> int:
+        """Memória aproximada ocupada pelo índice (dicionário + chaves + ids)."""
+        total = sys.getsizeof(self._ids)
+        for pdes, id_asteroide in self._ids.items():
+            total += sys.getsizeof(pdes) + sys.getsizeof(id_asteroide)
+        return total
+
+    def resumo(self) -> str:
+        return f"{len(self)} designações, ~{self.memoria_bytes() / (1024 * 1024):.1f} MB"
+
+_SQL_GRAVAR_CANONICAS = """
+    SET NOCOUNT ON;
+    DECLARE @lote NVARCHAR(MAX) = ?;
+
+    UPDATE t
+    SET t.designacao_canonica = j.designacao_canonica
+    FROM {tabela} AS t
+    JOIN OPENJSON(@lote) WITH (
+        id                  INT         '$[0]',
+        designacao_canonica VARCHAR(40) '$[1]'
+    ) AS j
+        ON j.id = t.{chave};
+"""
+
+# Liga as linhas ESA ainda sem id_asteroide pela chave canónica (seek nos dois índices)
+_SQL_RESOLVER_ESA = """
+    UPDATE esa
+    SET esa.id_asteroide = a.id_asteroide
+    FROM {tabela} AS esa
+    CROSS APPLY (
+        SELECT MIN(a.id_asteroide) AS id_asteroide
+        FROM dbo.Asteroide AS a
+        WHERE a.designacao_canonica = esa.designacao_canonica
+    ) AS a
+    WHERE esa.id_asteroide IS NULL
+      AND esa.designacao_canonica IS NOT NULL
+      AND a.id_asteroide IS NOT NULL;
+"""
+
+
+def _preencher_canonicas(conn, tabela: str, chave: str, coluna_origem: str,
+                         tamanho_bloco: int) -> int:
+    """designacao_canonica das linhas de 'tabela' onde ainda está NULL."""
+    cur = conn.cursor()
+    sql_ler = f"""
+        SELECT TOP (?) {chave}, {coluna_origem}
+        FROM {tabela}
+        WHERE designacao_canonica IS NULL
+          AND {chave} > ?
+        ORDER BY {chave};
+    """
+    sql_gravar = _SQL_GRAVAR_CANONICAS.format(tabela=tabela, chave=chave)
+    ultimo_id = 0
+    total = 0
+    while True:
+        cur.execute(sql_ler, tamanho_bloco, ultimo_id)
+        rows = cur.fetchall()
+        if not rows:
+            break
+        ultimo_id = rows[-1][0]
+        lote = [[r[0], c] for r in rows if (c := normalizar_designacao(r[1])) is not None]
+        if lote:
+            cur.execute(sql_gravar, json.dumps(lote, separators=(",", ":")))
+            conn.commit()
+        total += len(lote)
+    cur.close()
+    return total
+
+
+def atualizar_designacoes_canonicas(conn, tamanho_bloco: int = 50000) -> int:
+    """
+    Preenche designacao_canonica onde ainda falta (Asteroide e tabelas ESA)
+    e liga as linhas ESA sem id_asteroide ao asteroide com a mesma chave
+    canónica. Corre no fim das importações de asteroides (para as linhas ESA
+    carregadas antes de o asteroide existir) e em tools/normalizar_designacoes.py.
+    Devolve o número de linhas ESA ligadas.
+    """
+    # Import tardio: import_esa.py importa este módulo
+    from services.import_esa import ESPECIFICACOES
+
+    t0 = time.time()
+    asteroides = _preencher_canonicas(conn, "dbo.Asteroide", "id_asteroide", "pdes", tamanho_bloco)
+
+    cur = conn.cursor()
+    ligadas = 0
+    for spec in ESPECIFICACOES.values():
+        _preencher_canonicas(conn, spec.tabela, spec.chave, "designacao_objeto", tamanho_bloco)
+        cur.execute(_SQL_RESOLVER_ESA.format(tabela=spec.tabela))
+        ligadas += max(cur.rowcount, 0)
+        conn.commit()
+    cur.close()
+
+    print(f"Designações canónicas: {asteroides} asteroides normalizados, "
+          f"{ligadas} linhas ESA ligadas a asteroides em {time.time() - t0:.1f}s.")
+    return ligadas
@@ -0,0 +1,163 @@
+"""
+Abertura dos ficheiros de importação, comprimidos ou não.
+
+O MPC e o JPL distribuem o MPCORB.DAT e os CSV grandes comprimidos
+(.gz, .bz2, .xz, .zip). Em vez de os descomprimir primeiro para o disco,
+os importadores abrem-nos com abrir_binario/abrir_texto, que descomprimem
+em streaming, com um buffer de leitura grande. Para o resto do código o
+resultado é um ficheiro normal (só de leitura) com o conteúdo descomprimido:
+os byte offsets dos checkpoints referem-se a esse conteúdo.
+"""
+
+import bz2
+import contextlib
+import gzip
+import io
+import lzma
+import zipfile
+from pathlib import Path
+from typing import BinaryIO, Iterator, Tuple
+
+EXTENSOES_COMPRIMIDAS = (".gz", ".bz2", ".xz", ".zip")
+
+# Buffer de leitura do conteúdo descomprimido
+TAMANHO_BUFFER = 8 * 1024 * 1024
+
+# Razão máxima de compressão do deflate (~1032:1): um .gz mais pequeno do que
+# 4 GiB / 1032 não pode ter mais de 4 GiB descomprimidos
+_MAX_GZ_SEM_VOLTA = (1 << 32) // 1032
+
+# Padrões para os filetypes dos diálogos da GUI
+PADROES_COMPRIMIDOS = " ".join(f"*{ext}" for ext in EXTENSOES_COMPRIMIDAS)
+
+
+def e_comprimido(caminho) -> bool:
+    """True se o ficheiro tiver uma das extensões de EXTENSOES_COMPRIMIDAS."""
+    return Path(caminho).suffix.lower() in EXTENSOES_COMPRIMIDAS
+
+
+def _membro_zip(zf: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """O ficheiro de dados dentro do .zip (o maior, ignorando pastas)."""
+    membros = [m for m in zf.infolist() if not m.is_dir()]
+    if not membros:
+        raise ValueError(f"O ficheiro '{zf.filename}' não contém nenhum ficheiro.")
+    return max(membros, key=lambda m: m.file_size)
+
+
+@contextlib.contextmanager
+def abrir_binario(caminho, tamanho_buffer: int = TAMANHO_BUFFER) -> Iterator[BinaryIO]:
+    """
+    Abre o ficheiro para leitura binária, descomprimindo-o em streaming se
+    for .gz/.bz2/.xz/.zip. seek() funciona também nos comprimidos, mas é
+    lento (descomprime desde o início): serve para retomar, não para saltar.
+    """
+    path = Path(caminho)
+    ext = path.suffix.lower()
+    if ext == ".gz":
+        raw = gzip.open(path, "rb")
+    elif ext == ".bz2":
+        raw = bz2.open(path, "rb")
+    elif ext == ".xz":
+        raw = lzma.open(path, "rb")
+    elif ext == ".zip":
+        zf = zipfile.ZipFile(path)
+        try:
+            raw = zf.open(_membro_zip(zf))
+        except Exception:
+            zf.close()
+            raise
+    else:
+        with path.open("rb", buffering=tamanho_buffer) as f:
+            yield f
+        return
+
+    try:
+        with io.BufferedReader(raw, buffer_size=tamanho_buffer) as f:
+            yield f
+    finally:
+        raw.close()
+        if ext == ".zip":
+            zf.close()
+
+
+@contextlib.contextmanager
+def abrir_texto(caminho, encoding: str = "utf-8", tamanho_buffer: int = TAMANHO_BUFFER):
+    """Como abrir_binario, mas em modo texto (newline="" para o módulo csv)."""
+    with abrir_binario(caminho, tamanho_buffer) as f:
+        with io.TextIOWrapper(f, encoding=encoding, newline="") as texto:
+            yield texto
+
+
+def tamanho_dados(caminho) -> int:
+    """
+    Tamanho do conteúdo (descomprimido) em bytes, para estimar o progresso.
+    Exato nos ficheiros normais e .zip; no .gz vem do trailer do ficheiro
+    (módulo 4 GiB); no .bz2/.xz não está guardado e é uma estimativa.
+    """
+    path = Path(caminho)
+    ext = path.suffix.lower()
+    tamanho = path.stat().st_size
+    if ext == ".zip":
+        with zipfile.ZipFile(path) as zf:
+            return _membro_zip(zf).file_size
+    if ext == ".gz" and tamanho >= 18:
+        with path.open("rb") as f:
+            f.seek(-4, io.SEEK_END)
+            isize = int.from_bytes(f.read(4), "little")
+        # ISIZE é o tamanho módulo 2^32. Só um .gz grande o suficiente para
+        # passar dos 4 GiB descomprimido pode ter dado a volta; aí somar 4 GiB
+        # até fazer sentido. Nos pequenos o ISIZE é exato, mesmo que seja
+        # menor do que o comprimido (dados que não comprimem)
+        if tamanho > _MAX_GZ_SEM_VOLTA:
+            while isize < tamanho:
+                isize += 1 << 32
+        return isize
+    if ext in (".bz2", ".xz"):
+        return tamanho * 5  # taxa de compressão típica de texto
+    return tamanho
+
+
+def avancar_contando_linhas(f: BinaryIO, n_bytes: int) -> int:
+    """
+    Lê (e descarta) os próximos 'n_bytes' de 'f' e devolve quantas linhas
+    terminavam neles. Serve para retomar num byte offset: num comprimido o
+    seek() teria de descomprimir o início do ficheiro e contar as linhas
+    obrigaria a descomprimi-lo outra vez; assim é tudo na mesma leitura.
+    """
+    linhas = 0
+    restante = n_bytes
+    while restante > 0:
+        parte = f.read(min(restante, 4 * 1024 * 1024))
+        if not parte:
+            break
+        linhas += parte.count(b"\n")
+        restante -= len(parte)
+    return linhas
+
+
+def partes_por_linhas(f: BinaryIO, tamanho_alvo: int,
+                      inicio: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """
+    Lê um ficheiro (já posicionado em 'inicio') em partes de cerca de
+    'tamanho_alvo' bytes terminadas no fim de uma linha. Devolve
+    (offset da parte, bytes). Serve para dividir ficheiros comprimidos, onde
+    não é possível saltar diretamente para um byte.
+    """
+    pos = inicio
+    resto = b""
+    while True:
+        parte = f.read(tamanho_alvo)
+        dados = resto + parte if resto else parte
+        if not dados:
+            return
+        if parte:
+            corte = dados.rfind(b"\n") + 1
+            if corte == 0:
+                resto = dados  # linha maior do que tamanho_alvo: ler mais
+                continue
+            dados, resto = dados[:corte], dados[corte:]
+        else:
+            resto = b""  # fim do ficheiro (última linha sem '\n')
+        yield pos, dados
+        pos += len(dados)
+
@@ -0,0 +1,223 @@
+"""
+Histórico da lista de risco da ESA (riskList.csv).
+
+Cada versão do riskList.csv é comparada com a anterior para saber que
+objetos entraram, saíram ou mudaram de probabilidade (IP) ou de escala de
+Palermo (PS). O removedObjectsFromRiskList.csv só cobre parte disto.
+
+  - A versão anterior está em ESA_RISCO_ESTADO (uma linha por objeto, com o
+    hash dos campos comparados) e é lida com uma só consulta para um
+    dicionário designação canónica -> estado.
+  - O ficheiro novo é lido para um dicionário igual (com o mesmo parse do
+    motor de importação) e os dois são comparados pela chave em O(n):
+    chaves só no novo entraram, só no anterior saíram, e nas comuns basta
+    comparar os hashes.
+  - Só as diferenças são gravadas: em ESA_RISCO_HISTORICO (com os valores
+    anteriores e novos) e em ESA_RISCO_ESTADO, que passa a ser a versão nova.
+
+Todas as diferenças de uma importação ficam com a mesma datahora_release;
+a consulta "o que mudou" (consultas.fetch_mudancas_lista_risco) lê só essa
+release pelo índice IX_ESA_RISCO_HISTORICO_Release, sem percorrer o histórico.
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from services.designacoes import normalizar_designacao
+from services.import_esa import RISK_LIST, ler_registos
+
+ENTROU = "ENTROU"
+SAIU = "SAIU"
+ALTEROU = "ALTEROU"
+
+# Campos comparados entre versões (entram no hash) e campos guardados no
+# estado para registar os valores anteriores
+_CAMPOS_HASH = ("datahora_impacto_utc", "ip_max_texto", "ps_max", "ts", "ip_cum_texto", "ps_cum")
+_CAMPOS_ESTADO = ("ip_max_texto", "ps_max", "ip_cum_texto", "ps_cum")
+
+
+class EstadoRisco(NamedTuple):
+    designacao_objeto: str
+    hash_linha: int
+    valores: dict          # coluna -> valor (pelo menos os _CAMPOS_ESTADO)
+
+
+_SQL_LER_ESTADO = """
+    SELECT designacao_canonica, designacao_objeto, hash_linha,
+           ip_max_texto, ps_max, ip_cum_texto, ps_cum
+    FROM dbo.ESA_RISCO_ESTADO;
+"""
+
+_SQL_GRAVAR_DIFERENCAS = """
+    SET NOCOUNT ON;
+    DECLARE @lote NVARCHAR(MAX) = ?;
+    DECLARE @release DATETIME2(0) = SYSDATETIME();
+
+    SELECT *
+    INTO #dif
+    FROM OPENJSON(@lote) WITH (
+        tipo_mudanca         VARCHAR(10)  '$[0]',
+        designacao_objeto    VARCHAR(100) '$[1]',
+        designacao_canonica  VARCHAR(40)  '$[2]',
+        hash_linha           BIGINT       '$[3]',
+        datahora_impacto_utc DATETIME2(0) '$[4]',
+        ip_max_texto         VARCHAR(50)  '$[5]',
+        ps_max               FLOAT        '$[6]',
+        ts                   FLOAT        '$[7]',
+        ip_cum_texto         VARCHAR(50)  '$[8]',
+        ps_cum               FLOAT        '$[9]',
+        ip_max_anterior      VARCHAR(50)  '$[10]',
+        ps_max_anterior      FLOAT        '$[11]',
+        ip_cum_anterior      VARCHAR(50)  '$[12]',
+        ps_cum_anterior      FLOAT        '$[13]'
+    );
+
+    INSERT INTO dbo.ESA_RISCO_HISTORICO (
+        datahora_release, tipo_mudanca, designacao_objeto, designacao_canonica,
+        id_asteroide, datahora_impacto_utc, ip_max_texto, ps_max, ts,
+        ip_cum_texto, ps_cum, ip_max_anterior, ps_max_anterior,
+        ip_cum_anterior, ps_cum_anterior
+    )
+    SELECT
+        @release, d.tipo_mudanca, d.designacao_objeto, d.designacao_canonica,
+        a.id_asteroide, d.datahora_impacto_utc, d.ip_max_texto, d.ps_max, d.ts,
+        d.ip_cum_texto, d.ps_cum, d.ip_max_anterior, d.ps_max_anterior,
+        d.ip_cum_anterior, d.ps_cum_anterior
+    FROM #dif AS d
+    OUTER APPLY (
+        SELECT TOP (1) ast.id_asteroide
+        FROM dbo.Asteroide AS ast
+        WHERE ast.designacao_canonica = d.designacao_canonica
+        ORDER BY ast.id_asteroide
+    ) AS a;
+
+    -- O estado passa a ser a versão nova: saídas e alterações saem,
+    -- entradas e alterações (com os valores novos) entram
+    DELETE e
+    FROM dbo.ESA_RISCO_ESTADO AS e
+    JOIN #dif AS d ON d.designacao_canonica = e.designacao_canonica
+    WHERE d.tipo_mudanca IN ('SAIU', 'ALTEROU');
+
+    INSERT INTO dbo.ESA_RISCO_ESTADO (
+        designacao_canonica, designacao_objeto, hash_linha,
+        ip_max_texto, ps_max, ip_cum_texto, ps_cum
+    )
+    SELECT designacao_canonica, designacao_objeto, hash_linha,
+           ip_max_texto, ps_max, ip_cum_texto, ps_cum
+    FROM #dif
+    WHERE tipo_mudanca IN ('ENTROU', 'ALTEROU');
+
+    DROP TABLE #dif;
+"""
+
+
+def _hash_registo(valores: dict) -> int:
+    # Import tardio: insercao.py é pesado e só é preciso para o hash
+    from services.insercao import _hash_linha
+
+    return _hash_linha(["" if valores[c] is None else str(valores[c]) for c in _CAMPOS_HASH])
+
+
+def carregar_estado(conn) -> Dict[str, EstadoRisco]:
+    """A versão anterior da lista (ESA_RISCO_ESTADO), numa só consulta."""
+    cur = conn.cursor()
+    cur.execute(_SQL_LER_ESTADO)
+    estado = {
+        row[0]: EstadoRisco(row[1], row[2], dict(zip(_CAMPOS_ESTADO, row[3:])))
+        for row in cur.fetchall()
+    }
+    cur.close()
+    return estado
+
+
+def ler_lista(caminho_csv) -> Dict[str, EstadoRisco]:
+    """
+    Lê um riskList.csv para um dicionário designação canónica -> estado.
+    As linhas sem designação são ignoradas (a importação rejeita-as); se um
+    objeto aparecer duas vezes fica a última linha.
+    """
+    colunas = [c.coluna for c in RISK_LIST.colunas]
+    lista = {}
+    for _, _, registo in ler_registos(RISK_LIST, Path(caminho_csv)):
+        valores = dict(zip(colunas, registo))
+        canonica = normalizar_designacao(valores["designacao_objeto"])
+        if canonica is None:
+            continue
+        lista[canonica] = EstadoRisco(valores["designacao_objeto"], _hash_registo(valores), valores)
+    return lista
+
+
+def comparar(anterior: Dict[str, EstadoRisco], nova: Dict[str, EstadoRisco]) -> list:
+    """
+    Diferenças entre duas versões da lista, pela chave canónica (O(n)).
+    Devolve [(tipo_mudanca, chave), ...]: ENTROU, SAIU ou ALTEROU.
+    """
+    diferencas = [(ENTROU, k) for k in nova.keys() - anterior.keys()]
+    diferencas += [(SAIU, k) for k in anterior.keys() - nova.keys()]
+    diferencas += [
+        (ALTEROU, k) for k in nova.keys() & anterior.keys()
+        if nova[k].hash_linha != anterior[k].hash_linha
+    ]
+    return sorted(diferencas)
+
+
+def _linha_json(tipo: str, chave: str, novo: Optional[EstadoRisco],
+                antigo: Optional[EstadoRisco]) -> list:
+    v = novo.valores if novo else {}
+    a = antigo.valores if antigo else {}
+    return [
+        tipo,
+        (novo or antigo).designacao_objeto,
+        chave,
+        novo.hash_linha if novo else None,
+        v.get("datahora_impacto_utc"),
+        v.get("ip_max_texto"),
+        v.get("ps_max"),
+        v.get("ts"),
+        v.get("ip_cum_texto"),
+        v.get("ps_cum"),
+        a.get("ip_max_texto"),
+        a.get("ps_max"),
+        a.get("ip_cum_texto"),
+        a.get("ps_cum"),
+    ]
+
+
+def registar_historico_risco(conn, caminho_csv) -> dict:
+    """
+    Compara o riskList.csv com a versão anterior e grava as diferenças em
+    ESA_RISCO_HISTORICO e ESA_RISCO_ESTADO, numa transação. Na primeira
+    versão todos os objetos contam como entradas.
+    Devolve {"entradas", "saidas", "alteracoes"}.
+    """
+    t0 = time.time()
+    anterior = carregar_estado(conn)
+    nova = ler_lista(caminho_csv)
+    diferencas = comparar(anterior, nova)
+
+    contagem = {ENTROU: 0, SAIU: 0, ALTEROU: 0}
+    for tipo, _ in diferencas:
+        contagem[tipo] += 1
+
+    if diferencas:
+        lote = [_linha_json(tipo, k, nova.get(k), anterior.get(k)) for tipo, k in diferencas]
+        cur = conn.cursor()
+        try:
+            cur.execute(_SQL_GRAVAR_DIFERENCAS, json.dumps(lote, separators=(",", ":")))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+    print(f"Histórico da lista de risco: {len(nova)} objetos (antes {len(anterior)}); "
+          f"{contagem[ENTROU]} entraram, {contagem[SAIU]} saíram, "
+          f"{contagem[ALTEROU]} alterados em {time.time() - t0:.2f}s.")
+    return {
+        "entradas": contagem[ENTROU],
+        "saidas": contagem[SAIU],
+        "alteracoes": contagem[ALTEROU],
+    }
@@ -1,7 +1,36 @@
+"""
+Importação das listas da ESA (NEOCC) para as tabelas ESA_*.
+
+Os seis ficheiros são importados pelo mesmo motor (importar_lista_esa),
+guiado por uma especificação por ficheiro: tabela de destino e, para cada
+coluna, o cabeçalho do CSV e a função de conversão. O CSV é lido em
+streaming e as linhas convertidas vão para a BD em lotes com
+fast_executemany (uma ida à BD por lote, não por linha). Para suportar uma
+nova lista da ESA basta acrescentar uma EspecificacaoESA a ESPECIFICACOES.
+"""
+
 import csv
+import time
+import uuid
 from pathlib import Path
+from typing import Callable, Iterator, NamedTuple, Tuple
+
 import pyodbc
 
+# Os ficheiros podem vir comprimidos (.gz, .bz2, .xz, .zip)
+from services import ficheiros
+from services.designacoes import _SQL_RESOLVER_ESA, IndiceDesignacoes, normalizar_designacao
+
+# Troca das tabelas no modo snapshot: cada SWITCH espera no máximo
+# _ESPERA_TROCA_MINUTOS pelo lock (com prioridade baixa, sem bloquear quem lê
+# a tabela) e desiste; a troca é repetida até _TENTATIVAS_TROCA vezes
+_ESPERA_TROCA_MINUTOS = 1
+_TENTATIVAS_TROCA = 5
+_PAUSA_TROCA = 5.0   # segundos entre tentativas
+
+# Erro do SQL Server quando o tempo de espera por um lock acaba
+_ERRO_LOCK_TIMEOUT = "1222"
+
 
 # -------------------------------------------------------------------
 # Helpers básicos para conversões
@@ -32,373 +61,419 @@ def _clean_str(value: str | None):
 
 
 # -------------------------------------------------------------------
-# 1) riskList.csv  -> ESA_LISTA_RISCO_ATUAL
+# Especificações dos ficheiros
 # -------------------------------------------------------------------
 
-def importar_risk_list(conn: pyodbc.Connection, caminho_csv: str) -> int:
-    """
-    Importa o ficheiro riskList.csv para a tabela ESA_LISTA_RISCO_ATUAL.
-    Devolve o número de linhas inseridas.
-    """
-    path = Path(caminho_csv)
-    if not path.exists():
-        raise FileNotFoundError(path)
-
-    with path.open("r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-
-    cur = conn.cursor()
-    inseridos = 0
-
-    sql = """
-        INSERT INTO dbo.ESA_LISTA_RISCO_ATUAL (
-            num_lista,
-            designacao_objeto,
-            diametro_m_texto,
-            datahora_impacto_utc,
-            ip_max_texto,
-            ps_max,
-            ts,
-            anos_intervalo,
-            ip_cum_texto,
-            ps_cum,
-            velocidade_kms,
-            dias_na_lista
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-    """
-
-    for r in rows:
-        num_lista = _to_int(r.get("No."))
-        designacao = _clean_str(r.get("Object designation"))
-        diametro = _clean_str(r.get("Diameter in m"))
-        data_impacto = _clean_str(r.get("Impact date/time in UTC"))
-        ip_max = _clean_str(r.get("IP max"))
-        ps_max = _to_float(r.get("PS max"))
-        ts = _to_int(r.get("TS"))
-        anos = _clean_str(r.get("Years"))
-        ip_cum = _clean_str(r.get("IP cum"))
-        ps_cum = _to_float(r.get("PS cum"))
-        vel = _to_float(r.get("Vel. in km/s"))
-        dias = _to_int(r.get("In list since in d"))
-
-        if not designacao:
-            continue
-
-        cur.execute(
-            sql,
-            num_lista,
-            designacao,
-            diametro,
-            data_impacto,
-            ip_max,
-            ps_max,
-            ts,
-            anos,
-            ip_cum,
-            ps_cum,
-            vel,
-            dias,
-        )
-        inseridos += 1
-
-    conn.commit()
-    cur.close()
-    return inseridos
+class ColunaESA(NamedTuple):
+    cabecalho: str                # nome da coluna no CSV
+    coluna: str                   # coluna da tabela
+    converter: Callable = _clean_str
+
+
+class EspecificacaoESA(NamedTuple):
+    ficheiro: str                 # nome habitual do ficheiro (ex.: riskList.csv)
+    tipo: str                     # tipo_ficheiro em Import_Rejects (até 20 caracteres)
+    tabela: str
+    chave: str                    # coluna IDENTITY / PRIMARY KEY da tabela
+    colunas: Tuple[ColunaESA, ...]
+    # Linhas sem valor nesta coluna são rejeitadas
+    obrigatoria: str = "designacao_objeto"
+
+
+_DESIGNACAO = ColunaESA("Object designation", "designacao_objeto")
+_DIAMETRO = ColunaESA("Diameter in m", "diametro_m_texto")
+_DATA_IMPACTO = ColunaESA("Impact date/time in UTC", "datahora_impacto_utc")
+
+RISK_LIST = EspecificacaoESA(
+    "riskList.csv", "ESA_RISK", "dbo.ESA_LISTA_RISCO_ATUAL", "id_risco_atual", (
+        ColunaESA("No.", "num_lista", _to_int),
+        _DESIGNACAO,
+        _DIAMETRO,
+        _DATA_IMPACTO,
+        ColunaESA("IP max", "ip_max_texto"),
+        ColunaESA("PS max", "ps_max", _to_float),
+        ColunaESA("TS", "ts", _to_int),
+        ColunaESA("Years", "anos_intervalo"),
+        ColunaESA("IP cum", "ip_cum_texto"),
+        ColunaESA("PS cum", "ps_cum", _to_float),
+        ColunaESA("Vel. in km/s", "velocidade_kms", _to_float),
+        ColunaESA("In list since in d", "dias_na_lista", _to_int),
+    ))
+
+SPECIAL_RISK_LIST = EspecificacaoESA(
+    "specialRiskList.csv", "ESA_SPECIAL_RISK", "dbo.ESA_LISTA_RISCO_ESPECIAL",
+    "id_risco_especial", (
+        ColunaESA("No.", "num_lista", _to_int),
+        _DESIGNACAO,
+        _DIAMETRO,
+        _DATA_IMPACTO,
+        ColunaESA("IP max", "ip_max_texto"),
+        ColunaESA("PS max", "ps_max", _to_float),
+        ColunaESA("Vel. in km/s", "velocidade_kms", _to_float),
+        ColunaESA("In list since in d", "dias_na_lista", _to_int),
+        ColunaESA("Comment", "comentario"),
+    ))
+
+PAST_IMPACTORS = EspecificacaoESA(
+    "pastImpactorsList.csv", "ESA_PAST_IMPACTORS", "dbo.ESA_IMPACTORES_PASSADOS",
+    "id_impactor", (
+        ColunaESA("No.", "num_lista", _to_int),
+        _DESIGNACAO,
+        _DIAMETRO,
+        _DATA_IMPACTO,
+        ColunaESA("Impact velocity in km/s", "velocidade_impacto_kms", _to_float),
+        ColunaESA("Impact FPA in deg", "fpa_graus", _to_float),
+        ColunaESA("Impact azimuth in deg", "azimute_graus", _to_float),
+        ColunaESA("Estimated energy in kt", "energia_kt", _to_float),
+        ColunaESA("Estimated energy from other sources in kt", "energia_kt_outras", _to_float),
+    ))
+
+REMOVED_FROM_RISK = EspecificacaoESA(
+    "removedObjectsFromRiskList.csv", "ESA_REMOVED", "dbo.ESA_OBJETOS_REMOVIDOS_RISCO",
+    "id_remocao", (
+        _DESIGNACAO,
+        ColunaESA("Removal date in UTC", "data_remocao_utc"),
+        ColunaESA("VI date in UTC", "data_vi_utc"),
+        ColunaESA("Last IP", "ultimo_ip", _to_float),
+        ColunaESA("Last PS", "ultimo_ps", _to_float),
+    ))
+
+UPCOMING_CL_APP = EspecificacaoESA(
+    "upcomingClApp.csv", "ESA_UPCOMING", "dbo.ESA_APROXIMACOES_PROXIMAS",
+    "id_aproximacao_esa", (
+        _DESIGNACAO,
+        ColunaESA("Close approach date in UTC", "datahora_aproximacao_utc"),
+        ColunaESA("Miss distance in km", "miss_dist_km", _to_float),
+        ColunaESA("Miss distance in au", "miss_dist_au", _to_float),
+        ColunaESA("Miss distance in LD", "miss_dist_ld", _to_float),
+        _DIAMETRO,
+        ColunaESA("H in mag", "H_mag", _to_float),
+        ColunaESA("Maximum brightness in mag", "brilho_max_mag", _to_float),
+        ColunaESA("Relative velocity in km/s", "vel_rel_kms", _to_float),
+        ColunaESA("CAI Index", "cai_index", _to_float),
+    ))
+
+SEARCH_RESULT = EspecificacaoESA(
+    "searchResult.csv", "ESA_SEARCH", "dbo.ESA_RESULTADOS_PESQUISA", "id_pesquisa", (
+        _DESIGNACAO,
+    ))
+
+# Nome do ficheiro -> especificação
+ESPECIFICACOES = {
+    spec.ficheiro: spec
+    for spec in (RISK_LIST, SPECIAL_RISK_LIST, PAST_IMPACTORS, REMOVED_FROM_RISK,
+                 UPCOMING_CL_APP, SEARCH_RESULT)
+}
 
 
 # -------------------------------------------------------------------
-# 2) specialRiskList.csv  -> ESA_LISTA_RISCO_ESPECIAL
+# Motor de importação
 # -------------------------------------------------------------------
 
-def importar_special_risk_list(conn: pyodbc.Connection, caminho_csv: str) -> int:
-    """
-    Importa specialRiskList.csv para a tabela ESA_LISTA_RISCO_ESPECIAL.
-    """
-    path = Path(caminho_csv)
-    if not path.exists():
-        raise FileNotFoundError(path)
-
-    with path.open("r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
+# Colunas preenchidas pelo motor (não vêm do CSV), a seguir às da especificação
+_COLUNAS_RESOLVIDAS = ("designacao_canonica", "id_asteroide")
 
-    cur = conn.cursor()
-    inseridos = 0
-
-    sql = """
-        INSERT INTO dbo.ESA_LISTA_RISCO_ESPECIAL (
-            num_lista,
-            designacao_objeto,
-            diametro_m_texto,
-            datahora_impacto_utc,
-            ip_max_texto,
-            ps_max,
-            velocidade_kms,
-            dias_na_lista,
-            comentario
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
-    """
 
-    for r in rows:
-        num_lista = _to_int(r.get("No."))
-        designacao = _clean_str(r.get("Object designation"))
-        diametro = _clean_str(r.get("Diameter in m"))
-        data_impacto = _clean_str(r.get("Impact date/time in UTC"))
-        ip_max = _clean_str(r.get("IP max"))
-        ps_max = _to_float(r.get("PS max"))
-        vel = _to_float(r.get("Vel. in km/s"))
-        dias = _to_int(r.get("In list since in d"))
-        comentario = _clean_str(r.get("Comment"))
-
-        if not designacao:
-            continue
+def _sql_insert(spec: EspecificacaoESA, tabela: str) -> str:
+    nomes = [c.coluna for c in spec.colunas] + list(_COLUNAS_RESOLVIDAS)
+    colunas = ", ".join(nomes)
+    marcadores = ", ".join("?" for _ in nomes)
+    return f"INSERT INTO {tabela} ({colunas}) VALUES ({marcadores});"
 
-        cur.execute(
-            sql,
-            num_lista,
-            designacao,
-            diametro,
-            data_impacto,
-            ip_max,
-            ps_max,
-            vel,
-            dias,
-            comentario,
-        )
-        inseridos += 1
-
-    conn.commit()
-    cur.close()
-    return inseridos
 
+def _sql_drop(tabela: str) -> str:
+    return f"IF OBJECT_ID(N'{tabela}', 'U') IS NOT NULL DROP TABLE {tabela};"
 
-# -------------------------------------------------------------------
-# 3) pastImpactorsList.csv  -> ESA_IMPACTORES_PASSADOS
-# -------------------------------------------------------------------
 
-def importar_past_impactors(conn: pyodbc.Connection, caminho_csv: str) -> int:
+def _sql_criar_copia(spec: EspecificacaoESA, copia: str) -> str:
     """
-    Importa pastImpactorsList.csv para a tabela ESA_IMPACTORES_PASSADOS.
+    Tabela vazia com a mesma estrutura de spec.tabela: colunas (e IDENTITY)
+    pelo SELECT INTO, mais a PRIMARY KEY, a FOREIGN KEY para Asteroide e o
+    índice da designação canónica que todas as tabelas ESA têm
+    (01_create_tables.sql). É o que o ALTER TABLE ... SWITCH exige.
     """
-    path = Path(caminho_csv)
-    if not path.exists():
-        raise FileNotFoundError(path)
-
-    with path.open("r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-
-    cur = conn.cursor()
-    inseridos = 0
-
-    sql = """
-        INSERT INTO dbo.ESA_IMPACTORES_PASSADOS (
-            num_lista,
-            designacao_objeto,
-            diametro_m_texto,
-            datahora_impacto_utc,
-            velocidade_impacto_kms,
-            fpa_graus,
-            azimute_graus,
-            energia_kt,
-            energia_kt_outras
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+    nome = copia.split(".")[-1]
+    return f"""
+        {_sql_drop(copia)}
+        SELECT TOP (0) * INTO {copia} FROM {spec.tabela};
+        ALTER TABLE {copia} ADD CONSTRAINT PK_{nome}
+            PRIMARY KEY CLUSTERED ({spec.chave});
+        ALTER TABLE {copia} ADD CONSTRAINT FK_{nome}_Asteroide
+            FOREIGN KEY (id_asteroide) REFERENCES dbo.Asteroide(id_asteroide);
+        CREATE INDEX IX_{nome}_Canonica
+            ON {copia}(designacao_canonica) INCLUDE (id_asteroide);
     """
 
-    for r in rows:
-        num_lista = _to_int(r.get("No."))
-        designacao = _clean_str(r.get("Object designation"))
-        diametro = _clean_str(r.get("Diameter in m"))
-        data_impacto = _clean_str(r.get("Impact date/time in UTC"))
-        vel = _to_float(r.get("Impact velocity in km/s"))
-        fpa = _to_float(r.get("Impact FPA in deg"))
-        az = _to_float(r.get("Impact azimuth in deg"))
-        energia = _to_float(r.get("Estimated energy in kt"))
-        energia_out = _to_float(r.get("Estimated energy from other sources in kt"))
-
-        if not designacao:
-            continue
-
-        cur.execute(
-            sql,
-            num_lista,
-            designacao,
-            diametro,
-            data_impacto,
-            vel,
-            fpa,
-            az,
-            energia,
-            energia_out,
-        )
-        inseridos += 1
-
-    conn.commit()
-    cur.close()
-    return inseridos
 
-
-# -------------------------------------------------------------------
-# 4) removedObjectsFromRiskList.csv  -> ESA_OBJETOS_REMOVIDOS_RISCO
-# -------------------------------------------------------------------
-
-def importar_removed_from_risk(conn: pyodbc.Connection, caminho_csv: str) -> int:
+def _sql_continuar_identity(spec: EspecificacaoESA, carga: str) -> str:
     """
-    Importa removedObjectsFromRiskList.csv para ESA_OBJETOS_REMOVIDOS_RISCO.
+    Os ids da tabela de carga continuam a numeração da tabela real, para que
+    os ids nunca voltem atrás entre cargas (a sincronização incremental
+    usa-os como marca de água).
+    """
+    return f"""
+        DECLARE @seguinte BIGINT = IDENT_CURRENT('{spec.tabela}') + 1;
+        DBCC CHECKIDENT ('{carga}', RESEED, @seguinte) WITH NO_INFOMSGS;
     """
-    path = Path(caminho_csv)
-    if not path.exists():
-        raise FileNotFoundError(path)
 
-    with path.open("r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
 
-    cur = conn.cursor()
-    inseridos = 0
-
-    sql = """
-        INSERT INTO dbo.ESA_OBJETOS_REMOVIDOS_RISCO (
-            designacao_objeto,
-            data_remocao_utc,
-            data_vi_utc,
-            ultimo_ip,
-            ultimo_ps
-        )
-        VALUES (?, ?, ?, ?, ?);
+def _sql_trocar(spec: EspecificacaoESA, carga: str, antiga: str) -> str:
+    """
+    Troca o conteúdo de spec.tabela pelo da tabela de carga: a tabela atual
+    passa (SWITCH) para 'antiga' e a de carga para o seu lugar. Os SWITCH só
+    mexem em metadados, por isso demoram o mesmo com 2 mil ou 2 milhões de
+    linhas; o CHECKIDENT acerta o IDENTITY para os INSERT seguintes.
+
+    Cada SWITCH precisa de um lock Sch-M na tabela, que espera por todas as
+    leituras em curso e, enquanto espera, bloqueia as que chegam depois. Com
+    WAIT_AT_LOW_PRIORITY fica atrás das leituras sem as bloquear e, passados
+    _ESPERA_TROCA_MINUTOS, desiste (ABORT_AFTER_WAIT = SELF, erro 1222); o
+    XACT_ABORT desfaz então a transação inteira, para ser repetida (_trocar).
+    """
+    espera = (f"WITH (WAIT_AT_LOW_PRIORITY (MAX_DURATION = {_ESPERA_TROCA_MINUTOS} MINUTES, "
+              f"ABORT_AFTER_WAIT = SELF))")
+    return f"""
+        SET XACT_ABORT ON;
+        ALTER TABLE {spec.tabela} SWITCH TO {antiga} {espera};
+        ALTER TABLE {carga} SWITCH TO {spec.tabela} {espera};
+        DBCC CHECKIDENT ('{spec.tabela}') WITH NO_INFOMSGS;
+        SET XACT_ABORT OFF;
     """
 
-    for r in rows:
-        designacao = _clean_str(r.get("Object designation"))
-        data_rem = _clean_str(r.get("Removal date in UTC"))
-        data_vi = _clean_str(r.get("VI date in UTC"))
-        ult_ip = _to_float(r.get("Last IP"))
-        ult_ps = _to_float(r.get("Last PS"))
 
-        if not designacao:
+def _trocar(conn: pyodbc.Connection, cur, spec: EspecificacaoESA, carga: str, antiga: str):
+    """
+    Executa _sql_trocar, repetindo-a (até _TENTATIVAS_TROCA vezes, com
+    _PAUSA_TROCA segundos entre elas) quando desiste à espera do lock.
+    Os outros erros, e o último timeout, são relançados. Depois de um erro o
+    XACT_ABORT volta a OFF: a ligação regressa ao pool e o resto do código
+    conta com erros que só anulam a instrução (ex.: os savepoints da bissecção).
+    """
+    for tentativa in range(1, _TENTATIVAS_TROCA + 1):
+        try:
+            cur.execute(_sql_trocar(spec, carga, antiga))
+            conn.commit()
+            return
+        except pyodbc.Error as e:
+            conn.rollback()
+            cur.execute("SET XACT_ABORT OFF;")
+            if _ERRO_LOCK_TIMEOUT not in str(e) or tentativa == _TENTATIVAS_TROCA:
+                raise
+            print(f"[AVISO] {spec.tabela} em uso: troca adiada "
+                  f"(tentativa {tentativa}/{_TENTATIVAS_TROCA}).")
+            time.sleep(_PAUSA_TROCA)
+
+
+def ler_registos(spec: EspecificacaoESA, path: Path) -> Iterator[Tuple[int, list, tuple]]:
+    """
+    Lê o CSV em streaming e devolve, para cada linha não vazia, (nº da linha,
+    linha original, registo convertido pela ordem de spec.colunas). As
+    colunas que faltem no cabeçalho ficam None (com um aviso).
+    """
+    with ficheiros.abrir_texto(path) as f:
+        reader = csv.reader(f)
+        cabecalho = [h.strip() for h in next(reader, [])]
+        posicoes = {h: i for i, h in enumerate(cabecalho)}
+        em_falta = [c.cabecalho for c in spec.colunas if c.cabecalho not in posicoes]
+        if em_falta:
+            print(f"[AVISO] {path.name}: colunas em falta no CSV (ficam NULL): "
+                  f"{', '.join(em_falta)}")
+        conversores = [(posicoes.get(c.cabecalho), c.converter) for c in spec.colunas]
+
+        for row in reader:
+            if not row:
+                continue
+            yield reader.line_num, row, tuple(
+                conv(row[i] if i is not None and i < len(row) else None)
+                for i, conv in conversores
+            )
+
+
+def _carregar(cur, spec: EspecificacaoESA, path: Path, tabela: str, tamanho_lote: int,
+              indice: IndiceDesignacoes | None):
+    """
+    Insere as linhas convertidas do CSV (ler_registos) em 'tabela', em lotes
+    de 'tamanho_lote' (fast_executemany), com a designação canónica de cada
+    linha. O id_asteroide é resolvido no momento pelo 'indice' (chaves
+    canónicas) ou, sem índice, no fim por um só UPDATE com JOIN pela
+    designacao_canonica (_SQL_RESOLVER_ESA, seek nos dois índices), que
+    também liga as linhas da tabela que ainda estivessem por ligar.
+    Não faz commit.
+    Devolve (linhas lidas, inseridas, ligadas a um asteroide,
+    rejeitadas (num_linha, conteúdo, erro)).
+    """
+    sql = _sql_insert(spec, tabela)
+    idx_obrigatoria = [c.coluna for c in spec.colunas].index(spec.obrigatoria)
+    idx_designacao = [c.coluna for c in spec.colunas].index("designacao_objeto")
+    linhas = inseridos = ligados = 0
+    rejeitados = []
+
+    lote = []
+    for num_linha, row, registo in ler_registos(spec, path):
+        linhas += 1
+        if registo[idx_obrigatoria] is None:
+            rejeitados.append((num_linha, ",".join(row), f"{spec.obrigatoria} vazia"))
             continue
-
-        cur.execute(
-            sql,
-            designacao,
-            data_rem,
-            data_vi,
-            ult_ip,
-            ult_ps,
-        )
-        inseridos += 1
-
-    conn.commit()
-    cur.close()
-    return inseridos
-
-
-# -------------------------------------------------------------------
-# 5) upcomingClApp.csv  -> ESA_APROXIMACOES_PROXIMAS
-# -------------------------------------------------------------------
-
-def importar_upcoming_cl_app(conn: pyodbc.Connection, caminho_csv: str) -> int:
+        canonica = normalizar_designacao(registo[idx_designacao])
+        id_asteroide = indice.get(canonica) if indice is not None and canonica else None
+        ligados += id_asteroide is not None
+        lote.append(registo + (canonica, id_asteroide))
+        if len(lote) >= tamanho_lote:
+            cur.executemany(sql, lote)
+            inseridos += len(lote)
+            lote = []
+    if lote:
+        cur.executemany(sql, lote)
+        inseridos += len(lote)
+    if indice is None:
+        cur.execute(_SQL_RESOLVER_ESA.format(tabela=tabela))
+        ligados = max(cur.rowcount, 0)
+
+    return linhas, inseridos, ligados, rejeitados
+
+
+def importar_lista_esa(conn: pyodbc.Connection, spec: EspecificacaoESA, caminho_csv: str,
+                       tamanho_lote: int = 5000, substituir: bool = False,
+                       indice: IndiceDesignacoes | None = None) -> dict:
     """
-    Importa upcomingClApp.csv para ESA_APROXIMACOES_PROXIMAS.
+    Importa um ficheiro da ESA segundo a especificação 'spec'.
+
+    As linhas são lidas em streaming, convertidas coluna a coluna e
+    inseridas em lotes de 'tamanho_lote' com fast_executemany. As linhas sem
+    a coluna obrigatória (a designação) vão para Import_Rejects.
+
+    Cada linha leva a designacao_canonica e o id_asteroide, resolvido pela
+    designação canónica no fim da carga, na BD, com um só UPDATE pelos
+    índices das duas tabelas: o custo depende do tamanho do ficheiro e não
+    do catálogo de asteroides. Se for dado um 'indice' em memória (chaves
+    canónicas) é usado no momento em vez disso. As linhas cujo asteroide
+    ainda não existe ficam com id_asteroide NULL e são ligadas depois por
+    designacoes.atualizar_designacoes_canonicas.
+
+    - substituir=False: as linhas são acrescentadas à tabela, numa só
+      transação (commit no fim do ficheiro).
+    - substituir=True (snapshot): a tabela passa a ter só o conteúdo do
+      ficheiro. As linhas são carregadas numa tabela sombra
+      (<tabela>_CARGA_<id da carga>, já com a PK e a FK) que ninguém lê,
+      e no fim trocadas de uma vez com a tabela real por ALTER TABLE ...
+      SWITCH numa transação. Quem lê a tabela (ex.: a GUI) vê sempre a
+      lista anterior completa ou a nova completa, nunca uma carga a meio,
+      e o tempo não depende do histórico acumulado na tabela.
+
+    Devolve as estatísticas do ficheiro: {"ficheiro", "tabela", "linhas",
+    "inseridos", "ligados", "rejeitados", "segundos"}.
     """
+    # Import tardio: insercao.py é pesado e só é preciso para as rejeições
+    from services.insercao import _registar_rejeicoes
+
     path = Path(caminho_csv)
     if not path.exists():
         raise FileNotFoundError(path)
 
-    with path.open("r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
+    t0 = time.time()
+    # Tabelas auxiliares próprias desta carga: duas cargas da mesma lista
+    # ao mesmo tempo não apagam nem usam as tabelas uma da outra
+    sufixo = uuid.uuid4().hex[:8]
+    carga = f"{spec.tabela}_CARGA_{sufixo}"
+    antiga = f"{spec.tabela}_ANTIGA_{sufixo}"
 
     cur = conn.cursor()
-    inseridos = 0
-
-    sql = """
-        INSERT INTO dbo.ESA_APROXIMACOES_PROXIMAS (
-            designacao_objeto,
-            datahora_aproximacao_utc,
-            miss_dist_km,
-            miss_dist_au,
-            miss_dist_ld,
-            diametro_m_texto,
-            H_mag,
-            brilho_max_mag,
-            vel_rel_kms,
-            cai_index
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-    """
-
-    for r in rows:
-        designacao = _clean_str(r.get("Object designation"))
-        data_ca = _clean_str(r.get("Close approach date in UTC"))
-        miss_km = _to_float(r.get("Miss distance in km"))
-        miss_au = _to_float(r.get("Miss distance in au"))
-        miss_ld = _to_float(r.get("Miss distance in LD"))
-        diametro = _clean_str(r.get("Diameter in m"))
-        H = _to_float(r.get("H in mag"))
-        brilho = _to_float(r.get("Maximum brightness in mag"))
-        vel = _to_float(r.get("Relative velocity in km/s"))
-        cai = _to_float(r.get("CAI Index"))
-
-        if not designacao:
-            continue
-
-        cur.execute(
-            sql,
-            designacao,
-            data_ca,
-            miss_km,
-            miss_au,
-            miss_ld,
-            diametro,
-            H,
-            brilho,
-            vel,
-            cai,
-        )
-        inseridos += 1
-
-    conn.commit()
-    cur.close()
-    return inseridos
+    cur.fast_executemany = True
+    try:
+        if substituir:
+            cur.execute(_sql_criar_copia(spec, carga))
+            cur.execute(_sql_continuar_identity(spec, carga))
+            cur.execute(_sql_criar_copia(spec, antiga))
+            conn.commit()
+            linhas, inseridos, ligados, rejeitados = _carregar(
+                cur, spec, path, carga, tamanho_lote, indice
+            )
+            _registar_rejeicoes(cur, spec.tipo, path, rejeitados)
+            conn.commit()
+            _trocar(conn, cur, spec, carga, antiga)
+            # O conteúdo anterior já não é visível: apagá-lo fica fora da troca
+            cur.execute(_sql_drop(antiga) + _sql_drop(carga))
+            conn.commit()
+        else:
+            linhas, inseridos, ligados, rejeitados = _carregar(
+                cur, spec, path, spec.tabela, tamanho_lote, indice
+            )
+            _registar_rejeicoes(cur, spec.tipo, path, rejeitados)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        if substituir:
+            # A tabela real não foi tocada; só falta limpar as tabelas auxiliares
+            try:
+                cur.execute(_sql_drop(antiga) + _sql_drop(carga))
+                conn.commit()
+            except pyodbc.Error:
+                conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    estatisticas = {
+        "ficheiro": path.name,
+        "tabela": spec.tabela,
+        "linhas": linhas,
+        "inseridos": inseridos,
+        "ligados": ligados,
+        "rejeitados": len(rejeitados),
+        "segundos": time.time() - t0,
+    }
+    modo = "substituída" if substituir else "acrescentada"
+    print(f"{path.name} -> {spec.tabela} ({modo}): {inseridos} inseridos "
+          f"({ligados} ligados a asteroides), {len(rejeitados)} rejeitados "
+          f"em {estatisticas['segundos']:.1f}s.")
+    return estatisticas
 
 
 # -------------------------------------------------------------------
-# 6) searchResult.csv  -> ESA_RESULTADOS_PESQUISA
+# Funções por ficheiro (devolvem o número de linhas inseridas; com
+# substituir=True a tabela fica só com o conteúdo do ficheiro)
 # -------------------------------------------------------------------
 
-def importar_search_result(conn: pyodbc.Connection, caminho_csv: str) -> int:
+def importar_risk_list(conn: pyodbc.Connection, caminho_csv: str,
+                       substituir: bool = False, historico: bool = True) -> int:
     """
-    Importa searchResult.csv para ESA_RESULTADOS_PESQUISA.
+    Importa riskList.csv para ESA_LISTA_RISCO_ATUAL. Com historico=True
+    (defeito) regista também o que mudou desde a versão anterior da lista
+    (services/historico_risco.py).
     """
-    path = Path(caminho_csv)
-    if not path.exists():
-        raise FileNotFoundError(path)
+    inseridos = importar_lista_esa(conn, RISK_LIST, caminho_csv, substituir=substituir)["inseridos"]
+    if historico:
+        # Import tardio: historico_risco.py importa este módulo
+        from services.historico_risco import registar_historico_risco
+        registar_historico_risco(conn, caminho_csv)
+    return inseridos
 
-    with path.open("r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
 
-    cur = conn.cursor()
-    inseridos = 0
+def importar_special_risk_list(conn: pyodbc.Connection, caminho_csv: str,
+                               substituir: bool = False) -> int:
+    """Importa specialRiskList.csv para ESA_LISTA_RISCO_ESPECIAL."""
+    return importar_lista_esa(conn, SPECIAL_RISK_LIST, caminho_csv, substituir=substituir)["inseridos"]
 
-    sql = """
-        INSERT INTO dbo.ESA_RESULTADOS_PESQUISA (designacao_objeto)
-        VALUES (?);
-    """
 
-    for r in rows:
-        designacao = _clean_str(r.get("Object designation"))
-        if not designacao:
-            continue
+def importar_past_impactors(conn: pyodbc.Connection, caminho_csv: str,
+                            substituir: bool = False) -> int:
+    """Importa pastImpactorsList.csv para ESA_IMPACTORES_PASSADOS."""
+    return importar_lista_esa(conn, PAST_IMPACTORS, caminho_csv, substituir=substituir)["inseridos"]
 
-        cur.execute(sql, designacao)
-        inseridos += 1
 
-    conn.commit()
-    cur.close()
-    return inseridos
+def importar_removed_from_risk(conn: pyodbc.Connection, caminho_csv: str,
+                               substituir: bool = False) -> int:
+    """Importa removedObjectsFromRiskList.csv para ESA_OBJETOS_REMOVIDOS_RISCO."""
+    return importar_lista_esa(conn, REMOVED_FROM_RISK, caminho_csv, substituir=substituir)["inseridos"]
+
+
+def importar_upcoming_cl_app(conn: pyodbc.Connection, caminho_csv: str,
+                             substituir: bool = False) -> int:
+    """Importa upcomingClApp.csv para ESA_APROXIMACOES_PROXIMAS."""
+    return importar_lista_esa(conn, UPCOMING_CL_APP, caminho_csv, substituir=substituir)["inseridos"]
+
+
+def importar_search_result(conn: pyodbc.Connection, caminho_csv: str,
+                           substituir: bool = False) -> int:
+    """Importa searchResult.csv para ESA_RESULTADOS_PESQUISA."""
+    return importar_lista_esa(conn, SEARCH_RESULT, caminho_csv, substituir=substituir)["inseridos"]
@@ -0,0 +1,250 @@
+"""
+Importação de uma pasta inteira (ex.: docs/) de ficheiros da ESA, do JPL e do MPC.
+
+Cada ficheiro é reconhecido pelo conteúdo e não pelo nome:
+  - neo.csv (JPL): cabeçalho separado por ';' com spkid, pdes, a e e;
+  - MPCORB.DAT (MPC): linhas de largura fixa (ou um snapshot binário);
+  - listas da ESA: o cabeçalho tem todas as colunas de uma EspecificacaoESA.
+Os comprimidos (.gz, .bz2, .xz, .zip) são reconhecidos pelo conteúdo descomprimido.
+
+As importações correm num pool de threads, cada uma com a sua própria
+ligação à BD, requisitada ao db.PoolLigacoes (por isso recebe o pool e não
+uma ligação):
+  1. neo.csv e depois MPCORB.DAT, em sequência na mesma tarefa (os dois
+     escrevem em Asteroide pelo mesmo pdes e não podem correr ao mesmo tempo);
+  2. ao mesmo tempo, cada lista da ESA na sua tarefa. As listas não precisam
+     dos asteroides para ser carregadas: o id_asteroide é resolvido no fim de
+     cada lista pela designação canónica e o que faltar fica NULL;
+  3. quando tudo acaba: ligação das linhas ESA aos asteroides
+     (atualizar_designacoes_canonicas) e sincronização das aproximações
+     (sync_data), que dependem de todos os ficheiros.
+O tempo total é assim o do ficheiro mais lento (normalmente o MPCORB.DAT),
+mais os dois passos finais, e não a soma de todos.
+"""
+
+import csv
+import io
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from db import PoolLigacoes
+from services import ficheiros, mpcorb, snapshot
+from services.designacoes import atualizar_designacoes_canonicas
+from services.historico_risco import registar_historico_risco
+from services.import_esa import (
+    ESPECIFICACOES,
+    RISK_LIST,
+    UPCOMING_CL_APP,
+    EspecificacaoESA,
+    importar_lista_esa,
+)
+from services.insercao import asteroides_existem, importar_mpcorb_dat, importar_neo_csv
+
+TIPO_NEO = "neo.csv"
+TIPO_MPCORB = "MPCORB.DAT"
+
+# Passos finais (aparecem no progresso como se fossem ficheiros)
+PASSO_LIGACOES = "Ligações ESA -> Asteroide"
+PASSO_SYNC = "Sincronização de aproximações"
+
+# Estados reportados ao progress_callback
+EM_ESPERA = "em espera"
+A_IMPORTAR = "a importar"
+CONCLUIDO = "concluído"
+ERRO = "erro"
+CANCELADO = "cancelado"
+
+# Bytes lidos do início de cada ficheiro para o reconhecer
+_AMOSTRA = 64 * 1024
+
+# Época compactada do MPCORB.DAT (colunas 21-25), ex.: K25BL
+_RE_EPOCA_MPC = re.compile(r"[IJK]\d\d[1-9A-C][1-9A-V]")
+
+
+class FicheiroLote(NamedTuple):
+    caminho: Path
+    tipo: str                                 # TIPO_NEO, TIPO_MPCORB ou spec.ficheiro
+    spec: Optional[EspecificacaoESA] = None   # só nas listas da ESA
+
+
+def _amostra(caminho: Path) -> bytes:
+    with ficheiros.abrir_binario(caminho) as f:
+        return f.read(_AMOSTRA)
+
+
+def _e_mpcorb(amostra: bytes) -> bool:
+    """Primeira linha de dados (a seguir ao cabeçalho, se houver) com o formato do MPC."""
+    inicio = mpcorb.inicio_dados(amostra)
+    linha = amostra[inicio:].split(b"\n", 1)[0].rstrip(b"\r")
+    if len(linha) < mpcorb.LARGURA_LINHA - 42:  # a coluna do nome pode vir cortada
+        return False
+    ini, fim = mpcorb.CAMPOS["epoca"]
+    return _RE_EPOCA_MPC.fullmatch(linha[ini:fim].decode("ascii", "replace")) is not None
+
+
+def detetar_tipo(caminho) -> Optional[FicheiroLote]:
+    """
+    Reconhece um ficheiro (ou a pasta de um snapshot) pelo conteúdo.
+    Devolve None se não for nenhum dos ficheiros importáveis.
+    """
+    path = Path(caminho)
+    if path.is_dir():
+        if snapshot.e_snapshot(path):
+            return FicheiroLote(path, TIPO_MPCORB)
+        return None
+
+    amostra = _amostra(path)
+    if _e_mpcorb(amostra):
+        return FicheiroLote(path, TIPO_MPCORB)
+
+    primeira = amostra.split(b"\n", 1)[0].decode("utf-8", "replace").lstrip("\ufeff")
+    nomes = {c.strip().lower() for c in primeira.split(";")}
+    if {"spkid", "pdes", "a", "e"} <= nomes:
+        return FicheiroLote(path, TIPO_NEO)
+
+    cabecalho = {h.strip() for h in next(csv.reader(io.StringIO(primeira)), [])}
+    # A especificação com mais colunas que o cabeçalho tem todas
+    # (o searchResult.csv só tem a designação, que está em todas as listas)
+    candidatas = [
+        spec for spec in ESPECIFICACOES.values()
+        if all(c.cabecalho in cabecalho for c in spec.colunas)
+    ]
+    if candidatas:
+        spec = max(candidatas, key=lambda s: len(s.colunas))
+        return FicheiroLote(path, spec.ficheiro, spec)
+    return None
+
+
+def detetar_ficheiros(pasta) -> List[FicheiroLote]:
+    """
+    Reconhece os ficheiros importáveis de 'pasta' (não recursivo). Se houver
+    dois ficheiros do mesmo tipo (ex.: MPCORB.DAT e MPCORB.DAT.gz) fica o
+    primeiro por ordem alfabética e os outros são ignorados, com aviso.
+    """
+    encontrados = {}
+    for path in sorted(Path(pasta).iterdir()):
+        if path.name.startswith(".") or path.suffix.lower() == ".py":
+            continue
+        try:
+            ficheiro = detetar_tipo(path)
+        except (OSError, ValueError) as e:
+            print(f"[AVISO] {path.name}: não foi possível ler ({e}).")
+            continue
+        if ficheiro is None:
+            continue
+        if ficheiro.tipo in encontrados:
+            print(f"[AVISO] {path.name} ignorado: já existe um {ficheiro.tipo} "
+                  f"({encontrados[ficheiro.tipo].caminho.name}).")
+            continue
+        encontrados[ficheiro.tipo] = ficheiro
+    return list(encontrados.values())
+
+
+def importar_pasta(pool: PoolLigacoes, pasta, progress_callback=None, substituir: bool = True,
+                   ligacoes: int = 4) -> dict:
+    """
+    Importa todos os ficheiros reconhecidos em 'pasta' (ver o início do módulo).
+
+    - substituir: as listas da ESA substituem o conteúdo das tabelas (snapshot),
+      como convém numa atualização completa; False acrescenta as linhas;
+    - ligacoes: nº de tarefas (e de ligações do pool) em simultâneo; o pool
+      deve ter pelo menos este máximo, ou as tarefas esperam por ligações.
+
+    O neo.csv é importado com upsert incremental se já houver asteroides.
+    progress_callback(nome, tipo, estado, atual, total, decorrido) é chamado de
+    várias threads, para cada ficheiro e para os passos finais (PASSO_*).
+
+    Devolve {nome: {"tipo", "estado", "registos", "segundos", "erro"}}.
+    """
+    t0 = time.time()
+    lista = detetar_ficheiros(pasta)
+    nucleo = [f for tipo in (TIPO_NEO, TIPO_MPCORB) for f in lista if f.tipo == tipo]
+    esa = [f for f in lista if f.spec is not None]
+    print(f"Importação da pasta {pasta}: {len(nucleo)} ficheiros de asteroides, "
+          f"{len(esa)} listas da ESA, {ligacoes} ligações.")
+
+    resultado = {f.caminho.name: {"tipo": f.tipo} for f in lista}
+    resultado.update({passo: {"tipo": passo} for passo in (PASSO_LIGACOES, PASSO_SYNC)})
+
+    def reportar(nome, estado, atual=0, total=0, decorrido=0.0, erro=None):
+        resultado[nome].update(estado=estado, registos=atual, segundos=decorrido, erro=erro)
+        if progress_callback:
+            progress_callback(nome, resultado[nome]["tipo"], estado, atual, total, decorrido)
+
+    for nome in resultado:
+        reportar(nome, EM_ESPERA)
+
+    def executar(nome, funcao):
+        # Corre uma tarefa com a sua própria ligação; os erros ficam no resultado
+        inicio = time.time()
+        reportar(nome, A_IMPORTAR)
+        try:
+            with pool.ligacao() as conn:
+                registos = funcao(conn, lambda atual, total, decorrido: reportar(
+                    nome, A_IMPORTAR, atual, total, decorrido))
+            reportar(nome, CONCLUIDO, registos, registos, time.time() - inicio)
+            return True
+        except Exception as e:
+            print(f"[ERRO] {nome}: {e}")
+            reportar(nome, ERRO, 0, 0, time.time() - inicio, str(e))
+            return False
+
+    def tarefa_nucleo():
+        for f in nucleo:
+            if f.tipo == TIPO_NEO:
+                def importar(conn, cb, caminho=f.caminho):
+                    upsert = asteroides_existem(conn)
+                    return importar_neo_csv(conn, str(caminho), progress_callback=cb,
+                                            upsert=upsert, incremental=upsert)
+            else:
+                def importar(conn, cb, caminho=f.caminho):
+                    return importar_mpcorb_dat(conn, str(caminho), progress_callback=cb,
+                                               processos=os.cpu_count() or 1)
+            if not executar(f.caminho.name, importar):
+                # O MPCORB.DAT atualiza os asteroides do neo.csv: sem ele não avança
+                for resto in nucleo[nucleo.index(f) + 1:]:
+                    reportar(resto.caminho.name, CANCELADO)
+                return False
+        return True
+
+    def importar_esa(f: FicheiroLote):
+        def importar(conn, cb):
+            inseridos = importar_lista_esa(conn, f.spec, str(f.caminho),
+                                           substituir=substituir)["inseridos"]
+            if f.spec is RISK_LIST:
+                # Como em importar_risk_list: o que mudou desde a versão anterior
+                registar_historico_risco(conn, f.caminho)
+            return inseridos
+        return executar(f.caminho.name, importar)
+
+    with ThreadPoolExecutor(max_workers=max(1, ligacoes)) as executor:
+        futuro_nucleo = executor.submit(tarefa_nucleo)
+        futuros_esa = {f.tipo: executor.submit(importar_esa, f) for f in esa}
+        nucleo_ok = futuro_nucleo.result()
+        esa_ok = {tipo: futuro.result() for tipo, futuro in futuros_esa.items()}
+
+    # Passos finais, só depois de todos os ficheiros de que dependem
+    ligacoes_ok = False
+    if nucleo_ok:
+        ligacoes_ok = executar(PASSO_LIGACOES, lambda conn, cb: atualizar_designacoes_canonicas(conn))
+    else:
+        reportar(PASSO_LIGACOES, CANCELADO)
+
+    if ligacoes_ok and esa_ok.get(UPCOMING_CL_APP.ficheiro, True):
+        # Import tardio: o sync vive em tools/ (também corre sozinho)
+        from tools.sync_esa_approaches import sync_data
+        executar(PASSO_SYNC, lambda conn, cb: sync_data(conn, resolver=False))
+    else:
+        reportar(PASSO_SYNC, CANCELADO)
+
+    duracao = time.time() - t0
+    soma = sum(info["segundos"] for info in resultado.values())
+    falhados = [nome for nome, info in resultado.items() if info["estado"] in (ERRO, CANCELADO)]
+    print(f"Importação da pasta concluída em {duracao:.1f}s "
+          f"(soma dos tempos individuais: {soma:.1f}s); "
+          f"{len(falhados)} com erro ou cancelados{': ' + ', '.join(falhados) if falhados else ''}.")
+    return resultado
@@ -1,8 +1,26 @@
+import contextlib
 import csv
+import functools
+import gc
+import hashlib
+import io
+import itertools
+import json
+import math
+import operator
+import os
+import queue
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import pyodbc
 from datetime import datetime
 
+from db import PoolLigacoes
+from services import classificacao, colunar, ficheiros, moid, mpcorb, snapshot
+from services.designacoes import IndiceDesignacoes, atualizar_designacoes_canonicas
+
 
 def asteroides_existem(conn: pyodbc.Connection) -> bool:
     """Devolve True se já existir pelo menos um asteroide na base de dados."""
@@ -24,50 +42,70 @@ def _get_all_classes(conn: pyodbc.Connection) -> dict:
         cur.close()
 
 
-def _create_classe_orbital(conn: pyodbc.Connection, codigo: str, descricao: str) -> int:
-    """Cria uma nova classe orbital e retorna o ID."""
-    cur = conn.cursor()
-    try:
-        nome = descricao.split('(')[0].strip() if descricao else codigo
-        cur.execute(
-            "INSERT INTO dbo.Classe_Orbital (codigo, nome, descricao) "
-            "VALUES (?, ?, ?); SELECT SCOPE_IDENTITY();",
-            codigo, nome, descricao
-        )
-        return int(cur.fetchone()[0])
-    finally:
-        cur.close()
-
-
 def _get_or_create_classe_orbital(conn: pyodbc.Connection, codigo: str, descricao: str) -> int:
     """
     Devolve o id da classe orbital com o 'codigo' dado, criando-a se ainda não existir.
-    Usado, por exemplo, para ter uma classe 'UNK' (Unknown / MPCORB Import).
+    Usado, por exemplo, por garantir_classes para as classes que o seed não tem.
+
+    O SELECT com UPDLOCK/HOLDLOCK bloqueia a chave até ao commit, por isso duas
+    ligações (ex.: importação paralela) que tentem criar o mesmo código ao mesmo
+    tempo ficam serializadas e só uma faz o INSERT.
     """
+    nome = descricao.split('(')[0].strip() if descricao else codigo
     cur = conn.cursor()
     try:
         cur.execute(
-            "SELECT id_classe_orbital FROM dbo.Classe_Orbital WHERE codigo = ?;",
-            codigo
+            """
+            SET NOCOUNT ON;
+            DECLARE @codigo VARCHAR(20) = ?;
+            DECLARE @id INT;
+
+            SELECT @id = id_classe_orbital
+            FROM dbo.Classe_Orbital WITH (UPDLOCK, HOLDLOCK)
+            WHERE codigo = @codigo;
+
+            IF @id IS NULL
+            BEGIN
+                INSERT INTO dbo.Classe_Orbital (codigo, nome, descricao)
+                VALUES (@codigo, ?, ?);
+                SET @id = SCOPE_IDENTITY();
+            END
+
+            SELECT @id;
+            """,
+            codigo, nome, descricao
         )
-        row = cur.fetchone()
-        if row:
-            return int(row[0])
+        new_id = int(cur.fetchone()[0])
     finally:
         cur.close()
 
-    new_id = _create_classe_orbital(conn, codigo, descricao)
     conn.commit()
     return new_id
 
 
+def garantir_classes(conn: pyodbc.Connection) -> dict:
+    """
+    Mapa {codigo: id} de _get_all_classes, criando antes as classes de
+    services/classificacao.py que ainda não existam (o seed só tem as
+    principais) e a 'UNK' (objetos sem a/e para classificar).
+    """
+    classes_map = _get_all_classes(conn)
+    em_falta = dict(classificacao.CLASSES, UNK='Unknown / MPCORB Import')
+    for codigo, descricao in em_falta.items():
+        if codigo not in classes_map:
+            classes_map[codigo] = _get_or_create_classe_orbital(conn, codigo, descricao)
+    return classes_map
+
+
 def _safe_float(value):
     if not value or str(value).strip() == '':
         return None
     try:
-        return float(value)
+        numero = float(value)
     except Exception:
         return None
+    # 'nan' e 'inf' não cabem num FLOAT do SQL Server: ficam NULL (como no modo colunar)
+    return numero if math.isfinite(numero) else None
 
 
 def _safe_int(value):
@@ -91,218 +129,1403 @@ def _safe_date(value):
         return None
 
 
-def importar_neo_csv(conn: pyodbc.Connection, caminho_ficheiro: str, progress_callback=None) -> int:
+class _LeitorComOffset:
     """
-    Importa dados do neo.csv de forma OTIMIZADA (Bulk Insert).
-    progress_callback(current, total, elapsed_time_seconds)
+    Iterador de linhas de texto sobre um ficheiro aberto em modo binário.
+    Vai somando os bytes já consumidos em 'offset', o que permite estimar o
+    progresso sem ter de carregar (ou contar) o ficheiro inteiro antes.
     """
-    path = Path(caminho_ficheiro)
-    if not path.exists():
-        raise FileNotFoundError(f"Ficheiro '{path}' não encontrado.")
 
-    print("A ler ficheiro CSV...")
-    with path.open("r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f, delimiter=';')
-        linhas = list(reader)
+    def __init__(self, f_bin, encoding: str = "utf-8"):
+        self._f = f_bin
+        self._encoding = encoding
+        self.offset = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        linha = self._f.readline()
+        if not linha:
+            raise StopIteration
+        self.offset += len(linha)
+        return linha.decode(self._encoding)
+
+    def ler_linhas(self, n: int) -> tuple:
+        """
+        Lê até n linhas de uma vez, sem passar por __next__ linha a linha.
+        Devolve (linhas de texto, offset no fim de cada linha). Se o bloco
+        acabar a meio de um campo entre aspas (com quebras de linha lá
+        dentro), continua a ler até o fechar: o csv.reader nunca recebe um
+        registo cortado ao meio.
+        """
+        brutas = list(itertools.islice(self._f, n))
+        aspas = b"".join(brutas).count(b'"')
+        while aspas % 2:
+            linha = self._f.readline()
+            if not linha:
+                break
+            brutas.append(linha)
+            aspas += linha.count(b'"')
+        offsets = list(itertools.accumulate(map(len, brutas), initial=self.offset))
+        self.offset = offsets[-1]
+        return list(map(operator.methodcaller("decode", self._encoding), brutas)), offsets[1:]
+
+
+class _LoteAdaptativo:
+    """
+    Escolhe o tamanho dos lotes a partir da latência medida na BD.
+
+    Depois de cada lote gravado (escrita + commit) chama-se registar(linhas,
+    segundos); o próximo tamanho é o que, ao débito medido, demoraria
+    'latencia_alvo' segundos. Cada ajuste fica limitado a metade/dobro do
+    tamanho atual, e o tamanho fica sempre entre 'minimo' e 'maximo'.
+    Os lotes são enviados como um único parâmetro JSON, por isso o tamanho
+    não está sujeito ao limite de 2100 parâmetros do SQL Server.
+    """
 
-    if not linhas:
-        return 0
+    def __init__(self, inicial: int, minimo: int = 100, maximo: int = 50000,
+                 latencia_alvo: float = 1.0):
+        self.minimo = max(1, min(minimo, maximo))
+        self.maximo = maximo
+        self.latencia_alvo = latencia_alvo
+        self.tamanho = self._limitar(inicial)
+        self.historico = []  # (linhas, segundos)
+
+    def _limitar(self, tamanho: float) -> int:
+        return max(self.minimo, min(self.maximo, int(tamanho)))
+
+    def registar(self, linhas: int, segundos: float):
+        """Regista a duração de um lote e ajusta o tamanho do próximo."""
+        if linhas <= 0:
+            return
+        self.historico.append((linhas, segundos))
+        if segundos <= 0:
+            ideal = self.tamanho * 2
+        else:
+            ideal = linhas * self.latencia_alvo / segundos
+        ideal = max(self.tamanho / 2, min(self.tamanho * 2, ideal))
+        self.tamanho = self._limitar(ideal)
+
+    def resumo(self) -> str:
+        """Texto com os tamanhos usados e o débito, para o resumo da importação."""
+        if not self.historico:
+            return f"{self.tamanho} (sem lotes medidos)"
+        tamanhos = [n for n, _ in self.historico]
+        linhas = sum(tamanhos)
+        segundos = sum(t for _, t in self.historico)
+        debito = f"{linhas / segundos:.0f} linhas/s" if segundos > 0 else "n/d"
+        return (f"min {min(tamanhos)} | médio {linhas // len(tamanhos)} | "
+                f"max {max(tamanhos)} | final {self.tamanho} "
+                f"({len(tamanhos)} lotes, {debito} na BD)")
+
+
+def _estimar_total(processados: int, offset: int, tamanho: int) -> int:
+    """Estima o total de registos a partir da fração de bytes já lida."""
+    if offset <= 0 or processados <= 0:
+        return max(processados, 1)
+    return max(processados, int(processados * tamanho / offset))
+
+
+# Bytes lidos do início e do fim do ficheiro para a impressão digital
+_BYTES_IMPRESSAO = 1024 * 1024
+
+
+@functools.lru_cache(maxsize=8)
+def _hash_conteudo(caminho: str, tamanho: int, mtime_ns: int) -> str:
+    sha = hashlib.sha256(f"{tamanho}:{mtime_ns}:".encode("ascii"))
+    with open(caminho, "rb") as f:
+        sha.update(f.read(_BYTES_IMPRESSAO))
+        if tamanho > _BYTES_IMPRESSAO:
+            f.seek(max(_BYTES_IMPRESSAO, tamanho - _BYTES_IMPRESSAO))
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def _hash_ficheiro(path: Path) -> str:
+    """
+    Impressão digital do ficheiro, que o identifica no Import_Journal: SHA-256
+    do tamanho, do mtime e do primeiro e último MB do conteúdo. Não lê o
+    ficheiro inteiro (a GUI calcula-a antes de cada importação, para perguntar
+    se quer retomar) e muda sempre que o ficheiro é substituído ou alterado.
+    Num snapshot (pasta) é usado o meta.json, que inclui o hash da origem.
+    """
+    if path.is_dir():
+        path = path / snapshot.FICHEIRO_META
+    st = path.stat()
+    return _hash_conteudo(str(path.resolve()), st.st_size, st.st_mtime_ns)
 
-    total_linhas = len(linhas)
-    print(f"Total de registos a processar: {total_linhas}")
 
-    # Cache de classes orbitais
-    classes_map = _get_all_classes(conn)
-
-    # Configurar cursor para performance
+def obter_checkpoint(conn: pyodbc.Connection, caminho_ficheiro: str, tipo: str):
+    """
+    Devolve o último checkpoint de uma importação interrompida deste ficheiro
+    como (byte_offset, linhas_committed), ou None se não houver nada a retomar
+    (ficheiro nunca importado ou última importação concluída).
+    """
+    hash_ficheiro = _hash_ficheiro(Path(caminho_ficheiro))
     cur = conn.cursor()
-    cur.fast_executemany = True  # CRÍTICO para performance no SQL Server
+    try:
+        cur.execute(
+            """
+            SELECT TOP (1) byte_offset, linhas_committed, concluido
+            FROM dbo.Import_Journal
+            WHERE hash_ficheiro = ? AND tipo_ficheiro = ?
+            ORDER BY id_journal DESC;
+            """,
+            hash_ficheiro, tipo
+        )
+        row = cur.fetchone()
+    finally:
+        cur.close()
+
+    if row is None or row[2]:
+        return None
+    return int(row[0]), int(row[1])
 
-    # SQLs
-    sql_asteroide = """
-        INSERT INTO dbo.Asteroide (
-            id_csv_original, spkid, pdes, nome_completo, flag_neo, flag_pha, 
-            H_mag, diametro_km, albedo, moid_ua, moid_ld, id_classe_orbital
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+
+def _registar_checkpoint(cur, tipo: str, path: Path, hash_ficheiro: str,
+                         byte_offset: int, linhas: int, concluido: bool = False):
+    """
+    Regista no Import_Journal o ponto até onde o ficheiro está gravado.
+    Deve ser executado na mesma transação do lote, antes do commit, para que
+    o checkpoint e os dados fiquem gravados (ou perdidos) em conjunto.
     """
+    cur.execute(
+        """
+        INSERT INTO dbo.Import_Journal (
+            tipo_ficheiro, nome_ficheiro, hash_ficheiro,
+            byte_offset, linhas_committed, concluido
+        ) VALUES (?, ?, ?, ?, ?, ?);
+        """,
+        tipo, path.name[:255], hash_ficheiro, byte_offset, linhas, 1 if concluido else 0
+    )
+
+
+# Ordem dos campos de cada registo enviado para a BD (um registo por asteroide,
+# com os dados do Asteroide seguidos dos da Solucao_Orbital).
+_CAMPOS_REGISTO = (
+    "id_csv_original", "spkid", "pdes", "nome_completo", "flag_neo", "flag_pha",
+    "H_mag", "diametro_km", "albedo", "moid_ua", "moid_ld", "id_classe_orbital",
+    "epoca_jd", "excentricidade", "semi_eixo_maior_ua", "inclinacao_graus",
+    "nodo_asc_graus", "arg_perihelio_graus", "anomalia_media_graus", "rms",
+    "data_epoca", "hash_conteudo",
+)
+
+# Esquema OPENJSON de um lote: cada elemento é [idx, <_CAMPOS_REGISTO...>] e,
+# só na gravação com índice de designações, [..., id_existente, idx_ref].
+# Os tipos de texto são propositadamente mais largos que as colunas da tabela
+# para que um valor demasiado comprido dê erro no INSERT em vez de ser cortado.
+_OPENJSON_LOTE = """
+    OPENJSON(@lote) WITH (
+        idx                  INT            '$[0]',
+        id_csv_original      VARCHAR(400)   '$[1]',
+        spkid                BIGINT         '$[2]',
+        pdes                 VARCHAR(400)   '$[3]',
+        nome_completo        NVARCHAR(1000) '$[4]',
+        flag_neo             BIT            '$[5]',
+        flag_pha             BIT            '$[6]',
+        H_mag                FLOAT          '$[7]',
+        diametro_km          FLOAT          '$[8]',
+        albedo               FLOAT          '$[9]',
+        moid_ua              FLOAT          '$[10]',
+        moid_ld              FLOAT          '$[11]',
+        id_classe_orbital    INT            '$[12]',
+        epoca_jd             FLOAT          '$[13]',
+        excentricidade       FLOAT          '$[14]',
+        semi_eixo_maior_ua   FLOAT          '$[15]',
+        inclinacao_graus     FLOAT          '$[16]',
+        nodo_asc_graus       FLOAT          '$[17]',
+        arg_perihelio_graus  FLOAT          '$[18]',
+        anomalia_media_graus FLOAT          '$[19]',
+        rms                  FLOAT          '$[20]',
+        data_epoca           DATE           '$[21]',
+        hash_conteudo        BIGINT         '$[22]',
+        id_existente         INT            '$[23]',
+        idx_ref              INT            '$[24]'
+    )
+"""
+
 
-    sql_orbital = """
+def _sql_lote_asteroides(com_indice: bool) -> str:
+    """
+    Constrói o batch T-SQL que grava um lote de registos numa única ida à BD.
+
+    O MERGE com 'ON 1 = 0' é apenas um INSERT que, ao contrário do INSERT,
+    permite devolver no OUTPUT uma coluna da origem (src.idx). Assim cada
+    id_asteroide gerado fica associado à posição exata do registo no lote,
+    sem um segundo SELECT ... WHERE pdes IN (...).
+
+    Com com_indice=True (MPCORB) o cliente já sabe, pelo IndiceDesignacoes,
+    quais os asteroides que existem: id_existente traz o id deles, idx_ref
+    aponta para a linha do lote que cria um pdes repetido no próprio lote, e
+    só as restantes linhas são inseridas. O batch termina com um SELECT dos
+    ids novos (idx, id_asteroide) para o cliente atualizar o índice.
+    """
+    filtro = "WHERE id_existente IS NULL AND idx_ref IS NULL" if com_indice else ""
+    sql = f"""
+        SET NOCOUNT ON;
+        DECLARE @lote NVARCHAR(MAX) = ?;
+        DECLARE @ids TABLE (idx INT PRIMARY KEY, id_asteroide INT NOT NULL, novo BIT NOT NULL);
+
+        MERGE dbo.Asteroide AS a
+        USING (SELECT * FROM {_OPENJSON_LOTE} {filtro}) AS src
+        ON 1 = 0
+        WHEN NOT MATCHED THEN
+            INSERT (
+                id_csv_original, spkid, pdes, nome_completo, flag_neo, flag_pha,
+                H_mag, diametro_km, albedo, moid_ua, moid_ld, id_classe_orbital,
+                hash_conteudo
+            )
+            VALUES (
+                src.id_csv_original, src.spkid, src.pdes, src.nome_completo,
+                src.flag_neo, src.flag_pha, src.H_mag, src.diametro_km,
+                src.albedo, src.moid_ua, src.moid_ld, src.id_classe_orbital,
+                src.hash_conteudo
+            )
+        OUTPUT src.idx, INSERTED.id_asteroide, 1 INTO @ids (idx, id_asteroide, novo);
+    """
+    if com_indice:
+        sql += f"""
+        INSERT INTO @ids (idx, id_asteroide, novo)
+        SELECT src.idx, src.id_existente, 0
+        FROM {_OPENJSON_LOTE} AS src
+        WHERE src.id_existente IS NOT NULL;
+
+        INSERT INTO @ids (idx, id_asteroide, novo)
+        SELECT src.idx, i.id_asteroide, 0
+        FROM {_OPENJSON_LOTE} AS src
+        JOIN @ids AS i ON i.idx = src.idx_ref
+        WHERE src.idx_ref IS NOT NULL;
+    """
+    sql += f"""
         INSERT INTO dbo.Solucao_Orbital (
-            id_asteroide, epoca_jd, excentricidade, semi_eixo_maior_ua, 
-            inclinacao_graus, nodo_asc_graus, arg_perihelio_graus, 
-            anomalia_media_graus, moid_ua, moid_ld, rms, 
+            id_asteroide, epoca_jd, excentricidade, semi_eixo_maior_ua,
+            inclinacao_graus, nodo_asc_graus, arg_perihelio_graus,
+            anomalia_media_graus, moid_ua, moid_ld, rms,
             solucao_atual, origem, data_epoca
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, 'neo.csv', ?)
+        )
+        SELECT
+            ids.id_asteroide, src.epoca_jd, src.excentricidade, src.semi_eixo_maior_ua,
+            src.inclinacao_graus, src.nodo_asc_graus, src.arg_perihelio_graus,
+            src.anomalia_media_graus, src.moid_ua, src.moid_ld, src.rms,
+            1, ?, src.data_epoca
+        FROM {_OPENJSON_LOTE} AS src
+        JOIN @ids AS ids ON ids.idx = src.idx
+        WHERE src.epoca_jd IS NOT NULL
+          AND src.excentricidade IS NOT NULL
+          AND src.semi_eixo_maior_ua IS NOT NULL;
     """
+    if com_indice:
+        sql += """
+        SELECT idx, id_asteroide FROM @ids WHERE novo = 1;
+    """
+    return sql
 
-    BATCH_SIZE = 5000
-    batch_asteroides = []
-    batch_pdes = []
-    batch_orbital_data = {}  # pdes -> dados orbitais
 
-    inseridos = 0
-    erros = 0
-    
-    import time
-    start_time = time.time()
+_SQL_LOTE_INSERIR = _sql_lote_asteroides(com_indice=False)
+_SQL_LOTE_COM_INDICE = _sql_lote_asteroides(com_indice=True)
+
+
+def _serializar_lote(registos: list) -> str:
+    """Serializa o lote em JSON compacto: [[idx, campos...], ...]."""
+    # allow_nan=False: um NaN vindo do ficheiro faz falhar o lote em vez de
+    # gerar JSON inválido do lado do SQL Server.
+    return json.dumps(
+        [[i, *r] for i, r in enumerate(registos)],
+        separators=(",", ":"),
+        allow_nan=False,
+    )
+
+
+def _gravar_lote_asteroides(cur, registos: list, origem: str):
+    """
+    Grava um lote de registos (Asteroide + Solucao_Orbital) numa só ida à BD.
+    Não faz commit.
+    """
+    cur.execute(_SQL_LOTE_INSERIR, _serializar_lote(registos), origem)
+
+
+def _gravar_lote_com_indice(cur, registos: list, origem: str, indice: IndiceDesignacoes) -> int:
+    """
+    Como _gravar_lote_asteroides, mas os pdes que já existem (segundo o
+    índice) reutilizam o id_asteroide e só é criada uma nova solução orbital.
+    A existência é resolvida no cliente, sem consultas à BD; os ids dos
+    asteroides novos voltam no próprio batch e entram logo no índice.
+    Não faz commit. Devolve o número de asteroides novos.
+    """
+    lote = []
+    primeira_linha = {}  # pdes novo -> idx da linha do lote que o cria
+    for i, r in enumerate(registos):
+        pdes = r[2]
+        id_existente = indice.get(pdes)
+        idx_ref = None
+        if id_existente is None:
+            idx_ref = primeira_linha.get(pdes)
+            if idx_ref is None:
+                primeira_linha[pdes] = i
+        lote.append([i, *r, id_existente, idx_ref])
+
+    cur.execute(
+        _SQL_LOTE_COM_INDICE,
+        json.dumps(lote, separators=(",", ":"), allow_nan=False),
+        origem,
+    )
+    novos = cur.fetchall()
+    # Só depois de o batch correr sem erros é que o índice é atualizado
+    for idx, id_asteroide in novos:
+        indice.adicionar(registos[idx][2], id_asteroide)
+    return len(novos)
+
+
+# Upsert set-based: o lote é carregado para uma tabela de staging (#stg_neo) e
+# um único MERGE atualiza os asteroides que mudaram e insere os novos. A solução
+# orbital atual só é rodada quando os elementos orbitais mudaram de facto, pelo
+# que reimportar o mesmo ficheiro não cria novas linhas.
+_SQL_LOTE_UPSERT = f"""
+    SET NOCOUNT ON;
+    DECLARE @lote NVARCHAR(MAX) = ?;
+    DECLARE @origem VARCHAR(50) = ?;
+    DECLARE @acoes TABLE (acao NVARCHAR(10) NOT NULL);
+
+    SELECT * INTO #stg_neo FROM {_OPENJSON_LOTE};
+    CREATE CLUSTERED INDEX IX_stg_neo_pdes ON #stg_neo (pdes, idx);
+
+    -- Se o mesmo pdes aparecer mais do que uma vez no lote, fica a última linha
+    DELETE s
+    FROM #stg_neo AS s
+    WHERE EXISTS (SELECT 1 FROM #stg_neo AS s2 WHERE s2.pdes = s.pdes AND s2.idx > s.idx);
+    DECLARE @repetidos INT = @@ROWCOUNT;
+
+    MERGE dbo.Asteroide AS a
+    USING #stg_neo AS src
+    ON a.pdes = src.pdes
+    WHEN MATCHED AND EXISTS (
+        SELECT a.id_csv_original, a.spkid, a.nome_completo, a.flag_neo, a.flag_pha,
+               a.H_mag, a.diametro_km, a.albedo, a.moid_ua, a.moid_ld, a.id_classe_orbital,
+               a.hash_conteudo
+        EXCEPT
+        SELECT src.id_csv_original, src.spkid, src.nome_completo, src.flag_neo, src.flag_pha,
+               src.H_mag, src.diametro_km, src.albedo, src.moid_ua, src.moid_ld, src.id_classe_orbital,
+               src.hash_conteudo
+    ) THEN
+        UPDATE SET
+            id_csv_original   = src.id_csv_original,
+            spkid             = src.spkid,
+            nome_completo     = src.nome_completo,
+            flag_neo          = src.flag_neo,
+            flag_pha          = src.flag_pha,
+            H_mag             = src.H_mag,
+            diametro_km       = src.diametro_km,
+            albedo            = src.albedo,
+            moid_ua           = src.moid_ua,
+            moid_ld           = src.moid_ld,
+            id_classe_orbital = src.id_classe_orbital,
+            hash_conteudo     = src.hash_conteudo
+    WHEN NOT MATCHED THEN
+        INSERT (
+            id_csv_original, spkid, pdes, nome_completo, flag_neo, flag_pha,
+            H_mag, diametro_km, albedo, moid_ua, moid_ld, id_classe_orbital,
+            hash_conteudo
+        )
+        VALUES (
+            src.id_csv_original, src.spkid, src.pdes, src.nome_completo,
+            src.flag_neo, src.flag_pha, src.H_mag, src.diametro_km,
+            src.albedo, src.moid_ua, src.moid_ld, src.id_classe_orbital,
+            src.hash_conteudo
+        )
+    OUTPUT $action INTO @acoes (acao);
+
+    -- Asteroides cuja solução orbital atual não existe ou é diferente da nova
+    SELECT a.id_asteroide, src.*
+    INTO #rodar
+    FROM #stg_neo AS src
+    JOIN dbo.Asteroide AS a ON a.pdes = src.pdes
+    WHERE src.epoca_jd IS NOT NULL
+      AND src.excentricidade IS NOT NULL
+      AND src.semi_eixo_maior_ua IS NOT NULL
+      AND NOT EXISTS (
+            SELECT 1
+            FROM dbo.Solucao_Orbital AS so
+            WHERE so.id_asteroide = a.id_asteroide
+              AND so.solucao_atual = 1
+              AND EXISTS (
+                    SELECT so.epoca_jd, so.excentricidade, so.semi_eixo_maior_ua,
+                           so.inclinacao_graus, so.nodo_asc_graus, so.arg_perihelio_graus,
+                           so.anomalia_media_graus, so.moid_ua, so.moid_ld, so.rms
+                    INTERSECT
+                    SELECT src.epoca_jd, src.excentricidade, src.semi_eixo_maior_ua,
+                           src.inclinacao_graus, src.nodo_asc_graus, src.arg_perihelio_graus,
+                           src.anomalia_media_graus, src.moid_ua, src.moid_ld, src.rms
+              )
+      );
+
+    -- Rodar: a solução anterior deixa de ser a atual antes de inserir a nova
+    UPDATE so
+    SET solucao_atual = 0
+    FROM dbo.Solucao_Orbital AS so
+    JOIN #rodar AS r ON r.id_asteroide = so.id_asteroide
+    WHERE so.solucao_atual = 1;
+
+    INSERT INTO dbo.Solucao_Orbital (
+        id_asteroide, epoca_jd, excentricidade, semi_eixo_maior_ua,
+        inclinacao_graus, nodo_asc_graus, arg_perihelio_graus,
+        anomalia_media_graus, moid_ua, moid_ld, rms,
+        solucao_atual, origem, data_epoca
+    )
+    SELECT
+        r.id_asteroide, r.epoca_jd, r.excentricidade, r.semi_eixo_maior_ua,
+        r.inclinacao_graus, r.nodo_asc_graus, r.arg_perihelio_graus,
+        r.anomalia_media_graus, r.moid_ua, r.moid_ld, r.rms,
+        1, @origem, r.data_epoca
+    FROM #rodar AS r;
+
+    -- As linhas do staging sem ação no MERGE já existiam iguais (sem alterações)
+    SELECT
+        (SELECT COUNT(*) FROM @acoes WHERE acao = 'INSERT')         AS inseridos,
+        (SELECT COUNT(*) FROM @acoes WHERE acao = 'UPDATE')         AS atualizados,
+        (SELECT COUNT(*) FROM #stg_neo) - (SELECT COUNT(*) FROM @acoes) AS sem_alteracoes,
+        @repetidos                                                  AS repetidos,
+        (SELECT COUNT(*) FROM #rodar)                               AS orbitas_rodadas;
+
+    DROP TABLE #rodar;
+    DROP TABLE #stg_neo;
+"""
+
+
+def _gravar_lote_upsert(cur, registos: list, origem: str) -> tuple:
+    """
+    Upsert de um lote numa só ida à BD (staging + MERGE). Não faz commit.
+    Devolve (inseridos, atualizados, sem_alteracoes, repetidos, orbitas_rodadas),
+    em que 'repetidos' são as linhas substituídas por outra do mesmo pdes mais
+    abaixo no lote; as quatro primeiras somam len(registos).
+    """
+    cur.execute(_SQL_LOTE_UPSERT, _serializar_lote(registos), origem)
+    row = cur.fetchone()
+    return tuple(int(v) for v in row)
+
 
-    print("A iniciar inserção em lote...")
+# Erros que podem ser causados por uma linha concreta do ficheiro (valor
+# demasiado comprido, data inválida, NaN, FK...). Outros erros (ligação perdida,
+# timeout) não são isolados: a importação pára e pode ser retomada.
+_ERROS_DE_DADOS = (
+    pyodbc.DataError,
+    pyodbc.IntegrityError,
+    pyodbc.ProgrammingError,
+    ValueError,
+    TypeError,
+)
 
-    for idx, row in enumerate(linhas, start=1):
+
+# Ponto de gravação antes de cada pedaço da bisseção. Com autocommit
+# desligado pode ainda não haver transação aberta (o lote inteiro falhou e
+# foi desfeito), e o SAVE TRANSACTION precisa de uma.
+_SQL_PONTO_BISSECAO = """
+    IF @@TRANCOUNT = 0 BEGIN TRANSACTION;
+    SAVE TRANSACTION bissecao;
+"""
+
+
+def _gravar_parte(conn, gravar, parte: list):
+    """
+    Grava um pedaço do lote depois de um SAVE TRANSACTION. Se falhar por causa
+    dos dados, desfaz só esse pedaço (ROLLBACK até ao savepoint) e devolve o
+    erro; o que já foi gravado antes no lote continua na transação.
+    Devolve None se o pedaço foi gravado.
+
+    Alguns erros anulam a transação inteira (XACT_STATE() <> 1); nesse caso
+    os pedaços anteriores perderam-se também e a importação tem de parar
+    (pode ser retomada do último checkpoint, que não inclui este lote).
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(_SQL_PONTO_BISSECAO)
         try:
-            # --- PREPARAR DADOS ASTEROIDE ---
-            pdes = row.get("pdes", "").strip()
-            if not pdes:
-                continue
+            gravar(parte)
+            return None
+        except _ERROS_DE_DADOS as e:
+            cur.execute("SELECT XACT_STATE();")
+            if cur.fetchone()[0] != 1:
+                conn.rollback()
+                raise RuntimeError(
+                    f"O erro anulou a transação do lote, que foi desfeito: {e}"
+                ) from e
+            cur.execute("ROLLBACK TRANSACTION bissecao;")
+            return e
+    finally:
+        cur.close()
 
-            # Resolver Classe Orbital
-            classe_cod = row.get("class", "").strip()
-            id_classe = None
-            if classe_cod:
-                if classe_cod in classes_map:
-                    id_classe = classes_map[classe_cod]
-                else:
-                    # Criar nova classe on-the-fly (raro)
-                    id_classe = _create_classe_orbital(
-                        conn, classe_cod, row.get("class_description", "")
-                    )
-                    classes_map[classe_cod] = id_classe
-                    conn.commit()
 
-            # Dados Asteroide
-            ast_tuple = (
-                row.get("id", "").strip(),
-                _safe_int(row.get("spkid", "")),
-                pdes,
-                (row.get("full_name") or row.get("name") or "").strip(),
-                1 if row.get("neo", "").strip().upper() == "Y" else 0,
-                1 if row.get("pha", "").strip().upper() == "Y" else 0,
-                _safe_float(row.get("h")),
-                _safe_float(row.get("diameter")),
-                _safe_float(row.get("albedo")),
-                _safe_float(row.get("moid")),
-                _safe_float(row.get("moid_ld")),
-                id_classe
+def _bissecar_lote(conn, gravar, registos: list, linhas: list, rejeitados: list) -> int:
+    """
+    Grava 'registos' dividindo-os ao meio sempre que um pedaço falha, até
+    isolar as linhas problemáticas (que vão para 'rejeitados'). Cada pedaço
+    é isolado com um savepoint (ver _gravar_parte) e nada é confirmado aqui:
+    o chamador faz um único commit com as rejeições e o checkpoint, para que
+    uma importação retomada não volte a gravar metade do lote.
+    Devolve o número de registos gravados.
+    """
+    if len(registos) == 1:
+        erro = _gravar_parte(conn, gravar, registos)
+        if erro is None:
+            return 1
+        rejeitados.append((linhas[0], registos[0], str(erro)))
+        return 0
+
+    meio = len(registos) // 2
+    gravados = 0
+    for parte, linhas_parte in ((registos[:meio], linhas[:meio]), (registos[meio:], linhas[meio:])):
+        if _gravar_parte(conn, gravar, parte) is None:
+            gravados += len(parte)
+        else:
+            gravados += _bissecar_lote(conn, gravar, parte, linhas_parte, rejeitados)
+    return gravados
+
+
+def _gravar_lote_isolando_erros(conn, gravar, registos: list, linhas: list) -> tuple:
+    """
+    Tenta gravar o lote inteiro com gravar(registos). Se falhar por causa dos
+    dados, isola as linhas más por bisseção em vez de deitar fora o lote todo.
+
+    NÃO faz commit em nenhum dos casos: o chamador confirma o lote junto com
+    as rejeições e o checkpoint. Devolve (gravados, rejeitados) com
+    rejeitados como lista de (num_linha, registo, erro).
+    """
+    try:
+        gravar(registos)
+        return len(registos), []
+    except _ERROS_DE_DADOS as erro_lote:
+        # O lote é a única coisa na transação (o anterior já foi confirmado)
+        conn.rollback()
+        rejeitados = []
+        gravados = _bissecar_lote(conn, gravar, registos, linhas, rejeitados)
+        if gravados == 0 and len(registos) > 1:
+            # Nenhuma linha passa: o problema não é dos dados, é sistemático
+            conn.rollback()
+            raise erro_lote
+        return gravados, rejeitados
+
+
+def _registar_rejeicoes(cur, tipo: str, path: Path, rejeitados: list):
+    """Guarda as linhas rejeitadas (num_linha, conteúdo, erro) em Import_Rejects."""
+    if not rejeitados:
+        return
+    for num_linha, conteudo, erro in rejeitados:
+        print(f"[REJEITADA] Linha {num_linha}: {erro}")
+    cur.executemany(
+        """
+        INSERT INTO dbo.Import_Rejects (
+            tipo_ficheiro, nome_ficheiro, num_linha, erro, conteudo
+        ) VALUES (?, ?, ?, ?, ?);
+        """,
+        [
+            (
+                tipo, path.name[:255], num_linha, erro[:1000],
+                conteudo if isinstance(conteudo, str)
+                else json.dumps(conteudo, ensure_ascii=False, default=str),
             )
+            for num_linha, conteudo, erro in rejeitados
+        ]
+    )
 
-            # --- PREPARAR DADOS ORBITAIS ---
-            orb_data = {
-                'epoca_jd': _safe_float(row.get("epoch")),
-                'e': _safe_float(row.get("e")),
-                'a': _safe_float(row.get("a")),
-                'i': _safe_float(row.get("i")),
-                'om': _safe_float(row.get("om")),
-                'w': _safe_float(row.get("w")),
-                'ma': _safe_float(row.get("ma")),
-                'moid_ua': _safe_float(row.get("moid")),
-                'moid_ld': _safe_float(row.get("moid_ld")),
-                'rms': _safe_float(row.get("rms")),
-                'data_epoca': _safe_date(row.get("epoch_cal"))
-            }
-
-            batch_asteroides.append(ast_tuple)
-            batch_pdes.append(pdes)
-            batch_orbital_data[pdes] = orb_data
 
-            # --- PROCESSAR BATCH ---
-            if len(batch_asteroides) >= BATCH_SIZE:
-                # 1. Inserir Asteroides
-                cur.executemany(sql_asteroide, batch_asteroides)
-
-                # 2. Recuperar IDs gerados
-                placeholders = ','.join(['?'] * len(batch_pdes))
-                cur.execute(
-                    f"SELECT pdes, id_asteroide FROM dbo.Asteroide "
-                    f"WHERE pdes IN ({placeholders})",
-                    batch_pdes
-                )
-                pdes_to_id = {r[0]: r[1] for r in cur.fetchall()}
-
-                # 3. Preparar Batch Orbital
-                batch_solucoes = []
-                for pdes_key in batch_pdes:
-                    if pdes_key in pdes_to_id:
-                        id_ast = pdes_to_id[pdes_key]
-                        d = batch_orbital_data[pdes_key]
-
-                        if d['epoca_jd'] and d['e'] is not None and d['a'] is not None:
-                            batch_solucoes.append(
-                                (
-                                    id_ast, d['epoca_jd'], d['e'], d['a'], d['i'],
-                                    d['om'], d['w'], d['ma'], d['moid_ua'],
-                                    d['moid_ld'], d['rms'], d['data_epoca']
-                                )
-                            )
+def _fechar_lote(conn, cur, gravar, registos: list, linhas: list, rejeitados_previos: list,
+                 tipo: str, path: Path, hash_ficheiro: str, byte_offset: int,
+                 linhas_antes: int, concluido: bool = False) -> tuple:
+    """
+    Grava um lote (isolando linhas más), regista as rejeições e o checkpoint
+    e faz um único commit de tudo. Devolve (gravados, n_rejeitados).
+    """
+    gravados, rejeitados = (
+        _gravar_lote_isolando_erros(conn, gravar, registos, linhas) if registos else (0, [])
+    )
+    rejeitados = rejeitados_previos + rejeitados
+    _registar_rejeicoes(cur, tipo, path, rejeitados)
+    _registar_checkpoint(
+        cur, tipo, path, hash_ficheiro, byte_offset, linhas_antes + gravados, concluido
+    )
+    conn.commit()
+    return gravados, len(rejeitados)
 
-                # 4. Inserir Soluções
-                if batch_solucoes:
-                    cur.executemany(sql_orbital, batch_solucoes)
 
-                # 5. Commit e Limpeza
-                conn.commit()
-                inseridos += len(batch_asteroides)
-                
-                elapsed = time.time() - start_time
-                if progress_callback:
-                    progress_callback(inseridos, total_linhas, elapsed)
-                else:
-                    print(
-                        f"  Progresso: {inseridos}/{total_linhas} "
-                        f"({(inseridos/total_linhas)*100:.1f}%)"
-                    )
+# Colunas do neo.csv que entram no hash de conteúdo (as que são importadas)
+_COLUNAS_HASH_NEO = (
+    "id", "spkid", "pdes", "full_name", "name", "neo", "pha", "h", "diameter",
+    "albedo", "moid", "moid_ld", "class", "epoch", "e", "a", "i", "om", "w",
+    "ma", "rms", "epoch_cal",
+)
+
+
+def _hash_linha(valores) -> int:
+    """
+    Hash compacto (64 bits, com sinal para caber num BIGINT) do texto das
+    colunas importadas de uma linha. Serve para a importação incremental
+    saber, sem ir à BD, se uma linha mudou desde a última importação.
+
+    É calculado sobre o texto original (e não sobre os valores convertidos)
+    para ser igual em todos os modos de leitura e barato de calcular.
+    """
+    digest = hashlib.blake2b("\x1f".join(valores).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
 
-                batch_asteroides = []
-                batch_pdes = []
-                batch_orbital_data = {}
 
+def _hash_linhas(colunas) -> list:
+    """
+    _hash_linha de todas as linhas de um bloco, dadas as colunas: a mesma
+    conta, mas encadeada com map (sem uma chamada de função Python por linha).
+    """
+    textos = map(str.encode, map("\x1f".join, zip(*colunas)))
+    digests = map(functools.partial(hashlib.blake2b, digest_size=8), textos)
+    return list(map(
+        functools.partial(int.from_bytes, byteorder="big", signed=True),
+        map(operator.methodcaller("digest"), digests),
+    ))
+
+
+def _registo_neo(row: dict, id_classe) -> tuple:
+    """Converte uma linha do neo.csv num registo pela ordem de _CAMPOS_REGISTO."""
+    moid = _safe_float(row.get("moid"))
+    moid_ld = _safe_float(row.get("moid_ld"))
+    campos = (
+        row.get("id", "").strip(),
+        _safe_int(row.get("spkid", "")),
+        row.get("pdes", "").strip(),
+        (row.get("full_name") or row.get("name") or "").strip(),
+        1 if row.get("neo", "").strip().upper() == "Y" else 0,
+        1 if row.get("pha", "").strip().upper() == "Y" else 0,
+        _safe_float(row.get("h")),
+        _safe_float(row.get("diameter")),
+        _safe_float(row.get("albedo")),
+        moid,
+        moid_ld,
+        id_classe,
+        _safe_float(row.get("epoch")),
+        _safe_float(row.get("e")),
+        _safe_float(row.get("a")),
+        _safe_float(row.get("i")),
+        _safe_float(row.get("om")),
+        _safe_float(row.get("w")),
+        _safe_float(row.get("ma")),
+        _safe_float(row.get("rms")),
+        _safe_date(row.get("epoch_cal")),
+    )
+    hash_conteudo = _hash_linha([row.get(c) or "" for c in _COLUNAS_HASH_NEO])
+    return campos + (hash_conteudo,)
+
+
+# Colunas numéricas do neo.csv convertidas de uma vez no modo colunar
+_COLUNAS_NEO_NUMERICAS = (
+    "h", "diameter", "albedo", "moid", "moid_ld", "epoch",
+    "e", "a", "i", "om", "w", "ma", "rms",
+)
+
+
+def _por_valor(coluna, funcao) -> list:
+    """
+    funcao(v) para cada valor de uma coluna, calculada uma só vez por valor
+    distinto (flags, classes e datas de época repetem-se muito).
+    """
+    valores = {v: funcao(v) for v in set(coluna)}
+    return list(map(valores.__getitem__, coluna))
+
+
+def _flag_sim(valor: str) -> int:
+    return 1 if valor.strip().upper() == "Y" else 0
+
+
+def _registos_neo_bloco(cabecalho: list, linhas: list) -> list:
+    """
+    Versão colunar de _registo_neo para um bloco de linhas (listas do
+    csv.reader): as colunas numéricas são todas convertidas com NumPy numa só
+    passagem (ver services/colunar.py) e as de texto com map/zip, sem código
+    Python por linha; os tuplos são montados diretamente a partir das colunas.
+
+    Devolve uma lista alinhada com 'linhas' (None nas linhas sem pdes). Tal
+    como em _linhas_neo_dict, a posição id_classe_orbital leva o código da
+    classe, que é resolvido para id depois.
+    """
+    # Transpor o bloco: uma tupla de valores por coluna do ficheiro. O zip
+    # pára na linha mais curta: se alguma tiver menos campos que o cabeçalho,
+    # o zip_longest (mais lento) completa-a com "" nos que faltam
+    completas = set(map(len, linhas)) == {len(cabecalho)}
+    transpor = zip if completas else functools.partial(itertools.zip_longest, fillvalue="")
+    colunas = dict(zip(cabecalho, transpor(*linhas)))
+    vazio = ("",) * len(linhas)
+
+    def texto(nome):
+        return colunas.get(nome, vazio)
+
+    (h, diametro, albedo, moid, moid_ld, epoca,
+     e, a, i, om, w, ma, rms) = colunar.colunas_float(
+        [texto(nome) for nome in _COLUNAS_NEO_NUMERICAS]
+    )
+    spkid = colunar.para_lista(colunar.para_float64(texto("spkid")), inteiro=True)
+
+    pdes = list(map(str.strip, texto("pdes")))
+    full_name = texto("full_name")
+    nomes = list(map(str.strip, full_name))
+    if "" in full_name:
+        # Sem full_name usa-se o name (raro: só estas linhas passam por Python)
+        name = texto("name")
+        for k, f in enumerate(full_name):
+            if not f:
+                nomes[k] = name[k].strip()
+    flag_neo = _por_valor(texto("neo"), _flag_sim)
+    flag_pha = _por_valor(texto("pha"), _flag_sim)
+    classes = _por_valor(texto("class"), str.strip)
+    datas = _por_valor(texto("epoch_cal"), _safe_date)
+    hashes = _hash_linhas([texto(c) for c in _COLUNAS_HASH_NEO])
+
+    registos = list(zip(
+        map(str.strip, texto("id")), spkid, pdes, nomes, flag_neo, flag_pha,
+        h, diametro, albedo, moid, moid_ld, classes,
+        epoca, e, a, i, om, w, ma, rms, datas, hashes,
+    ))
+    # Linhas sem pdes são ignoradas (como no modo linha a linha)
+    if "" in pdes:
+        for k, p in enumerate(pdes):
+            if not p:
+                registos[k] = None
+    return registos
+
+
+def _linhas_neo_dict(reader, leitor: _LeitorComOffset, base_linhas: int):
+    """
+    Percorre o neo.csv linha a linha (csv.DictReader) e gera
+    (num_linha, byte_offset, conteudo, registo, descricao_classe, erro).
+
+    Em 'registo' a posição id_classe_orbital leva o código da classe (o id
+    só é resolvido no ciclo principal); 'erro' fica preenchido se a linha
+    não puder ser convertida.
+    """
+    for row in reader:
+        num_linha = base_linhas + reader.line_num
+        try:
+            if not (row.get("pdes") or "").strip():
+                continue
+            classe_cod = (row.get("class") or "").strip()
+            registo, erro = _registo_neo(row, classe_cod), None
         except Exception as e:
-            erros += 1
-            print(f"[ERRO] Linha {idx}: {e}")
-            conn.rollback()
-            batch_asteroides = []
-            batch_pdes = []
-            batch_orbital_data = {}
+            registo, erro = None, e
+        yield num_linha, leitor.offset, row, registo, row.get("class_description") or "", erro
 
-    # --- PROCESSAR RESTANTE ---
-    if batch_asteroides:
+
+def _linhas_neo_colunar(leitor: _LeitorComOffset, cabecalho: list, base_linhas: int,
+                        tamanho_bloco: int = 20000):
+    """
+    Igual a _linhas_neo_dict, mas lê blocos de 'tamanho_bloco' linhas de uma
+    vez (_LeitorComOffset.ler_linhas), separa os campos com csv.reader e
+    converte-os com _registos_neo_bloco. O byte offset do fim de cada linha
+    vem com o bloco, para os checkpoints continuarem exatos. O cabeçalho já
+    foi lido; 'base_linhas' são as linhas saltadas antes dele ao retomar.
+    """
+    idx_desc = cabecalho.index("class_description") if "class_description" in cabecalho else None
+    lidas = base_linhas + 1  # linhas do ficheiro já lidas (com o cabeçalho)
+    while True:
+        # Ler e converter um bloco cria centenas de milhares de objetos que
+        # ficam todos vivos: o garbage collector só atrasaria (ficava a
+        # percorrê-los vezes sem conta), por isso fica parado durante o bloco.
+        gc_ativo = gc.isenabled()
+        gc.disable()
         try:
-            cur.executemany(sql_asteroide, batch_asteroides)
+            texto, fins = leitor.ler_linhas(tamanho_bloco)
+            if not texto:
+                return
+            reader = csv.reader(texto, delimiter=';')
+            linhas = list(reader)
+            if reader.line_num == len(linhas):
+                # Um registo por linha (o normal)
+                nums = range(lidas + 1, lidas + 1 + len(linhas))
+                offsets = fins
+            else:
+                # Há campos com quebras de linha: cada registo fica com o nº
+                # e o offset da sua última linha, como no modo linha a linha
+                reader = csv.reader(texto, delimiter=';')
+                linhas, ultimas = [], []
+                for row in reader:
+                    linhas.append(row)
+                    ultimas.append(reader.line_num)
+                nums = [lidas + u for u in ultimas]
+                offsets = [fins[u - 1] for u in ultimas]
+            lidas += reader.line_num
 
-            placeholders = ','.join(['?'] * len(batch_pdes))
-            cur.execute(
-                f"SELECT pdes, id_asteroide FROM dbo.Asteroide "
-                f"WHERE pdes IN ({placeholders})",
-                batch_pdes
+            try:
+                registos = _registos_neo_bloco(cabecalho, linhas)
+            except Exception:
+                # Bloco com algo inesperado: converter linha a linha para isolar o erro
+                registos = None
+        finally:
+            if gc_ativo:
+                gc.enable()
+
+        if registos is not None:
+            if idx_desc is None:
+                descricoes = itertools.repeat("")
+            else:
+                try:
+                    descricoes = list(map(operator.itemgetter(idx_desc), linhas))
+                except IndexError:
+                    descricoes = [row[idx_desc] if idx_desc < len(row) else "" for row in linhas]
+            gerados = zip(nums, offsets, linhas, registos, descricoes, itertools.repeat(None))
+            if None in registos:
+                # Linhas sem pdes: não são importadas
+                gerados = itertools.compress(gerados, map(operator.is_not, registos,
+                                                          itertools.repeat(None)))
+            yield from gerados
+            continue
+
+        for k, row in enumerate(linhas):
+            descricao = row[idx_desc] if idx_desc is not None and idx_desc < len(row) else ""
+            conteudo = dict(zip(cabecalho, row))
+            try:
+                if not (conteudo.get("pdes") or "").strip():
+                    continue
+                classe_cod = (conteudo.get("class") or "").strip()
+                registo, erro = _registo_neo(conteudo, classe_cod), None
+            except Exception as e:
+                registo, erro = None, e
+            yield nums[k], offsets[k], conteudo, registo, descricao, erro
+
+
+def _carregar_hashes(conn: pyodbc.Connection) -> dict:
+    """
+    Carrega {pdes: hash_conteudo} de todos os asteroides, em blocos, para a
+    importação incremental comparar cada linha sem ir à BD.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT pdes, hash_conteudo FROM dbo.Asteroide;")
+    hashes = {}
+    while True:
+        rows = cur.fetchmany(50000)
+        if not rows:
+            break
+        for pdes, hash_conteudo in rows:
+            hashes[pdes] = hash_conteudo
+    cur.close()
+    return hashes
+
+
+def importar_neo_csv(conn: pyodbc.Connection, caminho_ficheiro: str, progress_callback=None,
+                     upsert: bool = False, retomar: bool = False,
+                     incremental: bool = False, colunar: bool = False) -> int:
+    """
+    Importa dados do neo.csv de forma OTIMIZADA (Bulk Insert).
+
+    O ficheiro é lido em streaming: cada linha é convertida e enviada para a BD
+    em lotes (de tamanho ajustado por _LoteAdaptativo), sem nunca carregar o
+    CSV inteiro para memória.
+    Como o número de linhas não é conhecido à partida, o 'total' passado ao
+    callback é uma estimativa feita a partir dos bytes já lidos.
+
+    Com upsert=True os asteroides já existentes (mesmo pdes) são atualizados em
+    vez de duplicados, e a solução orbital atual só é substituída quando os
+    elementos orbitais mudaram (ver _SQL_LOTE_UPSERT).
+
+    Cada lote regista um checkpoint no Import_Journal (hash do ficheiro, byte
+    offset e linhas processadas). Com retomar=True, uma importação interrompida
+    deste mesmo ficheiro continua a partir do último checkpoint; o 'current'
+    do callback inclui as linhas já processadas antes.
+
+    Com incremental=True (implica upsert) cada linha é comparada com o
+    hash_conteudo guardado para o seu pdes e só as linhas novas ou alteradas
+    são enviadas para a BD; as restantes contam como "sem alterações".
+
+    Com colunar=True as linhas são lidas e convertidas por blocos, as colunas
+    numéricas com NumPy (ver _registos_neo_bloco); o resultado é igual ao do
+    modo linha a linha. Só a conversão fica mais barata: o tempo total da
+    importação, dominado pelo csv, pelo hash e pelo envio dos lotes, não
+    muda de forma mensurável, por isso não é o modo por omissão.
+
+    progress_callback(current, total, elapsed_time_seconds), com 'current' o nº
+    de linhas processadas (gravadas, sem alterações ou rejeitadas à parte).
+
+    Devolve o nº de registos gravados de facto nesta execução: os inseridos e,
+    com upsert, também os atualizados (as linhas sem alterações não contam).
+    """
+    path = Path(caminho_ficheiro)
+    if not path.exists():
+        raise FileNotFoundError(f"Ficheiro '{path}' não encontrado.")
+
+    # Tamanho do conteúdo (descomprimido, se for .gz/.bz2/.xz/.zip)
+    tamanho_ficheiro = ficheiros.tamanho_dados(path)
+    if tamanho_ficheiro == 0:
+        return 0
+
+    hash_ficheiro = _hash_ficheiro(path)
+    checkpoint = obter_checkpoint(conn, caminho_ficheiro, 'neo.csv') if retomar else None
+    offset_inicial, linhas_anteriores = checkpoint or (0, 0)
+    if checkpoint:
+        print(f"A retomar importação: {linhas_anteriores} registos já gravados "
+              f"(byte {offset_inicial}).")
+
+    # Cache de classes orbitais
+    classes_map = _get_all_classes(conn)
+
+    # Hashes das linhas já importadas (modo incremental)
+    hashes = None
+    if incremental:
+        upsert = True
+        hashes = _carregar_hashes(conn)
+        print(f"Modo incremental: {len(hashes)} asteroides já na BD.")
+
+    cur = conn.cursor()
+
+    # Tamanho dos lotes ajustado à latência medida (começa em 5000)
+    lote = _LoteAdaptativo(inicial=5000, minimo=500, maximo=50000)
+    batch_registos = []
+    batch_linhas = []       # nº da linha no ficheiro de cada registo
+    rejeitados_lote = []    # linhas que nem chegaram a ser convertidas
+
+    processados = linhas_anteriores
+    gravados_total = 0
+    rejeitados = 0
+    # Contagens do modo upsert (ver _gravar_lote_upsert):
+    # [novos, atualizados, sem alterações, repetidos no lote, órbitas rodadas]
+    contagem_upsert = [0, 0, 0, 0, 0]
+    # Modo incremental: linhas saltadas por não terem mudado
+    inalterados = 0
+    inalterados_lote = 0
+    tempo_escrita = 0.0
+    escritos = 0
+
+    import time
+
+    def gravar_lote(registos):
+        nonlocal tempo_escrita, escritos
+        t0 = time.time()
+        if upsert:
+            for k, n in enumerate(_gravar_lote_upsert(cur, registos, 'neo.csv')):
+                contagem_upsert[k] += n
+        else:
+            _gravar_lote_asteroides(cur, registos, 'neo.csv')
+        tempo_escrita += time.time() - t0
+        escritos += len(registos)
+
+    start_time = time.time()
+
+    print("A iniciar leitura e inserção em lote (streaming)...")
+
+    # Buffer grande: o ficheiro é lido sequencialmente do início ao fim
+    # (os comprimidos são descomprimidos em streaming, ver services/ficheiros.py)
+    with ficheiros.abrir_binario(path) as f_bin:
+        leitor = _LeitorComOffset(f_bin)
+        # O cabeçalho é sempre lido antes de (eventualmente) saltar para o checkpoint
+        if colunar:
+            cabecalho = next(csv.reader(leitor, delimiter=';'), [])
+        else:
+            reader = csv.DictReader(leitor, delimiter=';')
+            _ = reader.fieldnames
+
+        # reader.line_num + base_linhas = nº real da linha no ficheiro.
+        # Ao retomar, avança-se até ao checkpoint lendo e contando as linhas
+        # numa só passagem (num comprimido um seek já descomprimiria tudo)
+        base_linhas = 0
+        if offset_inicial:
+            base_linhas = ficheiros.avancar_contando_linhas(
+                f_bin, offset_inicial - leitor.offset
             )
-            pdes_to_id = {r[0]: r[1] for r in cur.fetchall()}
-
-            batch_solucoes = []
-            for pdes_key in batch_pdes:
-                if pdes_key in pdes_to_id:
-                    id_ast = pdes_to_id[pdes_key]
-                    d = batch_orbital_data[pdes_key]
-                    if d['epoca_jd'] and d['e'] is not None and d['a'] is not None:
-                        batch_solucoes.append(
-                            (
-                                id_ast, d['epoca_jd'], d['e'], d['a'], d['i'],
-                                d['om'], d['w'], d['ma'], d['moid_ua'],
-                                d['moid_ld'], d['rms'], d['data_epoca']
+            leitor.offset = offset_inicial
+
+        if colunar:
+            linhas = _linhas_neo_colunar(leitor, cabecalho, base_linhas)
+        else:
+            linhas = _linhas_neo_dict(reader, leitor, base_linhas)
+
+        for num_linha, offset, conteudo, registo, classe_desc, erro in linhas:
+            if erro is not None:
+                rejeitados_lote.append((num_linha, conteudo, str(erro)))
+            else:
+                try:
+                    # Resolver Classe Orbital (registo[11] traz o código)
+                    classe_cod = registo[11]
+                    id_classe = None
+                    if classe_cod:
+                        if classe_cod in classes_map:
+                            id_classe = classes_map[classe_cod]
+                        else:
+                            # Criar nova classe on-the-fly (raro)
+                            id_classe = _get_or_create_classe_orbital(
+                                conn, classe_cod, classe_desc
                             )
-                        )
+                            classes_map[classe_cod] = id_classe
+                    registo = registo[:11] + (id_classe,) + registo[12:]
 
-            if batch_solucoes:
-                cur.executemany(sql_orbital, batch_solucoes)
+                    if hashes is not None and hashes.get(registo[2]) == registo[-1]:
+                        inalterados_lote += 1
+                    else:
+                        batch_registos.append(registo)
+                        batch_linhas.append(num_linha)
+                except Exception as e:
+                    rejeitados_lote.append((num_linha, conteudo, str(e)))
 
-            conn.commit()
-            inseridos += len(batch_asteroides)
-        except Exception as e:
-            erros += 1
-            print(f"[ERRO] Batch final: {e}")
+            # --- PROCESSAR BATCH ---
+            # O tamanho do lote é o das linhas enviadas; as linhas sem
+            # alterações só contam até ao máximo, para haver checkpoints
+            # regulares mesmo quando quase nada muda
+            if (len(batch_registos) >= lote.tamanho
+                    or len(batch_registos) + inalterados_lote >= lote.maximo):
+                t_lote = time.time()
+                gravados, n_rej = _fechar_lote(
+                    conn, cur, gravar_lote, batch_registos, batch_linhas, rejeitados_lote,
+                    'neo.csv', path, hash_ficheiro, offset,
+                    processados + inalterados_lote
+                )
+                if batch_registos and not n_rej:
+                    # Só as linhas enviadas contam para o débito; lotes com
+                    # bisseção também não: a duração não é representativa
+                    lote.registar(len(batch_registos), time.time() - t_lote)
+                processados += gravados + inalterados_lote
+                gravados_total += gravados
+                inalterados += inalterados_lote
+                inalterados_lote = 0
+                rejeitados += n_rej
+
+                total_estimado = _estimar_total(processados, offset, tamanho_ficheiro)
+                elapsed = time.time() - start_time
+                if progress_callback:
+                    progress_callback(processados, total_estimado, elapsed)
+                else:
+                    print(
+                        f"  Progresso: {processados}/~{total_estimado} "
+                        f"({(offset/tamanho_ficheiro)*100:.1f}%)"
+                    )
+
+                batch_registos = []
+                batch_linhas = []
+                rejeitados_lote = []
+
+    # --- PROCESSAR RESTANTE ---
+    gravados, n_rej = _fechar_lote(
+        conn, cur, gravar_lote, batch_registos, batch_linhas, rejeitados_lote,
+        'neo.csv', path, hash_ficheiro, tamanho_ficheiro,
+        processados + inalterados_lote, concluido=True
+    )
+    processados += gravados + inalterados_lote
+    gravados_total += gravados
+    inalterados += inalterados_lote
+    rejeitados += n_rej
+
+    if progress_callback and processados:
+        progress_callback(processados, processados, time.time() - start_time)
 
     cur.close()
+    if upsert:
+        # No upsert 'gravados' inclui as linhas que o MERGE encontrou iguais
+        novos, atualizados, sem_alteracoes, repetidos, rodadas = contagem_upsert
+        gravados_total = novos + atualizados
     print(f"\n=== IMPORTAÇÃO CONCLUÍDA ===")
-    print(f"Total inseridos: {inseridos}")
-    print(f"Total erros: {erros}")
+    print(f"Total processados: {processados}"
+          + (f" ({linhas_anteriores} antes de retomar)" if linhas_anteriores else ""))
+    print(f"Total gravados: {gravados_total}")
+    if upsert:
+        print(f"  Novos: {novos} | Atualizados: {atualizados} | "
+              f"Sem alterações: {sem_alteracoes + inalterados} | "
+              f"Repetidos no ficheiro: {repetidos} | Órbitas rodadas: {rodadas}")
+    print(f"Tamanho dos lotes: {lote.resumo()}")
+    if incremental and escritos:
+        # Estimativa: o que teria custado gravar também as linhas que não mudaram
+        poupado = tempo_escrita / escritos * inalterados
+        print(f"Modo incremental: {inalterados} linhas sem alterações não foram "
+              f"enviadas (~{poupado:.1f}s poupados).")
+    print(f"Total rejeitados: {rejeitados} (ver dbo.Import_Rejects)")
+
+    # Chave canónica dos asteroides novos e ligação das linhas ESA que os esperavam
+    atualizar_designacoes_canonicas(conn)
+    return gravados_total
+
+
+def _dividir_em_particoes(caminho: Path, inicio: int, tamanho_alvo: int) -> list:
+    """
+    Divide o ficheiro, a partir do byte 'inicio', em intervalos [ini, fim) de
+    cerca de 'tamanho_alvo' bytes, sempre alinhados com o início de uma linha.
+    """
+    tamanho = caminho.stat().st_size
+    particoes = []
+    with caminho.open("rb") as f:
+        ini = inicio
+        while ini < tamanho:
+            fim = ini + tamanho_alvo
+            if fim >= tamanho:
+                fim = tamanho
+            else:
+                f.seek(fim)
+                f.readline()  # avançar até ao fim da linha corrente
+                fim = f.tell()
+            particoes.append((ini, fim))
+            ini = fim
+    return particoes
+
+
+def _parse_particao_neo(caminho: str, cabecalho: list, inicio: int, fim: int,
+                        dados: bytes | None = None) -> tuple:
+    """
+    Corre num processo do pool: faz o parse das linhas do neo.csv no intervalo
+    de bytes [inicio, fim) e devolve (bytes_lidos, registos). Nos ficheiros
+    comprimidos os bytes da partição vêm já em 'dados'.
+
+    Cada registo vem acompanhado do código/descrição da classe orbital, que só
+    é resolvida para id no processo principal (ver importar_neo_csv_paralelo).
+    """
+    if dados is None:
+        with open(caminho, "rb") as f:
+            f.seek(inicio)
+            dados = f.read(fim - inicio)
+
+    reader = csv.DictReader(
+        io.StringIO(dados.decode("utf-8"), newline=""),
+        fieldnames=cabecalho,
+        delimiter=';',
+    )
+    registos = []
+    for row in reader:
+        if not (row.get("pdes") or "").strip():
+            continue
+        registos.append((
+            (row.get("class") or "").strip(),
+            row.get("class_description") or "",
+            _registo_neo(row, None),
+        ))
+    return fim - inicio, registos
+
+
+def importar_neo_csv_paralelo(pool: PoolLigacoes, caminho_ficheiro: str, progress_callback=None,
+                              processos: int | None = None, ligacoes: int = 4,
+                              upsert: bool = False) -> int:
+    """
+    Importa o neo.csv em paralelo.
+
+    - O ficheiro é dividido em partições de bytes alinhadas com linhas;
+    - 'processos' processos fazem o parse das partições (ProcessPoolExecutor);
+    - 'ligacoes' threads escritoras gravam os lotes, cada uma com a sua própria
+      ligação à BD, requisitada ao pool (por isso recebe o pool e não uma
+      ligação; o pool tem de ter pelo menos ligacoes + 1 ligações).
+
+    Cada registo é encaminhado sempre para a mesma escritora, escolhida pelo
+    pdes: duas ligações nunca gravam o mesmo asteroide ao mesmo tempo, pelo
+    que o MERGE do upsert não pode inserir o mesmo pdes duas vezes, e as
+    linhas repetidas de um pdes são gravadas pela ordem do ficheiro.
+
+    As classes orbitais novas são resolvidas apenas no processo principal,
+    através de _get_or_create_classe_orbital (seguro entre ligações).
+    progress_callback(current, total, elapsed) agrega o progresso de todas as
+    threads, com o total estimado pelos bytes já processados.
+
+    As linhas inválidas são isoladas pela bissecção e vão para Import_Rejects;
+    um lote que mesmo assim falha é um erro da ligação ou do servidor. Nesse
+    caso a escritora pára (não grava mais nada nessa ligação), o parse é
+    interrompido e a função lança RuntimeError: os lotes já confirmados
+    ficam gravados e a importação pode ser repetida.
+    """
+    path = Path(caminho_ficheiro)
+    if not path.exists():
+        raise FileNotFoundError(f"Ficheiro '{path}' não encontrado.")
+
+    tamanho_ficheiro = ficheiros.tamanho_dados(path)
+    if tamanho_ficheiro == 0:
+        return 0
+
+    processos = processos or os.cpu_count() or 1
+    # Uma ligação do pool fica para o processo principal
+    ligacoes = max(1, min(ligacoes, pool.maximo - 1))
+    comprimido = ficheiros.e_comprimido(path)
+
+    with ficheiros.abrir_binario(path) as f:
+        cabecalho = next(csv.reader([f.readline().decode("utf-8")], delimiter=';'))
+        inicio_dados = f.tell()
+
+    # Partições pequenas o suficiente para manter todos os processos ocupados
+    # e a memória limitada às partições "em voo".
+    tamanho_particao = max(
+        4 * 1024 * 1024,
+        min(32 * 1024 * 1024, tamanho_ficheiro // (processos * 4) + 1)
+    )
+    pilha = contextlib.ExitStack()
+    if comprimido:
+        # Num comprimido não se pode saltar para um byte: este processo
+        # descomprime em streaming e envia os bytes de cada partição
+        f = pilha.enter_context(ficheiros.abrir_binario(path))
+        f.readline()
+        particoes = (
+            (ini, ini + len(dados), dados)
+            for ini, dados in ficheiros.partes_por_linhas(f, tamanho_particao, inicio_dados)
+        )
+    else:
+        particoes = [
+            (ini, fim, None)
+            for ini, fim in _dividir_em_particoes(path, inicio_dados, tamanho_particao)
+        ]
+
+    import time
+    start_time = time.time()
+
+    # Partilhado pelas threads escritoras (com o lock); o produtor só lê o tamanho
+    lote_adaptativo = _LoteAdaptativo(inicial=5000, minimo=500, maximo=50000)
+    # Uma fila por escritora (ver o encaminhamento por pdes)
+    filas = [queue.Queue(maxsize=2) for _ in range(ligacoes)]
+    lock = threading.Lock()
+    estado = {"inseridos": 0, "rejeitados": 0, "linhas_lidas": 0, "bytes_lidos": 0, "erro": None}
+    # Marcado pela primeira escritora que falhar: as outras e o produtor param
+    falhou = threading.Event()
+
+    def reportar():
+        # Chamado com o lock adquirido
+        total_estimado = _estimar_total(
+            estado["linhas_lidas"], estado["bytes_lidos"], tamanho_ficheiro - inicio_dados
+        )
+        elapsed = time.time() - start_time
+        if progress_callback:
+            progress_callback(estado["inseridos"], total_estimado, elapsed)
+        else:
+            print(f"  Progresso: {estado['inseridos']}/~{total_estimado}")
+
+    def escritor(conn, fila_lotes):
+        cur = conn.cursor()
+
+        def gravar_lote(registos):
+            if upsert:
+                _gravar_lote_upsert(cur, registos, 'neo.csv')
+            else:
+                _gravar_lote_asteroides(cur, registos, 'neo.csv')
+
+        try:
+            while not falhou.is_set():
+                lote = fila_lotes.get()
+                if lote is None:
+                    return
+                try:
+                    t_lote = time.time()
+                    # As partições não sabem o nº absoluto das linhas: as
+                    # rejeições ficam só com o conteúdo do registo.
+                    gravados, rejeitados = _gravar_lote_isolando_erros(
+                        conn, gravar_lote, lote, [None] * len(lote)
+                    )
+                    _registar_rejeicoes(cur, 'neo.csv', path, rejeitados)
+                    conn.commit()
+                    with lock:
+                        if not rejeitados:
+                            lote_adaptativo.registar(len(lote), time.time() - t_lote)
+                        estado["inseridos"] += gravados
+                        estado["rejeitados"] += len(rejeitados)
+                        reportar()
+                except Exception as e:
+                    try:
+                        conn.rollback()
+                    except pyodbc.Error:
+                        pass
+                    with lock:
+                        if estado["erro"] is None:
+                            estado["erro"] = e
+                    falhou.set()
+                    print(f"[ERRO] Lote paralelo: {e}")
+            # Depois de uma falha a fila só é esvaziada (sem gravar), para o
+            # produtor nunca ficar bloqueado à espera de espaço
+            while fila_lotes.get() is not None:
+                pass
+        finally:
+            cur.close()
+            pool.devolver(conn)
+
+    n_particoes = "?" if comprimido else len(particoes)
+    print(f"Importação paralela: {n_particoes} partições, "
+          f"{processos} processos, {ligacoes} ligações")
+
+    # Requisitar já todas as ligações: se alguma falhar, falha antes de começar
+    conn_principal = pool.obter()
+    ligacoes_escritores = []
+    try:
+        for _ in range(ligacoes):
+            ligacoes_escritores.append(pool.obter())
+    except Exception:
+        for conn in [conn_principal, *ligacoes_escritores]:
+            pool.devolver(conn)
+        pilha.close()
+        raise
+    escritores = [
+        threading.Thread(target=escritor, args=(conn, fila), daemon=True)
+        for conn, fila in zip(ligacoes_escritores, filas)
+    ]
+    for t in escritores:
+        t.start()
+
+    try:
+        classes_map = _get_all_classes(conn_principal)
+        lotes = [[] for _ in range(ligacoes)]
+
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            # Janela deslizante: no máximo 2 partições por processo em memória
+            pendentes = deque()
+            proximas = iter(particoes)
+            for ini, fim, dados in itertools.islice(proximas, processos * 2):
+                pendentes.append(executor.submit(
+                    _parse_particao_neo, str(path), cabecalho, ini, fim, dados
+                ))
+
+            while pendentes and not falhou.is_set():
+                n_bytes, registos = pendentes.popleft().result()
+                for ini, fim, dados in itertools.islice(proximas, 1):
+                    pendentes.append(executor.submit(
+                        _parse_particao_neo, str(path), cabecalho, ini, fim, dados
+                    ))
+
+                with lock:
+                    estado["bytes_lidos"] += n_bytes
+                    estado["linhas_lidas"] += len(registos)
+
+                for classe_cod, classe_desc, registo in registos:
+                    id_classe = None
+                    if classe_cod:
+                        id_classe = classes_map.get(classe_cod)
+                        if id_classe is None:
+                            id_classe = _get_or_create_classe_orbital(
+                                conn_principal, classe_cod, classe_desc
+                            )
+                            classes_map[classe_cod] = id_classe
+                    registo = registo[:11] + (id_classe,) + registo[12:]
+
+                    k = hash(registo[2]) % ligacoes
+                    lotes[k].append(registo)
+                    if len(lotes[k]) >= lote_adaptativo.tamanho:
+                        filas[k].put(lotes[k])
+                        lotes[k] = []
+
+            if falhou.is_set():
+                # Não vale a pena fazer o parse do resto do ficheiro
+                for futuro in pendentes:
+                    futuro.cancel()
+
+        if not falhou.is_set():
+            for fila, lote in zip(filas, lotes):
+                if lote:
+                    fila.put(lote)
+    except BaseException:
+        pool.devolver(conn_principal)
+        raise
+    finally:
+        for fila in filas:
+            fila.put(None)
+        for t in escritores:
+            t.join()
+        pilha.close()
+
+    if estado["erro"] is not None:
+        pool.devolver(conn_principal)
+        raise RuntimeError(
+            f"Importação paralela interrompida ({estado['inseridos']} registos já "
+            f"gravados): {estado['erro']}"
+        ) from estado["erro"]
+
+    inseridos = estado["inseridos"]
+    if progress_callback and inseridos:
+        progress_callback(inseridos, inseridos, time.time() - start_time)
+
+    print(f"\n=== IMPORTAÇÃO PARALELA CONCLUÍDA ===")
+    print(f"Total {'processados' if upsert else 'inseridos'}: {inseridos}")
+    print(f"Total rejeitados: {estado['rejeitados']} (ver dbo.Import_Rejects)")
+    print(f"Tamanho dos lotes: {lote_adaptativo.resumo()}")
+
+    try:
+        atualizar_designacoes_canonicas(conn_principal)
+    finally:
+        pool.devolver(conn_principal)
     return inseridos
 
 
@@ -370,9 +1593,126 @@ def _date_to_jd(date_str: str) -> float:
         return None
 
 
-def importar_mpcorb_dat(conn: pyodbc.Connection, caminho_ficheiro: str) -> int:
+# Linha do MPCORB.DAT que não deu registo (texto original + erro), para Import_Rejects
+_LinhaInvalida = namedtuple("_LinhaInvalida", ["conteudo", "erro"])
+
+
+def _registos_mpcorb_bloco(bloco: mpcorb.BlocoMPCORB, classes_map: dict) -> list:
+    """
+    Converte um bloco do MPCORB.DAT em registos pela ordem de _CAMPOS_REGISTO.
+    As colunas numéricas vêm já convertidas em bloco (services/mpcorb.py) e a
+    classe orbital é calculada para todo o bloco de uma vez a partir de a e e
+    (services/classificacao.py); 'classes_map' é o mapa de garantir_classes.
+    Devolve uma lista alinhada com o bloco: o registo ou uma _LinhaInvalida.
+    Corre também nos processos do modo paralelo (só o resultado volta) e
+    aceita um snapshot.BlocoSnapshot (mesma interface de leitura).
+    """
+    desig = bloco.texto("desig")
+    nomes = bloco.texto("nome")
+    epocas = bloco.texto("epoca")
+    colunas = [bloco.valores(c) for c in ("H", "M", "peri", "node", "incl", "e", "a", "rms")]
+
+    # Poucas épocas distintas por ficheiro: desempacotar cada uma só uma vez
+    datas = {}
+    for packed in set(epocas):
+        data = _unpack_packed_date(packed)
+        datas[packed] = (data, _date_to_jd(data))
+
+    id_unk = classes_map['UNK']
+    ids_classe = [
+        classes_map[c] if c is not None else id_unk
+        for c in classificacao.classificar(colunas[6], colunas[5])
+    ]
+
+    registos = []
+    for desig_packed, name_part, epoch_packed, h_mag, m_anom, arg_peri, node, incl, \
+            e_ecc, a_semimajor, rms, id_classe in zip(desig, nomes, epocas, *colunas, ids_classe):
+        try:
+            # Derivar pdes compatível com neo.csv:
+            #  - se Nome for "(123) Ceres" → pdes = "123"
+            #  - caso contrário → pdes = "1995 SG75" (por ex.)
+            #  - fallback → desig_packed ("00023")
+            pdes = None
+            if name_part.startswith("(") and ")" in name_part:
+                closing = name_part.find(")")
+                num_str = name_part[1:closing]
+                if num_str.isdigit():
+                    pdes = num_str  # para bater com pdes do neo.csv
+
+            if not pdes:
+                pdes = name_part or desig_packed
+
+            # nome_completo guardamos tal como aparece (ou packed se vazio)
+            nome_completo = name_part or desig_packed
+
+            data_epoca, epoca_jd = datas[epoch_packed]
+
+            # Calcular flag NEO (q = a(1-e) < 1.3 AU)
+            flag_neo = 0
+            if a_semimajor and e_ecc is not None:
+                q = a_semimajor * (1 - e_ecc)
+                if q < 1.3:
+                    flag_neo = 1
+
+            # Flag PHA - o MPCORB não traz MOID: fica 0 até ser calculada
+            # no fim da importação (services/moid.py)
+            flag_pha = 0
+
+            registos.append((
+                None,            # id_csv_original
+                None,            # spkid
+                pdes,
+                nome_completo,
+                flag_neo,
+                flag_pha,
+                h_mag,
+                None,            # diametro
+                None,            # albedo
+                None,            # moid_ua
+                None,            # moid_ld
+                id_classe,
+                epoca_jd,
+                e_ecc,
+                a_semimajor,
+                incl,
+                node,
+                arg_peri,
+                m_anom,
+                rms,
+                data_epoca,
+                None,            # hash_conteudo (só o neo.csv o usa)
+            ))
+        except Exception as e:
+            registos.append(_LinhaInvalida(bloco.conteudo(len(registos)), str(e)))
+    return registos
+
+
+def importar_mpcorb_dat(conn: pyodbc.Connection, caminho_ficheiro: str, progress_callback=None,
+                        retomar: bool = False, processos: int = 1,
+                        com_moid: bool = True) -> int:
     """
     Importa dados do ficheiro MPCORB.DAT (formato fixed-width).
+
+    O ficheiro é lido por blocos através de services/mpcorb.py (mmap +
+    conversão das colunas numéricas em bloco).
+
+    Com processos > 1 o parse é feito em paralelo: o ficheiro é dividido em
+    intervalos de bytes alinhados às linhas, convertidos em registos num
+    ProcessPoolExecutor e entregues por ordem a este processo, o único que
+    escreve na BD (os lotes, checkpoints e rejeições são os mesmos).
+
+    'caminho_ficheiro' pode também ser um snapshot binário gerado pelo
+    conversor (docs/converter_mpcorb_para_csv.py --snapshot): as colunas são
+    lidas por mmap, sem parse do texto, e os checkpoints guardam o índice da
+    linha do snapshot em vez do byte.
+
+    Com com_moid=True (e NumPy instalado), no fim é calculada a MOID das
+    órbitas importadas, o que preenche moid_ua/moid_ld e o flag_pha
+    (ver services/moid.py).
+
+    Tal como importar_neo_csv, regista um checkpoint por lote no Import_Journal
+    e, com retomar=True, continua uma importação interrompida do mesmo ficheiro.
+    progress_callback(current, total, elapsed) usa um total estimado pelos bytes lidos.
     """
     path = Path(caminho_ficheiro)
     if not path.exists():
@@ -380,245 +1720,110 @@ def importar_mpcorb_dat(conn: pyodbc.Connection, caminho_ficheiro: str) -> int:
 
     print("A ler ficheiro MPCORB.DAT...")
 
+    snap = snapshot.abrir(path) if snapshot.e_snapshot(path) else None
+    tamanho_ficheiro = len(snap) if snap is not None else ficheiros.tamanho_dados(path)
+    hash_ficheiro = _hash_ficheiro(path)
+    checkpoint = obter_checkpoint(conn, caminho_ficheiro, 'MPCORB.DAT') if retomar else None
+    offset_inicial, linhas_anteriores = checkpoint or (0, 0)
+    if checkpoint:
+        print(f"A retomar importação: {linhas_anteriores} registos já gravados "
+              f"(byte {offset_inicial}).")
+
     cur = conn.cursor()
-    cur.fast_executemany = True
 
-    sql_asteroide = """
-        INSERT INTO dbo.Asteroide (
-            id_csv_original, spkid, pdes, nome_completo, flag_neo, flag_pha, 
-            H_mag, diametro_km, albedo, moid_ua, moid_ld, id_classe_orbital
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
+    # Classes orbitais (as que faltarem são criadas); 'UNK' só para quem não tem a/e
+    classes_map = garantir_classes(conn)
 
-    sql_orbital = """
-        INSERT INTO dbo.Solucao_Orbital (
-            id_asteroide, epoca_jd, excentricidade, semi_eixo_maior_ua, 
-            inclinacao_graus, nodo_asc_graus, arg_perihelio_graus, 
-            anomalia_media_graus, moid_ua, moid_ld, rms, 
-            solucao_atual, origem, data_epoca
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, 'MPCORB.DAT', ?)
-    """
+    # Todas as designações já existentes, carregadas uma só vez
+    indice = IndiceDesignacoes.carregar(conn)
+    print(f"Índice de designações: {indice.resumo()}")
+    novos = 0
 
-    # Classe default para objetos vindos só do MPCORB
-    id_classe_default = _get_or_create_classe_orbital(
-        conn, 'UNK', 'Unknown / MPCORB Import'
-    )
+    # Tamanho dos lotes ajustado à latência medida (começa em 1000)
+    lote = _LoteAdaptativo(inicial=1000, minimo=200, maximo=50000)
+    batch_registos = []
+    batch_linhas = []
+    rejeitados_lote = []
 
-    BATCH_SIZE = 1000
-    batch_asteroides = []
-    batch_pdes = []
-    batch_orbital_data = {}
+    inseridos = linhas_anteriores
+    rejeitados = 0
 
-    inseridos = 0
-    erros = 0
+    def gravar_lote(registos):
+        # Os pdes já existentes reutilizam o id_asteroide atual (do índice);
+        # os novos são inseridos e o id vem do próprio INSERT.
+        nonlocal novos
+        novos += _gravar_lote_com_indice(cur, registos, 'MPCORB.DAT', indice)
 
-    with path.open("r", encoding="utf-8") as f:
-        for idx, line in enumerate(f, start=1):
-            # Saltar cabeçalho
-            if idx <= 43:
-                continue
-            if not line.strip():
-                continue
+    import time
+    start_time = time.time()
 
-            try:
-                # Parse Fixed Width de acordo com MPCORB
-                desig_packed = line[0:7].strip()          # Des'n
-                h_mag = _safe_float(line[8:13])           # H
-                epoch_packed = line[20:25].strip()        # Epoch (packed)
-                m_anom = _safe_float(line[26:35])         # M
-                arg_peri = _safe_float(line[37:46])       # Peri.
-                node = _safe_float(line[48:57])           # Node
-                incl = _safe_float(line[59:68])           # Incl.
-                e_ecc = _safe_float(line[70:79])          # e
-                a_semimajor = _safe_float(line[92:103])   # a
-                rms = _safe_float(line[137:141])          # rms
-
-                # Nome (167–194) e Data (195–202) segundo o dicionário do MPCORB
-                name_part = line[166:194].strip()
-                last_update_raw = line[194:202].strip()   # Data da última atualização (YYYYMMDD)
-
-                # Derivar pdes compatível com neo.csv:
-                #  - se Nome for "(123) Ceres" → pdes = "123"
-                #  - caso contrário → pdes = "1995 SG75" (por ex.)
-                #  - fallback → desig_packed ("00023")
-                pdes = None
-                if name_part.startswith("(") and ")" in name_part:
-                    closing = name_part.find(")")
-                    num_str = name_part[1:closing]
-                    if num_str.isdigit():
-                        pdes = num_str  # para bater com pdes do neo.csv
-
-                if not pdes:
-                    pdes = name_part or desig_packed
-
-                # nome_completo guardamos tal como aparece (ou packed se vazio)
-                nome_completo = name_part or desig_packed
-
-                # Data da época (a partir do Epoch packed)
-                data_epoca = _unpack_packed_date(epoch_packed)
-                epoca_jd = _date_to_jd(data_epoca)
-
-                # (Opcional) data da última atualização/observação
-                # data_ultima_atualizacao = _safe_date(last_update_raw)
-
-                # Calcular flag NEO (q = a(1-e) < 1.3 AU)
-                flag_neo = 0
-                if a_semimajor and e_ecc is not None:
-                    q = a_semimajor * (1 - e_ecc)
-                    if q < 1.3:
-                        flag_neo = 1
-
-                # Flag PHA - sem MOID exato, mantemos 0 por segurança
-                flag_pha = 0
-
-                ast_tuple = (
-                    None,            # id_csv_original
-                    None,            # spkid
-                    pdes,
-                    nome_completo,
-                    flag_neo,
-                    flag_pha,
-                    h_mag,
-                    None,            # diametro
-                    None,            # albedo
-                    None,            # moid_ua
-                    None,            # moid_ld
-                    id_classe_default
-                )
+    converter = functools.partial(_registos_mpcorb_bloco, classes_map=classes_map)
+    if snap is not None:
+        print(f"Snapshot binário: {len(snap)} linhas (origem {snap.meta['origem']}).")
+        blocos = (
+            mpcorb.BlocoProcessado(b.num_linhas, b.offsets, b.offset_fim, converter(b))
+            for b in snapshot.ler_blocos(snap, inicio=offset_inicial)
+        )
+    else:
+        if processos > 1:
+            print(f"Parse em paralelo: {processos} processos.")
+        # Ao retomar, o offset guardado já está depois do cabeçalho
+        blocos = mpcorb.processar_blocos(
+            path, converter, inicio=offset_inicial or None, processos=processos,
+        )
+    for bloco in blocos:
+        for num_linha, offset, registo in zip(bloco.num_linhas, bloco.offsets, bloco.resultado):
+            if isinstance(registo, _LinhaInvalida):
+                rejeitados_lote.append((num_linha, registo.conteudo, registo.erro))
+            else:
+                batch_registos.append(registo)
+                batch_linhas.append(num_linha)
 
-                orb_data = {
-                    'epoca_jd': epoca_jd,
-                    'e': e_ecc,
-                    'a': a_semimajor,
-                    'i': incl,
-                    'om': node,
-                    'w': arg_peri,
-                    'ma': m_anom,
-                    'moid_ua': None,
-                    'moid_ld': None,
-                    'rms': rms,
-                    'data_epoca': data_epoca
-                }
-
-                batch_asteroides.append(ast_tuple)
-                batch_pdes.append(pdes)
-                batch_orbital_data[pdes] = orb_data
-
-                # --- PROCESSAR BATCH ---
-                if len(batch_asteroides) >= BATCH_SIZE:
-                    placeholders = ','.join(['?'] * len(batch_pdes))
-                    # Verificar quais já existem
-                    cur.execute(
-                        f"SELECT pdes FROM dbo.Asteroide "
-                        f"WHERE pdes IN ({placeholders})",
-                        batch_pdes
-                    )
-                    existentes = {r[0] for r in cur.fetchall()}
-
-                    novos_asteroides = []
-                    novos_pdes = []
-                    for i, p in enumerate(batch_pdes):
-                        if p not in existentes:
-                            novos_asteroides.append(batch_asteroides[i])
-                            novos_pdes.append(p)
-
-                    if novos_asteroides:
-                        cur.executemany(sql_asteroide, novos_asteroides)
-                        conn.commit()  # para gerar IDs
-
-                    # Buscar IDs de todos do batch (novos + antigos)
-                    cur.execute(
-                        f"SELECT pdes, id_asteroide FROM dbo.Asteroide "
-                        f"WHERE pdes IN ({placeholders})",
-                        batch_pdes
+            # --- PROCESSAR BATCH ---
+            if len(batch_registos) >= lote.tamanho:
+                t_lote = time.time()
+                gravados, n_rej = _fechar_lote(
+                    conn, cur, gravar_lote, batch_registos, batch_linhas, rejeitados_lote,
+                    'MPCORB.DAT', path, hash_ficheiro, offset, inseridos
+                )
+                if not n_rej:
+                    lote.registar(len(batch_registos), time.time() - t_lote)
+                inseridos += gravados
+                rejeitados += n_rej
+                if progress_callback:
+                    progress_callback(
+                        inseridos,
+                        _estimar_total(inseridos, offset, tamanho_ficheiro),
+                        time.time() - start_time,
                     )
-                    pdes_to_id = {r[0]: r[1] for r in cur.fetchall()}
-
-                    batch_solucoes = []
-                    for pdes_key in batch_pdes:
-                        if pdes_key in pdes_to_id:
-                            id_ast = pdes_to_id[pdes_key]
-                            d = batch_orbital_data[pdes_key]
-
-                            if d['epoca_jd'] and d['e'] is not None and d['a'] is not None:
-                                batch_solucoes.append(
-                                    (
-                                        id_ast, d['epoca_jd'], d['e'], d['a'], d['i'],
-                                        d['om'], d['w'], d['ma'], d['moid_ua'],
-                                        d['moid_ld'], d['rms'], d['data_epoca']
-                                    )
-                                )
-
-                    if batch_solucoes:
-                        cur.executemany(sql_orbital, batch_solucoes)
-
-                    conn.commit()
-                    inseridos += len(batch_asteroides)
+                else:
                     print(f"  Progresso MPCORB: {inseridos} processados...")
 
-                    batch_asteroides = []
-                    batch_pdes = []
-                    batch_orbital_data = {}
-
-            except Exception as e:
-                erros += 1
-                # Se quiseres detalhe, descomenta:
-                # print(f"[ERRO] Linha {idx}: {e}")
-                conn.rollback()
-                batch_asteroides = []
-                batch_pdes = []
-                batch_orbital_data = {}
+                batch_registos = []
+                batch_linhas = []
+                rejeitados_lote = []
 
     # Processar restante
-    if batch_asteroides:
-        try:
-            placeholders = ','.join(['?'] * len(batch_pdes))
-            cur.execute(
-                f"SELECT pdes FROM dbo.Asteroide "
-                f"WHERE pdes IN ({placeholders})",
-                batch_pdes
-            )
-            existentes = {r[0] for r in cur.fetchall()}
-
-            novos_asteroides = []
-            for i, p in enumerate(batch_pdes):
-                if p not in existentes:
-                    novos_asteroides.append(batch_asteroides[i])
-
-            if novos_asteroides:
-                cur.executemany(sql_asteroide, novos_asteroides)
-                conn.commit()
-
-            cur.execute(
-                f"SELECT pdes, id_asteroide FROM dbo.Asteroide "
-                f"WHERE pdes IN ({placeholders})",
-                batch_pdes
-            )
-            pdes_to_id = {r[0]: r[1] for r in cur.fetchall()}
-
-            batch_solucoes = []
-            for pdes_key in batch_pdes:
-                if pdes_key in pdes_to_id:
-                    id_ast = pdes_to_id[pdes_key]
-                    d = batch_orbital_data[pdes_key]
-                    if d['epoca_jd'] and d['e'] is not None and d['a'] is not None:
-                        batch_solucoes.append(
-                            (
-                                id_ast, d['epoca_jd'], d['e'], d['a'], d['i'],
-                                d['om'], d['w'], d['ma'], d['moid_ua'],
-                                d['moid_ld'], d['rms'], d['data_epoca']
-                            )
-                        )
+    gravados, n_rej = _fechar_lote(
+        conn, cur, gravar_lote, batch_registos, batch_linhas, rejeitados_lote,
+        'MPCORB.DAT', path, hash_ficheiro, tamanho_ficheiro, inseridos, concluido=True
+    )
+    inseridos += gravados
+    rejeitados += n_rej
 
-            if batch_solucoes:
-                cur.executemany(sql_orbital, batch_solucoes)
-            conn.commit()
-            inseridos += len(batch_asteroides)
-        except Exception as e:
-            print(f"Erro final batch: {e}")
+    if progress_callback and inseridos:
+        progress_callback(inseridos, inseridos, time.time() - start_time)
 
     cur.close()
     print(f"\n=== IMPORTAÇÃO MPCORB CONCLUÍDA ===")
     print(f"Total processados: {inseridos}")
-    print(f"Total erros: {erros}")
+    print(f"  Asteroides novos: {novos} | Já existentes: {inseridos - linhas_anteriores - novos}")
+    print(f"Total rejeitados: {rejeitados} (ver dbo.Import_Rejects)")
+    print(f"Tamanho dos lotes: {lote.resumo()}")
+    print(f"Índice de designações: {indice.resumo()}")
+
+    atualizar_designacoes_canonicas(conn)
+    if com_moid and colunar.numpy_disponivel():
+        print("A calcular a MOID das órbitas sem MOID...")
+        moid.atualizar_moid(conn)
     return inseridos
@@ -0,0 +1,226 @@
+"""
+Cálculo da MOID (Minimum Orbit Intersection Distance) com a Terra, em lote.
+
+A MOID é a menor distância entre dois pontos quaisquer das duas órbitas
+(a do asteroide e a da Terra), independentemente de onde os corpos estão.
+Para cada bloco de órbitas, de forma vetorizada (NumPy):
+  1. grelha grosseira sobre as anomalias excêntricas das duas órbitas
+     (pontos x pontos distâncias por objeto);
+  2. os melhores mínimos locais da grelha (até CANDIDATOS por objeto) são
+     refinados com algumas iterações de Newton sobre d²(u, v), com as
+     derivadas analíticas da posição.
+
+atualizar_moid grava o resultado em Solucao_Orbital e Asteroide (moid_ua,
+moid_ld) e recalcula o flag_pha (MOID <= 0.05 UA e H <= 22). Por defeito só
+trata as soluções atuais ainda sem MOID (órbitas novas ou alteradas).
+"""
+
+import json
+import time
+
+from services import colunar
+from services.orbitas import H_PHA, LD_UA, MOID_PHA_UA, TERRA, elementos_validos, vetores_orbitais
+
+# Mínimos locais da grelha que são refinados por objeto (a MOID pode ter até 4)
+CANDIDATOS = 2
+
+
+def _orbita_terra(np):
+    P, Q = vetores_orbitais(TERRA["incl"], TERRA["node"], TERRA["peri"] - TERRA["node"])
+    a, e = TERRA["a"], TERRA["e"]
+    return a, a * np.sqrt(1 - e * e), e, P, Q
+
+
+def _posicao(np, a, b, e, P, Q, u):
+    """Posição e 1.ª/2.ª derivadas em ordem à anomalia excêntrica u."""
+    cu, su = np.cos(u), np.sin(u)
+    x, y = a * (cu - e), b * su
+    dx, dy = -a * su, b * cu
+    pos = x[..., None] * P + y[..., None] * Q
+    d1 = dx[..., None] * P + dy[..., None] * Q
+    d2 = -(a * cu)[..., None] * P - (b * su)[..., None] * Q
+    return pos, d1, d2
+
+
+def _moid_bloco(np, a, e, P, Q, pontos: int, iteracoes: int):
+    """MOID (UA) de um bloco de órbitas válidas (arrays de n elementos)."""
+    b = a * np.sqrt(1 - e * e)
+    at, bt, et, Pt, Qt = _orbita_terra(np)
+
+    # 1) Grelha: n x pontos x pontos distâncias ao quadrado
+    grelha = np.linspace(0, 2 * np.pi, pontos, endpoint=False)
+    cu, su = np.cos(grelha), np.sin(grelha)
+    xa = a[:, None] * (cu - e[:, None])
+    ya = b[:, None] * su
+    R = xa[..., None] * P[:, None, :] + ya[..., None] * Q[:, None, :]       # n x m x 3
+    T = (at * (cu - et))[:, None] * Pt + (bt * su)[:, None] * Qt            # m x 3
+    d2 = (
+        (R * R).sum(axis=2)[:, :, None]
+        + (T * T).sum(axis=1)[None, None, :]
+        - 2 * np.einsum("nid,jd->nij", R, T)
+    )
+
+    # Melhor ponto da Terra para cada ponto do asteroide, e mínimos locais em u
+    j_min = d2.argmin(axis=2)
+    d_u = np.take_along_axis(d2, j_min[:, :, None], axis=2)[:, :, 0]
+    local = (d_u <= np.roll(d_u, 1, axis=1)) & (d_u <= np.roll(d_u, -1, axis=1))
+    d_local = np.where(local, d_u, np.inf)
+    k = min(CANDIDATOS, pontos)
+    i_cand = np.argsort(d_local, axis=1)[:, :k]                              # n x k
+    valido = np.isfinite(np.take_along_axis(d_local, i_cand, axis=1))
+    u = grelha[i_cand]
+    v = grelha[np.take_along_axis(j_min, i_cand, axis=1)]
+
+    # 2) Newton sobre f(u, v) = |R(u) - T(v)|² / 2
+    passo_max = 2 * np.pi / pontos
+    A, B, E = a[:, None], b[:, None], e[:, None]
+    Pk, Qk = P[:, None, :], Q[:, None, :]
+    for _ in range(iteracoes):
+        r, r1, r2 = _posicao(np, A, B, E, Pk, Qk, u)
+        t, t1, t2 = _posicao(np, at, bt, et, Pt, Qt, v)
+        D = r - t
+        g_u = (D * r1).sum(axis=-1)
+        g_v = -(D * t1).sum(axis=-1)
+        h_uu = (r1 * r1).sum(axis=-1) + (D * r2).sum(axis=-1)
+        h_vv = (t1 * t1).sum(axis=-1) - (D * t2).sum(axis=-1)
+        h_uv = -(r1 * t1).sum(axis=-1)
+        det = h_uu * h_vv - h_uv * h_uv
+        # Só se avança onde o Hessiano é definido positivo (perto de um mínimo)
+        ok = (det > 0) & (h_uu > 0)
+        det = np.where(ok, det, 1.0)
+        du = np.where(ok, -(h_vv * g_u - h_uv * g_v) / det, 0.0)
+        dv = np.where(ok, -(h_uu * g_v - h_uv * g_u) / det, 0.0)
+        u = u + np.clip(du, -passo_max, passo_max)
+        v = v + np.clip(dv, -passo_max, passo_max)
+
+    r, _, _ = _posicao(np, A, B, E, Pk, Qk, u)
+    t, _, _ = _posicao(np, at, bt, et, Pt, Qt, v)
+    d_ref = np.where(valido, ((r - t) ** 2).sum(axis=-1), np.inf).min(axis=1)
+    # O refinamento nunca pode dar pior do que a grelha
+    return np.sqrt(np.maximum(np.minimum(d_ref, d_u.min(axis=1)), 0.0))
+
+
+def calcular_moid(a, e, incl, node, peri, pontos: int = 48, iteracoes: int = 6,
+                  tamanho_bloco: int = 2000):
+    """
+    MOID com a Terra (UA) para arrays de elementos orbitais (a em UA, ângulos
+    em graus). Órbitas não elípticas ou incompletas ficam NaN.
+    """
+    np = colunar._np()
+    a, e, incl, node, peri = (np.asarray(x, dtype=np.float64) for x in (a, e, incl, node, peri))
+    moid = np.full(a.shape, np.nan)
+    idx = np.flatnonzero(elementos_validos(a, e, incl, node, peri))
+    for ini in range(0, len(idx), tamanho_bloco):
+        sel = idx[ini:ini + tamanho_bloco]
+        P, Q = vetores_orbitais(incl[sel], node[sel], peri[sel])
+        moid[sel] = _moid_bloco(np, a[sel], e[sel], P, Q, pontos, iteracoes)
+    return moid
+
+
+def flag_pha(moid_ua, h_mag):
+    """PHA: MOID <= 0.05 UA e H <= 22 (H desconhecido não conta como PHA)."""
+    np = colunar._np()
+    moid_ua = np.asarray(moid_ua, dtype=np.float64)
+    h_mag = np.asarray(h_mag, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        return (moid_ua <= MOID_PHA_UA) & (h_mag <= H_PHA)
+
+
+_SQL_LER_ORBITAS = """
+    SELECT TOP (?)
+        so.id_solucao_orbital,
+        so.id_asteroide,
+        so.semi_eixo_maior_ua,
+        so.excentricidade,
+        so.inclinacao_graus,
+        so.nodo_asc_graus,
+        so.arg_perihelio_graus,
+        a.H_mag
+    FROM dbo.Solucao_Orbital AS so
+    JOIN dbo.Asteroide       AS a ON a.id_asteroide = so.id_asteroide
+    WHERE so.solucao_atual = 1
+      AND so.id_solucao_orbital > ?
+      {filtro}
+    ORDER BY so.id_solucao_orbital;
+"""
+
+_OPENJSON_MOID = """
+    OPENJSON(@lote) WITH (
+        id_solucao_orbital INT   '$[0]',
+        id_asteroide       INT   '$[1]',
+        moid_ua            FLOAT '$[2]',
+        moid_ld            FLOAT '$[3]',
+        flag_pha           BIT   '$[4]'
+    )
+"""
+
+_SQL_GRAVAR_MOID = f"""
+    SET NOCOUNT ON;
+    DECLARE @lote NVARCHAR(MAX) = ?;
+
+    UPDATE so
+    SET so.moid_ua = m.moid_ua,
+        so.moid_ld = m.moid_ld
+    FROM dbo.Solucao_Orbital AS so
+    JOIN {_OPENJSON_MOID} AS m
+        ON m.id_solucao_orbital = so.id_solucao_orbital;
+
+    UPDATE a
+    SET a.moid_ua  = m.moid_ua,
+        a.moid_ld  = m.moid_ld,
+        a.flag_pha = m.flag_pha
+    FROM dbo.Asteroide AS a
+    JOIN {_OPENJSON_MOID} AS m
+        ON m.id_asteroide = a.id_asteroide;
+"""
+
+
+def atualizar_moid(conn, todos: bool = False, tamanho_bloco: int = 50000) -> int:
+    """
+    Calcula a MOID das soluções orbitais atuais e grava moid_ua/moid_ld em
+    Solucao_Orbital e Asteroide, com o flag_pha recalculado.
+
+    Com todos=False (defeito) só trata as soluções com moid_ua NULL, isto é,
+    as órbitas acabadas de importar ou alteradas (uma órbita nova é sempre uma
+    nova Solucao_Orbital, sem MOID do MPCORB). Com todos=True recalcula
+    todas, incluindo as que trazem a MOID do JPL.
+
+    Lê por páginas de 'tamanho_bloco' (pela chave), com commit por página.
+    Devolve o número de órbitas com MOID calculada.
+    """
+    np = colunar._np()
+    sql_ler = _SQL_LER_ORBITAS.format(filtro="" if todos else "AND so.moid_ua IS NULL")
+    cur = conn.cursor()
+    ultimo_id = 0
+    calculados = 0
+    phas = 0
+    t0 = time.time()
+
+    while True:
+        cur.execute(sql_ler, tamanho_bloco, ultimo_id)
+        rows = cur.fetchall()
+        if not rows:
+            break
+        ultimo_id = rows[-1][0]
+
+        dados = np.array([r[2:] for r in rows], dtype=np.float64)  # None -> NaN
+        moid = calcular_moid(dados[:, 0], dados[:, 1], dados[:, 2], dados[:, 3], dados[:, 4])
+        pha = flag_pha(moid, dados[:, 5])
+
+        lote = [
+            [r[0], r[1], m, m / LD_UA, p]
+            for r, m, p in zip(rows, moid.tolist(), pha.astype(int).tolist())
+            if m == m  # NaN (órbita inválida) fica por calcular
+        ]
+        if lote:
+            cur.execute(_SQL_GRAVAR_MOID, json.dumps(lote, separators=(",", ":"), allow_nan=False))
+            conn.commit()
+        calculados += len(lote)
+        phas += sum(l[4] for l in lote)
+        print(f"  MOID: {calculados} órbitas calculadas...")
+
+    cur.close()
+    duracao = time.time() - t0
+    print(f"MOID: {calculados} órbitas em {duracao:.1f}s "
+          f"({calculados / duracao if duracao else 0:.0f} órbitas/s), {phas} PHA.")
+    return calculados
@@ -0,0 +1,349 @@
+"""
+Leitura rápida do MPCORB.DAT (formato de largura fixa, 202 colunas).
+
+O ficheiro é mapeado em memória (mmap) e percorrido por blocos de linhas.
+Cada bloco é normalizado para uma matriz de bytes n x 202, de onde as colunas
+numéricas (H, época, M, Peri, Node, Incl, e, a, ...) são extraídas de uma vez
+com NumPy, em vez de uma dúzia de fatias de texto + _safe_float por linha.
+
+É o mesmo motor que alimenta a importação para a BD (importar_mpcorb_dat) e o
+conversor para CSV (docs/converter_mpcorb_para_csv.py). Sem NumPy continua a
+funcionar, convertendo os números um a um.
+
+Como as linhas têm largura fixa, o ficheiro pode também ser dividido em
+intervalos de bytes alinhados às linhas e processado em vários processos
+(processar_blocos com processos > 1), com os resultados entregues por ordem.
+Ficheiros comprimidos (.gz, .bz2, .xz, .zip) são lidos em streaming (sem
+mmap) através de services/ficheiros.py.
+"""
+
+import functools
+import mmap
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from services import colunar, ficheiros
+
+LARGURA_LINHA = 202
+
+# Colunas do MPCORB.DAT (início, fim), segundo o "Export Format" do MPC
+CAMPOS = {
+    "desig":       (0, 7),      # Designação compactada
+    "H":           (8, 13),
+    "G":           (14, 19),
+    "epoca":       (20, 25),    # Época compactada (ex.: K25BL)
+    "M":           (26, 35),
+    "peri":        (37, 46),
+    "node":        (48, 57),
+    "incl":        (59, 68),
+    "e":           (70, 79),
+    "n":           (80, 91),
+    "a":           (92, 103),
+    "U":           (105, 106),
+    "ref":         (107, 116),
+    "n_obs":       (117, 122),
+    "n_opps":      (123, 126),
+    "arc":         (127, 136),
+    "rms":         (137, 141),
+    "pert_coarse": (142, 145),
+    "pert_prec":   (146, 149),
+    "computer":    (150, 160),
+    "hexflags":    (161, 165),
+    "nome":        (166, 194),  # Nome/designação legível, ex.: "(1) Ceres"
+    "ultima_obs":  (194, 202),  # Data da última observação (YYYYMMDD)
+}
+
+# Linhas mais curtas do que isto não são registos (linhas em branco, separadores)
+_MIN_LARGURA_REGISTO = 10
+
+
+def inicio_dados(mm) -> int:
+    """
+    Byte onde começam os dados: a seguir à linha de traços que termina o
+    cabeçalho do MPCORB.DAT. Se não houver cabeçalho (ex.: extratos só com
+    dados), os dados começam no byte 0.
+    """
+    cabecalho = mm[:64 * 1024]
+    pos = 0
+    while pos < len(cabecalho):
+        fim = cabecalho.find(b"\n", pos)
+        if fim < 0:
+            break
+        linha = cabecalho[pos:fim].strip()
+        if len(linha) >= 20 and linha.strip(b"-") == b"":
+            return fim + 1
+        pos = fim + 1
+    return 0
+
+
+def _contar_linhas(mm, ate_offset: int) -> int:
+    """Número de linhas completas antes de 'ate_offset' (contado por blocos)."""
+    linhas = 0
+    for ini in range(0, ate_offset, 4 * 1024 * 1024):
+        linhas += mm[ini:min(ate_offset, ini + 4 * 1024 * 1024)].count(b"\n")
+    return linhas
+
+
+def proximo_fim_linha(mm, pos: int, tamanho: int) -> int:
+    """Byte a seguir ao fim da linha que contém 'pos' (ou o fim do ficheiro)."""
+    if pos >= tamanho:
+        return tamanho
+    fim = mm.find(b"\n", pos)
+    return tamanho if fim < 0 else fim + 1
+
+
+class BlocoMPCORB:
+    """
+    Um bloco de linhas de dados do MPCORB.DAT.
+
+    - num_linhas[k]: nº da linha k no ficheiro (a contar de 1);
+    - offsets[k]: byte a seguir ao fim da linha k (para checkpoints);
+    - offset_fim: byte a seguir ao bloco (inclui linhas ignoradas).
+    """
+
+    def __init__(self, linhas: List[bytes], num_linhas: List[int], offsets: List[int],
+                 offset_fim: int):
+        self.linhas = [l.ljust(LARGURA_LINHA)[:LARGURA_LINHA] for l in linhas]
+        self.num_linhas = num_linhas
+        self.offsets = offsets
+        self.offset_fim = offset_fim
+        self._matriz = None
+
+    def __len__(self) -> int:
+        return len(self.linhas)
+
+    def matriz(self):
+        """Matriz n x 202 (uint8) com o bloco, partilhada por todas as colunas."""
+        if self._matriz is None:
+            np = colunar._np()
+            self._matriz = np.frombuffer(b"".join(self.linhas), dtype=np.uint8).reshape(
+                len(self.linhas), LARGURA_LINHA
+            )
+        return self._matriz
+
+    def texto(self, campo: str) -> List[str]:
+        """Valores de texto (sem espaços à volta) de uma coluna."""
+        ini, fim = CAMPOS[campo]
+        return [l[ini:fim].decode("utf-8", errors="replace").strip() for l in self.linhas]
+
+    def numeros(self, campo: str):
+        """
+        Coluna numérica como array float64 (NaN onde está vazia ou inválida),
+        convertida de uma só vez a partir da matriz do bloco.
+        """
+        np = colunar._np()
+        ini, fim = CAMPOS[campo]
+        largura = fim - ini
+        if not self.linhas:
+            return np.empty(0, dtype=np.float64)
+        celulas = np.ascontiguousarray(self.matriz()[:, ini:fim])
+        # Campos vazios (só espaços) passam a 'nan' antes da conversão
+        vazios = (celulas == ord(" ")).all(axis=1)
+        celulas[vazios, :3] = np.frombuffer(b"nan", dtype=np.uint8)
+        valores = celulas.view(f"S{largura}").ravel()
+        try:
+            return valores.astype(np.float64)
+        except ValueError:
+            # Algum valor inválido: só esta coluna é convertida um a um
+            return colunar.para_float64([v.decode("ascii", errors="replace") for v in valores])
+
+    def conteudo(self, k: int) -> str:
+        """Texto original da linha k (para Import_Rejects)."""
+        return self.linhas[k].decode("utf-8", errors="replace").rstrip()
+
+    def valores(self, campo: str) -> List[Optional[float]]:
+        """Coluna numérica como lista de float/None, pronta para parâmetros da BD."""
+        if colunar.numpy_disponivel():
+            return colunar.para_lista(self.numeros(campo))
+        resultado = []
+        for v in self.texto(campo):
+            try:
+                resultado.append(float(v) if v else None)
+            except ValueError:
+                resultado.append(None)
+        return resultado
+
+
+def _ler_bloco(dados: bytes, pos: int, num_linha: int):
+    """
+    Bloco com as linhas de dados de 'dados' (bytes alinhados a linhas que
+    começam no byte 'pos' do ficheiro). 'num_linha' é o nº da linha anterior
+    a 'pos'. Devolve o bloco e o nº da última linha lida (incluindo as ignoradas).
+    """
+    fim = pos + len(dados)
+    linhas, num_linhas, offsets = [], [], []
+    offset = pos
+    for linha in dados.split(b"\n"):
+        if offset >= fim:
+            break  # resto vazio depois do último '\n'
+        offset += len(linha) + 1
+        num_linha += 1
+        linha = linha.rstrip(b"\r")
+        if len(linha.rstrip()) < _MIN_LARGURA_REGISTO:
+            continue
+        linhas.append(linha)
+        num_linhas.append(num_linha)
+        offsets.append(min(offset, fim))
+
+    return BlocoMPCORB(linhas, num_linhas, offsets, fim), num_linha
+
+
+def _intervalos(mm, pos: int, tamanho: int, linhas_por_bloco: int) -> Iterator[Tuple[int, int]]:
+    """Divide os bytes [pos, tamanho) em intervalos alinhados ao fim das linhas."""
+    bytes_por_bloco = linhas_por_bloco * (LARGURA_LINHA + 1)
+    while pos < tamanho:
+        fim = proximo_fim_linha(mm, pos + bytes_por_bloco - 1, tamanho)
+        yield pos, fim
+        pos = fim
+
+
+def _partes_comprimido(path: Path, inicio: Optional[int], linhas_por_bloco: int):
+    """
+    Para ficheiros comprimidos (sem mmap): descomprime em streaming e devolve
+    (nº de linhas antes dos dados, iterador de (offset, bytes) alinhados a linhas).
+    Os offsets são do conteúdo descomprimido.
+    """
+    pilha = ExitStack()
+    fich = pilha.enter_context(ficheiros.abrir_binario(path))
+    try:
+        if inicio is None:
+            cabecalho = fich.read(64 * 1024)
+            inicio = inicio_dados(cabecalho)
+            fich.seek(inicio)
+            num_linha = cabecalho[:inicio].count(b"\n")
+        else:
+            # Ao retomar, descomprimir (e contar as linhas) até ao offset
+            num_linha = ficheiros.avancar_contando_linhas(fich, inicio)
+    except Exception:
+        pilha.close()
+        raise
+
+    def partes():
+        with pilha:
+            yield from ficheiros.partes_por_linhas(
+                fich, linhas_por_bloco * (LARGURA_LINHA + 1), inicio
+            )
+
+    return num_linha, partes()
+
+
+def ler_blocos(caminho, inicio: Optional[int] = None,
+               linhas_por_bloco: int = 50000) -> Iterator[BlocoMPCORB]:
+    """
+    Percorre o MPCORB.DAT por blocos de até 'linhas_por_bloco' linhas de dados.
+
+    Com inicio=None começa depois do cabeçalho; com um byte offset (ex.: de um
+    checkpoint) começa exatamente nesse byte. Linhas em branco ou demasiado
+    curtas são ignoradas.
+    """
+    path = Path(caminho)
+    tamanho = path.stat().st_size
+    if tamanho == 0:
+        return
+
+    if ficheiros.e_comprimido(path):
+        num_linha, partes = _partes_comprimido(path, inicio, linhas_por_bloco)
+        for pos, dados in partes:
+            bloco, num_linha = _ler_bloco(dados, pos, num_linha)
+            yield bloco
+        return
+
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = inicio_dados(mm) if inicio is None else inicio
+        num_linha = _contar_linhas(mm, pos)
+        for ini, fim in _intervalos(mm, pos, tamanho, linhas_por_bloco):
+            bloco, num_linha = _ler_bloco(mm[ini:fim], ini, num_linha)
+            yield bloco
+
+
+class BlocoProcessado(NamedTuple):
+    """
+    Resultado de funcao(bloco) para um bloco, com as posições das linhas
+    (iguais às do BlocoMPCORB) mas sem o texto das linhas.
+    """
+    num_linhas: List[int]
+    offsets: List[int]
+    offset_fim: int
+    resultado: Any
+
+
+def _entregar(pendente, num_linha: int):
+    """Espera pelo intervalo seguinte e devolve-o com os nºs de linha absolutos."""
+    fim, futuro = pendente
+    num_linhas, offsets, linhas_lidas, resultado = futuro.result()
+    yield BlocoProcessado([num_linha + n for n in num_linhas], offsets, fim, resultado)
+    return num_linha + linhas_lidas
+
+
+def _processar_intervalo(caminho, ini: int, fim: int, funcao: Callable):
+    """
+    Trabalho de cada processo: lê e processa os bytes [ini, fim) do ficheiro.
+    Os nºs de linha são relativos ao início do intervalo (quem recebe o
+    resultado soma-lhes as linhas dos intervalos anteriores).
+    """
+    with open(caminho, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        dados = mm[ini:fim]
+    return _processar_dados(dados, ini, funcao)
+
+
+def _processar_dados(dados: bytes, ini: int, funcao: Callable):
+    """Como _processar_intervalo, com os bytes já lidos (ficheiros comprimidos)."""
+    bloco, linhas_lidas = _ler_bloco(dados, ini, 0)
+    return bloco.num_linhas, bloco.offsets, linhas_lidas, funcao(bloco)
+
+
+def processar_blocos(caminho, funcao: Callable, inicio: Optional[int] = None,
+                     processos: int = 1,
+                     linhas_por_bloco: int = 50000) -> Iterator[BlocoProcessado]:
+    """
+    Aplica funcao(BlocoMPCORB) a cada bloco do ficheiro e devolve os
+    resultados pela ordem do ficheiro (inicio como em ler_blocos).
+
+    Com processos > 1 o ficheiro é dividido em intervalos de bytes alinhados
+    às linhas e cada intervalo é lido e processado num processo à parte
+    (ProcessPoolExecutor). Só o resultado de funcao volta ao processo
+    principal, por isso 'funcao' tem de ser uma função de módulo (picklable,
+    ex.: functools.partial de uma função de módulo). Ficam no máximo
+    2 x processos intervalos em curso, para limitar a memória.
+    """
+    if processos <= 1:
+        for bloco in ler_blocos(caminho, inicio=inicio, linhas_por_bloco=linhas_por_bloco):
+            yield BlocoProcessado(bloco.num_linhas, bloco.offsets, bloco.offset_fim,
+                                  funcao(bloco))
+        return
+
+    path = Path(caminho)
+    tamanho = path.stat().st_size
+    if tamanho == 0:
+        return
+
+    with ExitStack() as stack:
+        executor = stack.enter_context(ProcessPoolExecutor(max_workers=processos))
+        if ficheiros.e_comprimido(path):
+            # Sem acesso direto aos bytes: este processo descomprime e envia
+            # cada parte aos processos, que só fazem o parse
+            num_linha, partes = _partes_comprimido(path, inicio, linhas_por_bloco)
+            tarefas = (
+                (ini + len(dados), functools.partial(_processar_dados, dados, ini, funcao))
+                for ini, dados in partes
+            )
+        else:
+            f = stack.enter_context(path.open("rb"))
+            mm = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            pos = inicio_dados(mm) if inicio is None else inicio
+            num_linha = _contar_linhas(mm, pos)
+            tarefas = (
+                (fim, functools.partial(_processar_intervalo, str(path), ini, fim, funcao))
+                for ini, fim in _intervalos(mm, pos, tamanho, linhas_por_bloco)
+            )
+
+        pendentes = deque()
+        for fim, tarefa in tarefas:
+            pendentes.append((fim, executor.submit(tarefa)))
+            if len(pendentes) >= 2 * processos:
+                num_linha = yield from _entregar(pendentes.popleft(), num_linha)
+        while pendentes:
+            num_linha = yield from _entregar(pendentes.popleft(), num_linha)
@@ -0,0 +1,60 @@
+"""
+Constantes e geometria orbital comuns aos cálculos sobre Solucao_Orbital
+(MOID, propagação, aproximações).
+
+Os elementos orbitais do neo.csv e do MPCORB.DAT são heliocêntricos,
+referidos à eclíptica e equinócio J2000; os ângulos vêm em graus.
+Tudo funciona sobre arrays NumPy (um elemento por objeto).
+"""
+
+from services import colunar
+
+# Constante gravitacional de Gauss (UA^(3/2) / dia, massa solar = 1)
+K_GAUSS = 0.01720209895
+
+UA_KM = 149597870.7
+# 1 distância lunar (LD) em UA
+LD_UA = 0.00256955529
+
+# Limites de PHA (Potentially Hazardous Asteroid)
+MOID_PHA_UA = 0.05
+H_PHA = 22.0
+
+# Elementos médios da órbita da Terra (baricentro Terra-Lua) em J2000
+# (Standish, "Keplerian Elements for Approximate Positions of the Major Planets")
+TERRA = {
+    "a": 1.00000261,
+    "e": 0.01671123,
+    "incl": -0.00001531,
+    "node": 0.0,
+    "peri": 102.93768193,       # longitude do periélio (com node = 0)
+    "long_media": 100.46457166,  # longitude média na época J2000
+}
+JD_J2000 = 2451545.0
+
+
+def vetores_orbitais(incl, node, peri):
+    """
+    Vetores unitários P (direção do periélio) e Q (90° à frente, no plano da
+    órbita), em coordenadas eclípticas. Ângulos em graus; devolve dois arrays
+    n x 3. A posição num ponto da órbita é x * P + y * Q.
+    """
+    np = colunar._np()
+    i = np.radians(incl)
+    o = np.radians(node)
+    w = np.radians(peri)
+    ci, si = np.cos(i), np.sin(i)
+    co, so = np.cos(o), np.sin(o)
+    cw, sw = np.cos(w), np.sin(w)
+    P = np.stack([cw * co - sw * so * ci, cw * so + sw * co * ci, sw * si], axis=-1)
+    Q = np.stack([-sw * co - cw * so * ci, -sw * so + cw * co * ci, cw * si], axis=-1)
+    return P, Q
+
+
+def elementos_validos(a, e, *angulos):
+    """Máscara das órbitas elípticas com todos os elementos preenchidos (não NaN)."""
+    np = colunar._np()
+    valido = np.isfinite(a) & np.isfinite(e) & (a > 0) & (e >= 0) & (e < 1)
+    for angulo in angulos:
+        valido &= np.isfinite(angulo)
+    return valido
@@ -0,0 +1,231 @@
+"""
+Propagação kepleriana em lote das soluções orbitais atuais.
+
+ElementosOrbitais carrega os elementos de vw_Asteroide_OrbitalAtual para
+arrays contíguos (um elemento por objeto). O Propagador resolve a equação de
+Kepler para todos os objetos de uma vez (Newton vetorizado, só sobre os que
+ainda não convergiram) e devolve posições e velocidades heliocêntricas
+eclípticas J2000 (UA e UA/dia) para uma ou várias épocas (JD), com cache por
+época.
+
+É um modelo de dois corpos (sem perturbações planetárias): serve para
+rastreio e gráficos, não para efemérides de precisão.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Sequence, Tuple
+
+from services import colunar
+from services.orbitas import JD_J2000, K_GAUSS, TERRA, elementos_validos, vetores_orbitais
+
+_SQL_ELEMENTOS = """
+    SELECT
+        id_asteroide,
+        id_solucao_orbital,
+        epoca_jd,
+        semi_eixo_maior_ua,
+        excentricidade,
+        inclinacao_graus,
+        nodo_asc_graus,
+        arg_perihelio_graus,
+        anomalia_media_graus,
+        H_mag
+    FROM dbo.vw_Asteroide_OrbitalAtual
+    WHERE id_solucao_orbital IS NOT NULL
+      {filtro};
+"""
+
+_COLUNAS = ("epoca_jd", "a", "e", "incl", "node", "peri", "M", "H")
+
+
+def resolver_kepler(M, e, tolerancia: float = 1e-12, max_iteracoes: int = 30):
+    """
+    Resolve M = E - e sin E (radianos) para arrays M e e (e < 1).
+    Newton vetorizado: em cada iteração só os objetos que ainda não
+    convergiram (máscara) são recalculados.
+    """
+    np = colunar._np()
+    M = np.remainder(M, 2 * np.pi)
+    e = np.broadcast_to(e, M.shape)
+    # Arranque: M para órbitas pouco excêntricas, pi para as muito excêntricas
+    E = np.where(e < 0.8, M, np.pi)
+    ativos = np.flatnonzero(np.isfinite(E).ravel())
+    E_flat, M_flat, e_flat = E.ravel(), M.ravel(), np.ascontiguousarray(e).ravel()
+    for _ in range(max_iteracoes):
+        if ativos.size == 0:
+            break
+        Ea, ea = E_flat[ativos], e_flat[ativos]
+        delta = (Ea - ea * np.sin(Ea) - M_flat[ativos]) / (1 - ea * np.cos(Ea))
+        E_flat[ativos] = Ea - delta
+        ativos = ativos[np.abs(delta) > tolerancia]
+    return E_flat.reshape(M.shape)
+
+
+def _estado(a, b, e, n, M0, epoca_jd, P, Q, jd):
+    """
+    Posição e velocidade (UA, UA/dia) nas épocas 'jd' (com broadcasting entre
+    os elementos e as épocas). P e Q têm uma dimensão extra de tamanho 3.
+    """
+    np = colunar._np()
+    E = resolver_kepler(M0 + n * (jd - epoca_jd), e)
+    cE, sE = np.cos(E), np.sin(E)
+    x = a * (cE - e)
+    y = b * sE
+    E_ponto = n / (1 - e * cE)
+    vx = -a * sE * E_ponto
+    vy = b * cE * E_ponto
+    r = x[..., None] * P + y[..., None] * Q
+    v = vx[..., None] * P + vy[..., None] * Q
+    return r, v
+
+
+def estado_terra(jds):
+    """
+    Posição e velocidade heliocêntricas da Terra (baricentro Terra-Lua) nas
+    épocas 'jds': elementos médios J2000 com as taxas seculares (Standish),
+    erro da ordem de 1e-4 UA nas próximas décadas. Arrays épocas x 3.
+    """
+    np = colunar._np()
+    jds = np.asarray(jds, dtype=np.float64)
+    T = (jds - JD_J2000) / 36525.0  # séculos julianos desde J2000
+    a = TERRA["a"] + 0.00000562 * T
+    e = TERRA["e"] - 0.00004392 * T
+    incl = TERRA["incl"] - 0.01294668 * T
+    long_peri = TERRA["peri"] + 0.32327364 * T
+    long_media = TERRA["long_media"] + 35999.37244981 * T
+    P, Q = vetores_orbitais(incl, np.zeros_like(T), long_peri)
+    n = K_GAUSS / a ** 1.5
+    M = np.radians(long_media - long_peri)
+    return _estado(a, a * np.sqrt(1 - e * e), e, n, M, jds, P, Q, jds)
+
+
+class ElementosOrbitais:
+    """
+    Elementos orbitais de n objetos em arrays contíguos (float64): epoca_jd,
+    a (UA), e, incl, node, peri, M (graus) e H. Os ids ficam em id_asteroide
+    e id_solucao_orbital. Só entram órbitas elípticas completas.
+    """
+
+    def __init__(self, id_asteroide, id_solucao_orbital, colunas: Dict[str, object]):
+        np = colunar._np()
+        valido = elementos_validos(
+            colunas["a"], colunas["e"], colunas["incl"], colunas["node"],
+            colunas["peri"], colunas["M"], colunas["epoca_jd"],
+        )
+        self.id_asteroide = np.ascontiguousarray(np.asarray(id_asteroide, dtype=np.int64)[valido])
+        self.id_solucao_orbital = np.ascontiguousarray(
+            np.asarray(id_solucao_orbital, dtype=np.int64)[valido]
+        )
+        for nome in _COLUNAS:
+            setattr(self, nome, np.ascontiguousarray(np.asarray(colunas[nome], np.float64)[valido]))
+        self.ignorados = int((~valido).sum())
+
+        # Derivados usados em todas as épocas (calculados uma só vez)
+        self.P, self.Q = vetores_orbitais(self.incl, self.node, self.peri)
+        self.b = self.a * np.sqrt(1 - self.e * self.e)
+        self.n = K_GAUSS / self.a ** 1.5           # movimento médio (rad/dia)
+        self.M0 = np.radians(self.M)
+
+    def __len__(self) -> int:
+        return len(self.a)
+
+    @classmethod
+    def carregar(cls, conn, apenas_neo: bool = False,
+                 tamanho_bloco: int = 50000) -> "ElementosOrbitais":
+        """Lê as soluções orbitais atuais de vw_Asteroide_OrbitalAtual."""
+        np = colunar._np()
+        cur = conn.cursor()
+        cur.execute(_SQL_ELEMENTOS.format(filtro="AND flag_neo = 1" if apenas_neo else ""))
+        partes = []
+        while True:
+            rows = cur.fetchmany(tamanho_bloco)
+            if not rows:
+                break
+            partes.append(np.array([tuple(r) for r in rows], dtype=np.float64))  # None -> NaN
+        cur.close()
+
+        dados = np.concatenate(partes) if partes else np.empty((0, 2 + len(_COLUNAS)))
+        colunas = {nome: dados[:, 2 + k] for k, nome in enumerate(_COLUNAS)}
+        return cls(dados[:, 0], dados[:, 1], colunas)
+
+    def subconjunto(self, selecao) -> "ElementosOrbitais":
+        """Novos elementos só com os objetos selecionados (máscara ou índices)."""
+        return ElementosOrbitais(
+            self.id_asteroide[selecao], self.id_solucao_orbital[selecao],
+            {nome: getattr(self, nome)[selecao] for nome in _COLUNAS},
+        )
+
+
+class Propagador:
+    """
+    Posições/velocidades de todos os objetos de um ElementosOrbitais.
+    Os resultados por época ficam em cache (LRU com 'cache_epocas' épocas).
+    """
+
+    # Nº máximo de objetos x épocas calculados de uma vez (limita a memória)
+    MAX_ELEMENTOS = 4_000_000
+
+    def __init__(self, elementos: ElementosOrbitais, cache_epocas: int = 16):
+        self.elementos = elementos
+        self.cache_epocas = cache_epocas
+        self._cache: "OrderedDict[float, Tuple[object, object]]" = OrderedDict()
+
+    def _propagar(self, jds):
+        """Posições e velocidades (épocas x objetos x 3) para um array de JD."""
+        el = self.elementos
+        return _estado(el.a, el.b, el.e, el.n, el.M0, el.epoca_jd, el.P, el.Q, jds[:, None])
+
+    def estados(self, indices, jds):
+        """
+        (r, v) de pares (objeto, época): o objeto indices[k] na época jds[k].
+        Devolve arrays k x 3 (usado para refinar aproximações, sem cache).
+        """
+        np = colunar._np()
+        el = self.elementos
+        i = np.asarray(indices)
+        return _estado(el.a[i], el.b[i], el.e[i], el.n[i], el.M0[i], el.epoca_jd[i],
+                       el.P[i], el.Q[i], np.asarray(jds, dtype=np.float64))
+
+    def _guardar(self, jd: float, r, v):
+        self._cache[jd] = (r, v)
+        self._cache.move_to_end(jd)
+        while len(self._cache) > self.cache_epocas:
+            self._cache.popitem(last=False)
+
+    def posicoes(self, jd: float):
+        """(r, v) de todos os objetos na época 'jd': arrays n x 3 (UA, UA/dia)."""
+        jd = float(jd)
+        if jd in self._cache:
+            self._cache.move_to_end(jd)
+            return self._cache[jd]
+        np = colunar._np()
+        r, v = self._propagar(np.array([jd]))
+        self._guardar(jd, r[0], v[0])
+        return r[0], v[0]
+
+    def posicoes_varias(self, jds: Sequence[float]):
+        """
+        (r, v) para várias épocas: arrays épocas x n x 3. As épocas que não
+        estão em cache são calculadas juntas, em grupos de até MAX_ELEMENTOS
+        objetos x épocas.
+        """
+        np = colunar._np()
+        jds = np.asarray(jds, dtype=np.float64).ravel()
+        n = len(self.elementos)
+        r = np.empty((len(jds), n, 3))
+        v = np.empty((len(jds), n, 3))
+
+        em_falta = []
+        for k, jd in enumerate(jds.tolist()):
+            if jd in self._cache:
+                r[k], v[k] = self._cache[jd]
+            else:
+                em_falta.append(k)
+
+        grupo = max(1, self.MAX_ELEMENTOS // max(n, 1))
+        for ini in range(0, len(em_falta), grupo):
+            ks = em_falta[ini:ini + grupo]
+            r[ks], v[ks] = self._propagar(jds[ks])
+            for k in ks:
+                self._guardar(float(jds[k]), r[k].copy(), v[k].copy())
+        return r, v
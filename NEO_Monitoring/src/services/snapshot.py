@@ -0,0 +1,222 @@
+"""
+Snapshots colunares binários (MPCORB.DAT já convertido).
+
+Um snapshot é uma pasta com:
+  - meta.json: formato, nº de linhas, colunas e o SHA-256 do ficheiro de origem;
+  - <coluna>.npy: uma coluna numérica (float64, NaN = vazio);
+  - <coluna>.idx.npy: uma coluna de texto, como índices (int32) para a
+    tabela de designações (-1 = vazio);
+  - designacoes.npy + designacoes_pos.npy: a tabela de designações, com cada
+    texto distinto guardado uma só vez (bytes UTF-8 seguidos + posições).
+
+Tudo é aberto com np.load(mmap_mode="r"): abrir um snapshot não lê os dados,
+só mapeia os ficheiros, e as colunas são lidas do disco à medida que são
+usadas. Os textos são descodificados só quando pedidos (e uma vez por
+designação distinta).
+"""
+
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from services import colunar
+
+FORMATO = 1
+FICHEIRO_META = "meta.json"
+
+
+def e_snapshot(caminho) -> bool:
+    """True se 'caminho' for a pasta de um snapshot."""
+    return (Path(caminho) / FICHEIRO_META).is_file()
+
+
+class _TabelaDesignacoes:
+    """Textos distintos, cada um com um código (ordem da primeira ocorrência)."""
+
+    def __init__(self):
+        self.codigos = {}
+
+    def codificar(self, valores: Sequence[Optional[str]]):
+        np = colunar._np()
+        codigos = self.codigos
+        resultado = np.empty(len(valores), dtype=np.int32)
+        for k, v in enumerate(valores):
+            if not v:
+                resultado[k] = -1
+                continue
+            codigo = codigos.get(v)
+            if codigo is None:
+                codigo = codigos[v] = len(codigos)
+            resultado[k] = codigo
+        return resultado
+
+    def gravar(self, pasta: Path):
+        np = colunar._np()
+        textos = [t.encode("utf-8") for t in self.codigos]  # dict mantém a ordem dos códigos
+        posicoes = np.zeros(len(textos) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in textos], out=posicoes[1:])
+        np.save(pasta / "designacoes.npy", np.frombuffer(b"".join(textos), dtype=np.uint8))
+        np.save(pasta / "designacoes_pos.npy", posicoes)
+
+
+class EscritorSnapshot:
+    """
+    Grava um snapshot por blocos: acrescentar(numericas, texto) por cada bloco
+    convertido e fechar() no fim (as colunas só são escritas aí).
+    """
+
+    def __init__(self, pasta, origem: str, hash_origem: str):
+        self.pasta = Path(pasta)
+        self.origem = origem
+        self.hash_origem = hash_origem
+        self._tabela = _TabelaDesignacoes()
+        self._numericas: Dict[str, list] = {}
+        self._texto: Dict[str, list] = {}
+        self.linhas = 0
+
+    def acrescentar(self, numericas: Dict[str, object], texto: Dict[str, Sequence[str]]):
+        """numericas: coluna -> array float64; texto: coluna -> lista de str."""
+        np = colunar._np()
+        for nome, valores in numericas.items():
+            self._numericas.setdefault(nome, []).append(np.asarray(valores, dtype=np.float64))
+        for nome, valores in texto.items():
+            self._texto.setdefault(nome, []).append(self._tabela.codificar(valores))
+        colunas = list(numericas.values()) or list(texto.values())
+        if colunas:
+            self.linhas += len(colunas[0])
+
+    def fechar(self):
+        """
+        Grava o snapshot numa pasta temporária ao lado da final e só no fim a
+        põe no lugar da anterior (se houver). Assim, ao regenerar, nunca fica
+        um meta.json antigo a descrever colunas novas (ou metade de cada):
+        se a gravação falhar, o snapshot anterior fica intacto.
+        """
+        np = colunar._np()
+        temp = self.pasta.with_name(self.pasta.name + ".tmp")
+        antiga = self.pasta.with_name(self.pasta.name + ".old")
+        # Restos de uma gravação interrompida
+        shutil.rmtree(temp, ignore_errors=True)
+        temp.mkdir(parents=True)
+        for nome, partes in self._numericas.items():
+            np.save(temp / f"{nome}.npy", np.concatenate(partes))
+        for nome, partes in self._texto.items():
+            np.save(temp / f"{nome}.idx.npy", np.concatenate(partes))
+        self._tabela.gravar(temp)
+
+        meta = {
+            "formato": FORMATO,
+            "origem": self.origem,
+            "hash_origem": self.hash_origem,
+            "linhas": self.linhas,
+            "numericas": list(self._numericas),
+            "texto": list(self._texto),
+            "designacoes": len(self._tabela.codigos),
+        }
+        # meta.json por último: uma pasta sem ele não é um snapshot completo
+        with (temp / FICHEIRO_META).open("w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        # os.replace não substitui uma pasta com conteúdo: a anterior sai
+        # primeiro para .old e só é apagada depois de a nova estar no lugar
+        shutil.rmtree(antiga, ignore_errors=True)
+        if self.pasta.exists():
+            os.replace(self.pasta, antiga)
+        os.replace(temp, self.pasta)
+        # No Windows pode falhar se ainda estiver aberta (mmap): fica para a próxima
+        shutil.rmtree(antiga, ignore_errors=True)
+
+
+class Snapshot:
+    """Snapshot aberto em modo só de leitura (colunas mapeadas em memória)."""
+
+    def __init__(self, pasta):
+        np = colunar._np()
+        self.pasta = Path(pasta)
+        with (self.pasta / FICHEIRO_META).open(encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("formato") != FORMATO:
+            raise ValueError(
+                f"Snapshot '{self.pasta}' tem o formato {self.meta.get('formato')} "
+                f"(esperado {FORMATO}). Volte a gerá-lo com o conversor."
+            )
+        self.linhas = self.meta["linhas"]
+        self._designacoes = np.load(self.pasta / "designacoes.npy", mmap_mode="r")
+        self._posicoes = np.load(self.pasta / "designacoes_pos.npy", mmap_mode="r")
+        self._cache_texto: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return self.linhas
+
+    def numeros(self, coluna: str):
+        """Coluna numérica como array float64 mapeado do disco (sem cópia)."""
+        return colunar._np().load(self.pasta / f"{coluna}.npy", mmap_mode="r")
+
+    def codigos(self, coluna: str):
+        """Coluna de texto como códigos da tabela de designações (-1 = vazio)."""
+        return colunar._np().load(self.pasta / f"{coluna}.idx.npy", mmap_mode="r")
+
+    def designacao(self, codigo: int) -> str:
+        """Texto de um código da tabela (interned: uma só string por designação)."""
+        if codigo < 0:
+            return ""
+        texto = self._cache_texto.get(codigo)
+        if texto is None:
+            ini, fim = int(self._posicoes[codigo]), int(self._posicoes[codigo + 1])
+            texto = sys.intern(bytes(self._designacoes[ini:fim]).decode("utf-8"))
+            self._cache_texto[codigo] = texto
+        return texto
+
+    def texto(self, coluna: str, inicio: int = 0, fim: Optional[int] = None) -> List[str]:
+        """Valores de texto das linhas [inicio, fim) de uma coluna."""
+        designacao = self.designacao
+        return [designacao(c) for c in self.codigos(coluna)[inicio:fim].tolist()]
+
+
+class BlocoSnapshot:
+    """
+    Linhas [inicio, fim) de um snapshot, com a mesma interface de leitura do
+    BlocoMPCORB (texto, numeros, valores, conteudo, num_linhas, offsets), para
+    que a mesma conversão em registos sirva para os dois. Aqui os "offsets"
+    são índices de linha do snapshot (usados nos checkpoints).
+    """
+
+    def __init__(self, snap: Snapshot, inicio: int, fim: int):
+        self.snap = snap
+        self.inicio = inicio
+        self.fim = fim
+        self.num_linhas = list(range(inicio + 1, fim + 1))
+        self.offsets = self.num_linhas
+        self.offset_fim = fim
+
+    def __len__(self) -> int:
+        return self.fim - self.inicio
+
+    def texto(self, campo: str) -> List[str]:
+        return self.snap.texto(campo, self.inicio, self.fim)
+
+    def numeros(self, campo: str):
+        return self.snap.numeros(campo)[self.inicio:self.fim]
+
+    def valores(self, campo: str) -> List[Optional[float]]:
+        return colunar.para_lista(self.numeros(campo))
+
+    def conteudo(self, k: int) -> str:
+        """Texto que identifica a linha k (não há linha original no snapshot)."""
+        colunas = [c for c in ("desig", "nome") if c in self.snap.meta["texto"]]
+        codigos = [int(self.snap.codigos(c)[self.inicio + k]) for c in colunas]
+        return " ".join(self.snap.designacao(c) for c in codigos)
+
+
+def ler_blocos(snap: Snapshot, inicio: int = 0, linhas_por_bloco: int = 50000):
+    """Percorre o snapshot por blocos (inicio = índice de linha, ex.: checkpoint)."""
+    for ini in range(inicio, len(snap), linhas_por_bloco):
+        yield BlocoSnapshot(snap, ini, min(ini + linhas_por_bloco, len(snap)))
+
+
+def abrir(pasta) -> Snapshot:
+    """Abre um snapshot gravado pelo conversor (ver EscritorSnapshot)."""
+    return Snapshot(pasta)
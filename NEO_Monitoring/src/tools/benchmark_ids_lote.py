@@ -0,0 +1,117 @@
+"""
+Benchmark da gravação de um lote de asteroides + soluções orbitais.
+
+Compara a latência por lote de:
+  - ANTES : executemany do INSERT + SELECT pdes, id_asteroide ... WHERE pdes IN (...)
+            + executemany das soluções orbitais (3 idas à BD por lote);
+  - DEPOIS: _gravar_lote_asteroides (MERGE ... OUTPUT INSERTED.id_asteroide,
+            uma única ida à BD por lote).
+
+Todos os lotes são gravados dentro de uma transação que é desfeita no fim,
+por isso o benchmark não deixa dados na base de dados.
+
+Uso:  python tools/benchmark_ids_lote.py [n_lotes] [tamanho_lote]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import get_connection
+from services.insercao import _gravar_lote_asteroides
+
+
+SQL_ASTEROIDE = """
+    INSERT INTO dbo.Asteroide (
+        id_csv_original, spkid, pdes, nome_completo, flag_neo, flag_pha,
+        H_mag, diametro_km, albedo, moid_ua, moid_ld, id_classe_orbital
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SQL_ORBITAL = """
+    INSERT INTO dbo.Solucao_Orbital (
+        id_asteroide, epoca_jd, excentricidade, semi_eixo_maior_ua,
+        inclinacao_graus, nodo_asc_graus, arg_perihelio_graus,
+        anomalia_media_graus, moid_ua, moid_ld, rms,
+        solucao_atual, origem, data_epoca
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, 'benchmark', ?)
+"""
+
+
+def gerar_lote(prefixo: str, n: int) -> list:
+    """Gera registos sintéticos pela ordem de _CAMPOS_REGISTO."""
+    return [
+        (
+            None, None, f"{prefixo}{k:06d}", f"Benchmark {prefixo}{k:06d}",
+            1, 0, 20.5, 0.3, 0.15, 0.04, 15.6, None,
+            2461000.5, 0.21, 1.43, 7.2, 110.0, 250.0, 33.0, 0.45, "2025-11-21", None,
+        )
+        for k in range(n)
+    ]
+
+
+def gravar_antes(cur, registos: list):
+    cur.executemany(SQL_ASTEROIDE, [r[:12] for r in registos])
+
+    pdes = [r[2] for r in registos]
+    placeholders = ','.join(['?'] * len(pdes))
+    cur.execute(
+        f"SELECT pdes, id_asteroide FROM dbo.Asteroide WHERE pdes IN ({placeholders})",
+        pdes
+    )
+    pdes_to_id = {r[0]: r[1] for r in cur.fetchall()}
+
+    solucoes = [
+        (pdes_to_id[r[2]], r[12], r[13], r[14], r[15], r[16], r[17], r[18],
+         r[9], r[10], r[19], r[20])
+        for r in registos if r[2] in pdes_to_id
+    ]
+    cur.executemany(SQL_ORBITAL, solucoes)
+
+
+def gravar_depois(cur, registos: list):
+    _gravar_lote_asteroides(cur, registos, 'benchmark')
+
+
+def medir(conn, nome: str, gravar, n_lotes: int, tamanho: int) -> list:
+    cur = conn.cursor()
+    cur.fast_executemany = True
+    tempos = []
+    try:
+        for i in range(n_lotes):
+            registos = gerar_lote(f"BX{nome[0]}{i:03d}-", tamanho)
+            t0 = time.perf_counter()
+            gravar(cur, registos)
+            tempos.append(time.perf_counter() - t0)
+    finally:
+        conn.rollback()
+        cur.close()
+    return tempos
+
+
+def resumo(nome: str, tempos: list, tamanho: int):
+    ordenados = sorted(tempos)
+    p95 = ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))]
+    media = statistics.mean(tempos)
+    print(
+        f"{nome:<7} média {media * 1000:8.1f} ms | mediana "
+        f"{statistics.median(tempos) * 1000:8.1f} ms | p95 {p95 * 1000:8.1f} ms | "
+        f"{tamanho / media:9.0f} linhas/s"
+    )
+
+
+def main():
+    n_lotes = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    # O IN (...) do método antigo está limitado a 2100 parâmetros
+    tamanho = min(int(sys.argv[2]) if len(sys.argv) > 2 else 2000, 2000)
+
+    conn = get_connection()
+    print(f"Benchmark: {n_lotes} lotes de {tamanho} registos (transação desfeita no fim)\n")
+    resumo("ANTES", medir(conn, "ANTES", gravar_antes, n_lotes, tamanho), tamanho)
+    resumo("DEPOIS", medir(conn, "DEPOIS", gravar_depois, n_lotes, tamanho), tamanho)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark da propagação kepleriana em lote (services/propagacao.py).
+
+Mede o débito em objetos x épocas por segundo para uma população sintética
+de órbitas (não precisa da base de dados):
+  - uma época de cada vez (Propagador.posicoes, sem cache);
+  - várias épocas de uma vez (Propagador.posicoes_varias).
+
+Uso:  python tools/benchmark_propagacao.py [n_objetos] [n_epocas]
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from services.propagacao import ElementosOrbitais, Propagador
+
+
+def elementos_sinteticos(n: int, seed: int = 1) -> ElementosOrbitais:
+    rng = np.random.default_rng(seed)
+    colunas = {
+        "epoca_jd": np.full(n, 2461000.5),
+        "a": rng.uniform(0.7, 4.0, n),
+        "e": rng.beta(2, 4, n),
+        "incl": rng.uniform(0, 40, n),
+        "node": rng.uniform(0, 360, n),
+        "peri": rng.uniform(0, 360, n),
+        "M": rng.uniform(0, 360, n),
+        "H": rng.uniform(12, 28, n),
+    }
+    return ElementosOrbitais(np.arange(n), np.arange(n), colunas)
+
+
+def main():
+    n_objetos = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    n_epocas = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    elementos = elementos_sinteticos(n_objetos)
+    epocas = 2461000.5 + np.arange(n_epocas) * 30.0
+
+    prop = Propagador(elementos, cache_epocas=0)
+    t0 = time.perf_counter()
+    for jd in epocas:
+        prop.posicoes(jd)
+    t_uma = time.perf_counter() - t0
+
+    prop = Propagador(elementos, cache_epocas=0)
+    t0 = time.perf_counter()
+    prop.posicoes_varias(epocas)
+    t_varias = time.perf_counter() - t0
+
+    total = n_objetos * n_epocas
+    print(f"{n_objetos} objetos x {n_epocas} épocas")
+    print(f"  uma época de cada vez : {t_uma:.2f}s  ({total / t_uma / 1e6:.2f} M objetos x épocas/s)")
+    print(f"  várias épocas juntas  : {t_varias:.2f}s  ({total / t_varias / 1e6:.2f} M objetos x épocas/s)")
+
+
+if __name__ == "__main__":
+    main()
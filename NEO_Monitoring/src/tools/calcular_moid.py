@@ -0,0 +1,23 @@
+"""
+Calcula a MOID com a Terra das soluções orbitais atuais e atualiza
+moid_ua, moid_ld e flag_pha (ver services/moid.py).
+
+Por defeito só trata as órbitas ainda sem MOID (ex.: importadas do MPCORB
+ou alteradas desde o último cálculo); com --todos recalcula todas.
+
+Uso:  python tools/calcular_moid.py [--todos]
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import get_connection
+from services.moid import atualizar_moid
+
+
+if __name__ == "__main__":
+    conn = get_connection()
+    try:
+        atualizar_moid(conn, todos="--todos" in sys.argv[1:])
+    finally:
+        conn.close()
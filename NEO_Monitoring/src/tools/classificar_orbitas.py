@@ -0,0 +1,24 @@
+"""
+Classifica os asteroides pela solução orbital atual (ATE, APO, AMO, IEO,
+MBA, ...) e atualiza id_classe_orbital (ver services/classificacao.py).
+
+Por defeito só trata os que estão na classe 'UNK' ou sem classe (ex.:
+importados do MPCORB antes da classificação); com --todos reclassifica
+todos, incluindo os que trazem a classe do neo.csv.
+
+Uso:  python tools/classificar_orbitas.py [--todos]
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import get_connection
+from services.classificacao import atualizar_classes
+
+
+if __name__ == "__main__":
+    conn = get_connection()
+    try:
+        atualizar_classes(conn, todos="--todos" in sys.argv[1:])
+    finally:
+        conn.close()
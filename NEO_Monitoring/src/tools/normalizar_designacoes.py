@@ -0,0 +1,24 @@
+"""
+Preenche a designação canónica (designacao_canonica) da Asteroide e das
+tabelas ESA onde ainda falta e liga as linhas ESA sem id_asteroide ao
+asteroide correspondente (ver services/designacoes.py).
+
+Útil depois de atualizar a BD para a versão com designacao_canonica, ou se
+as listas da ESA foram importadas antes dos asteroides.
+
+Uso:  python tools/normalizar_designacoes.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import get_connection
+from services.designacoes import atualizar_designacoes_canonicas
+
+
+if __name__ == "__main__":
+    conn = get_connection()
+    try:
+        atualizar_designacoes_canonicas(conn)
+    finally:
+        conn.close()
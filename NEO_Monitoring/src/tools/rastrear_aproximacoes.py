@@ -0,0 +1,27 @@
+"""
+Rastreio local de aproximações à Terra: propaga as órbitas atuais de todos
+os NEO numa janela de N anos e grava em Aproximacao_Proxima (origem
+'NEO_SCREENING') as aproximações abaixo do limiar (ver services/aproximacoes.py).
+
+Pensado para correr todas as noites; uma passagem já gravada numa corrida
+anterior não é repetida.
+
+Uso:  python tools/rastrear_aproximacoes.py [anos] [limiar_ua]
+      (por defeito 5 anos e 0.05 UA)
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import get_connection
+from services.aproximacoes import rastrear_aproximacoes
+
+
+if __name__ == "__main__":
+    anos = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    limiar = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    conn = get_connection()
+    try:
+        rastrear_aproximacoes(conn, anos=anos, limiar_ua=limiar)
+    finally:
+        conn.close()
@@ -1,67 +1,160 @@
 import pyodbc
 import os
-import json
 import sys
+import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db import pedir_e_ligar_bd, ligar_base_dados, construir_connection_string, DEFAULT_DRIVER
-
-CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "config.json")
-
-def get_connection():
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, "r") as f:
-                cfg = json.load(f).get("db", {})
-                if cfg:
-                    conn_str = construir_connection_string(
-                        servidor=cfg.get("server"),
-                        base_dados=cfg.get("database"),
-                        utilizador=cfg.get("user"),
-                        password=cfg.get("password"),
-                        trusted_connection=(cfg.get("auth_mode") == "windows"),
-                        driver=DEFAULT_DRIVER
-                    )
-                    return ligar_base_dados(conn_str)
-        except Exception:
-            pass
-    return pedir_e_ligar_bd()
-
-def sync_data(conn):
-    print("Syncing ESA Approaches to Core...")
-    sql = """
-    INSERT INTO dbo.Aproximacao_Proxima (
-        id_asteroide,
-        datahora_aproximacao,
-        distancia_ua,
-        distancia_ld,
-        velocidade_rel_kms,
-        flag_critica,
-        origem
-    )
-    SELECT
-        a.id_asteroide,
-        esa.datahora_aproximacao_utc,
-        esa.miss_dist_au,
-        esa.miss_dist_ld,
-        esa.vel_rel_kms,
-        CASE WHEN esa.miss_dist_ld <= 10 THEN 1 ELSE 0 END,
-        'ESA_IMPORT'
-    FROM dbo.ESA_APROXIMACOES_PROXIMAS esa
-    JOIN dbo.Asteroide a ON a.pdes = esa.designacao_objeto OR a.nome_completo LIKE '%' + esa.designacao_objeto + '%'
-    WHERE NOT EXISTS (
-        SELECT 1 FROM dbo.Aproximacao_Proxima ap
-        WHERE ap.id_asteroide = a.id_asteroide
-          AND ap.datahora_aproximacao = esa.datahora_aproximacao_utc
-    );
+from db import get_connection
+from services.designacoes import atualizar_designacoes_canonicas
+
+# Nome do processo em Sync_Estado / Sync_Pendente
+PROCESSO_SYNC = "ESA_APROXIMACOES"
+
+_COLUNAS_APROXIMACAO = """
+    id_asteroide,
+    datahora_aproximacao,
+    distancia_ua,
+    distancia_ld,
+    velocidade_rel_kms,
+    flag_critica,
+    origem
+"""
+
+_SELECT_ESA = """
+    esa.id_asteroide,
+    esa.datahora_aproximacao_utc,
+    esa.miss_dist_au,
+    esa.miss_dist_ld,
+    esa.vel_rel_kms,
+    CASE WHEN esa.miss_dist_ld <= 10 THEN 1 ELSE 0 END,
+    'ESA_IMPORT'
+"""
+
+# Um bloco de ids ESA acima da marca de água. Os duplicados (mesmo asteroide e
+# data/hora) são descartados pelo índice único UX_AproxProx_Asteroide_Data
+# (IGNORE_DUP_KEY), sem NOT EXISTS. As linhas ainda sem asteroide ficam em
+# Sync_Pendente para a próxima sincronização.
+_SQL_SYNC_BLOCO = f"""
+    SET NOCOUNT ON;
+    DECLARE @processo VARCHAR(50) = ?;
+    DECLARE @de INT = ?;
+    DECLARE @n INT = ?;
+    DECLARE @ate INT;
+    DECLARE @inseridas INT = 0;
+
+    SELECT @ate = MAX(t.id_aproximacao_esa)
+    FROM (
+        SELECT TOP (@n) id_aproximacao_esa
+        FROM dbo.ESA_APROXIMACOES_PROXIMAS
+        WHERE id_aproximacao_esa > @de
+        ORDER BY id_aproximacao_esa
+    ) AS t;
+
+    IF @ate IS NOT NULL
+    BEGIN
+        INSERT INTO dbo.Aproximacao_Proxima ({_COLUNAS_APROXIMACAO})
+        SELECT {_SELECT_ESA}
+        FROM dbo.ESA_APROXIMACOES_PROXIMAS AS esa
+        WHERE esa.id_aproximacao_esa > @de
+          AND esa.id_aproximacao_esa <= @ate
+          AND esa.id_asteroide IS NOT NULL
+          AND esa.datahora_aproximacao_utc IS NOT NULL;
+        SET @inseridas = @@ROWCOUNT;
+
+        INSERT INTO dbo.Sync_Pendente (processo, id_origem)
+        SELECT @processo, esa.id_aproximacao_esa
+        FROM dbo.ESA_APROXIMACOES_PROXIMAS AS esa
+        WHERE esa.id_aproximacao_esa > @de
+          AND esa.id_aproximacao_esa <= @ate
+          AND esa.id_asteroide IS NULL;
+
+        UPDATE dbo.Sync_Estado
+        SET ultimo_id = @ate, datahora = SYSDATETIME()
+        WHERE processo = @processo;
+        IF @@ROWCOUNT = 0
+            INSERT INTO dbo.Sync_Estado (processo, ultimo_id) VALUES (@processo, @ate);
+    END
+
+    SELECT @ate, @inseridas;
+"""
+
+# Linhas pendentes que entretanto ganharam asteroide (ou já não existem, por
+# exemplo depois de uma importação em modo snapshot): sincronizar e retirar
+_SQL_SYNC_PENDENTES = f"""
+    SET NOCOUNT ON;
+    DECLARE @processo VARCHAR(50) = ?;
+    DECLARE @inseridas INT;
+
+    INSERT INTO dbo.Aproximacao_Proxima ({_COLUNAS_APROXIMACAO})
+    SELECT {_SELECT_ESA}
+    FROM dbo.Sync_Pendente AS p
+    JOIN dbo.ESA_APROXIMACOES_PROXIMAS AS esa
+        ON esa.id_aproximacao_esa = p.id_origem
+    WHERE p.processo = @processo
+      AND esa.id_asteroide IS NOT NULL
+      AND esa.datahora_aproximacao_utc IS NOT NULL;
+    SET @inseridas = @@ROWCOUNT;
+
+    DELETE p
+    FROM dbo.Sync_Pendente AS p
+    LEFT JOIN dbo.ESA_APROXIMACOES_PROXIMAS AS esa
+        ON esa.id_aproximacao_esa = p.id_origem
+    WHERE p.processo = @processo
+      AND (esa.id_aproximacao_esa IS NULL OR esa.id_asteroide IS NOT NULL);
+
+    SELECT @inseridas;
+"""
+
+
+def sync_data(conn, tamanho_bloco: int = 5000, resolver: bool = True) -> int:
     """
+    Sincronização incremental ESA_APROXIMACOES_PROXIMAS -> Aproximacao_Proxima.
+
+    Só processa as linhas ESA com id acima da marca de água guardada em
+    Sync_Estado (mais as pendentes de sincronizações anteriores), por blocos
+    de 'tamanho_bloco' ids com commit por bloco: os locks em
+    Aproximacao_Proxima e Alerta (trigger dos alertas) duram um bloco, não a
+    sincronização toda. A ligação ao asteroide é o id_asteroide já resolvido
+    pela designação canónica; com resolver=True (defeito) as linhas ESA ainda
+    sem id_asteroide são ligadas primeiro (resolver=False quando quem chama
+    já o fez, ex.: services/importacao_lote.py). Devolve o número de
+    aproximações inseridas.
+    """
+    if resolver:
+        atualizar_designacoes_canonicas(conn)
+    print("Syncing ESA Approaches to Core...")
+    t0 = time.time()
+    cur = conn.cursor()
     try:
-        cur = conn.cursor()
-        cur.execute(sql)
-        row_count = cur.rowcount
+        cur.execute("SELECT ultimo_id FROM dbo.Sync_Estado WHERE processo = ?;", PROCESSO_SYNC)
+        row = cur.fetchone()
+        ultimo_id = row[0] if row else 0
+
+        cur.execute(_SQL_SYNC_PENDENTES, PROCESSO_SYNC)
+        inseridas = cur.fetchone()[0]
         conn.commit()
-        print(f"Synced {row_count} rows.")
+
+        blocos = 0
+        while True:
+            cur.execute(_SQL_SYNC_BLOCO, PROCESSO_SYNC, ultimo_id, tamanho_bloco)
+            ate, n = cur.fetchone()
+            conn.commit()
+            if ate is None:
+                break
+            ultimo_id = ate
+            inseridas += n
+            blocos += 1
     except Exception as e:
+        conn.rollback()
         print(f"Error syncing: {e}")
+        raise
+    finally:
+        cur.close()
+
+    duracao = time.time() - t0
+    print(f"Synced {inseridas} rows in {blocos} chunks, {duracao:.1f}s "
+          f"({inseridas / duracao if duracao else 0:.0f} rows/s); "
+          f"high-water mark id_aproximacao_esa = {ultimo_id}.")
+    return inseridas
 
 if __name__ == "__main__":
     try:
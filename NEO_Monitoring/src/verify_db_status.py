@@ -1,30 +1,5 @@
 import pyodbc
-from db import pedir_e_ligar_bd, ligar_base_dados, construir_connection_string, DEFAULT_DRIVER
-import os
-import json
-
-CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.json")
-
-def get_connection():
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, "r") as f:
-                cfg = json.load(f).get("db", {})
-                if cfg:
-                    print(f"Connecting using config: {cfg}")
-                    conn_str = construir_connection_string(
-                        servidor=cfg.get("server"),
-                        base_dados=cfg.get("database"),
-                        utilizador=cfg.get("user"),
-                        password=cfg.get("password"),
-                        trusted_connection=(cfg.get("auth_mode") == "windows"),
-                        driver=DEFAULT_DRIVER
-                    )
-                    return ligar_base_dados(conn_str)
-        except Exception as e:
-            print(f"Config failed: {e}")
-    
-    return pedir_e_ligar_bd()
+from db import get_connection
 
 def check_table_counts(conn):
     print("--- COUNTS ---")